@@ -4,3 +4,28 @@ from django.apps import AppConfig
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        from django.db.models.signals import m2m_changed, post_delete, post_save
+
+        from . import flow_control, guest_store, solver
+        from .models import GameProgress, Scenario, ScenarioAttempt, Score
+        from .player_stats import attempt_saved as player_stats_attempt_saved
+        from .scenario_manager import ScenarioManager
+        from .score_stats import score_deleted, score_saved
+        from .scenario_summary import attempt_saved, completed_scenarios_changed
+
+        post_save.connect(ScenarioManager.invalidate, sender=Scenario, dispatch_uid='scenario_registry_save')
+        post_delete.connect(ScenarioManager.invalidate, sender=Scenario, dispatch_uid='scenario_registry_delete')
+        post_save.connect(attempt_saved, sender=ScenarioAttempt, dispatch_uid='scenario_summary_attempt')
+        post_save.connect(player_stats_attempt_saved, sender=ScenarioAttempt, dispatch_uid='player_stats_attempt')
+        m2m_changed.connect(completed_scenarios_changed, sender=GameProgress.completed_scenarios.through,
+                            dispatch_uid='scenario_summary_completed')
+        post_save.connect(score_saved, sender=Score, dispatch_uid='score_stats_save')
+        post_delete.connect(score_deleted, sender=Score, dispatch_uid='score_stats_delete')
+
+        flow_control.check_config()
+        guest_store.check_config()
+
+        # Load the hint policies now rather than on the first hint request
+        solver.policy_table()
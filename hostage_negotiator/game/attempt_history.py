@@ -0,0 +1,66 @@
+"""Keyset-paginated game history.
+
+The history page loads one page of attempts at a time, newest first.
+Pages are ordered on (``start_time``, ``id``), and the cursor for the next
+page is the last row shown. Each page is one index range scan on the
+``(user, -start_time, -id)`` index, however many attempts the user has,
+with no ``OFFSET`` and no ``COUNT``.
+
+Only the summary columns the page renders are selected. The transcript
+(``messages`` and the ``GameTurn`` rows) is fetched per attempt from the
+transcript endpoint when the player opens it.
+
+Configured through ``settings.GAME_HISTORY``::
+
+    GAME_HISTORY = {
+        'PAGE_SIZE': 20,
+    }
+"""
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import ScenarioAttempt
+
+DEFAULTS = {
+    'PAGE_SIZE': 20,
+}
+
+# Everything history.html shows about an attempt
+SUMMARY_FIELDS = ('id', 'scenario_id', 'scenario_name', 'start_time', 'end_time', 'success', 'final_score')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GAME_HISTORY', {})}
+
+
+def encode_cursor(attempt):
+    return base64.urlsafe_b64encode(f"{attempt.start_time.isoformat()}|{attempt.id}".encode()).decode()
+
+
+def decode_cursor(token):
+    """(start_time, id) from a cursor; raises ValueError when it is malformed"""
+    start_time, _, attempt_id = base64.urlsafe_b64decode(token.encode()).decode().partition('|')
+    return datetime.fromisoformat(start_time), int(attempt_id)
+
+
+def page(user, cursor=None, size=None):
+    """(attempts, next cursor or None): up to ``size`` attempts older than ``cursor``, newest first"""
+    size = size or get_config()['PAGE_SIZE']
+    attempts = ScenarioAttempt.objects.filter(user=user).only(*SUMMARY_FIELDS).order_by('-start_time', '-id')
+    if cursor:
+        start_time, attempt_id = decode_cursor(cursor)
+        attempts = attempts.filter(Q(start_time__lt=start_time) | Q(start_time=start_time, id__lt=attempt_id))
+    # One extra row tells whether there is another page
+    rows = list(attempts[:size + 1])
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1])
+    return rows, None
+
+
+def transcript(user, attempt_id):
+    """The attempt's full transcript, or None when it isn't the user's"""
+    attempt = ScenarioAttempt.objects.filter(id=attempt_id, user=user).only('id', 'messages').first()
+    return None if attempt is None else attempt.get_transcript()
@@ -0,0 +1,184 @@
+"""Vectorized tension/trust state machine for balance sweeps.
+
+``BatchGameState`` holds thousands of games as NumPy arrays and ``step``
+advances all of them by one turn. A turn is the same sequence as
+``process_turn`` plus ``GameState.process_ai_response``:
+
+1. accept the surrender, if this turn's move is ``accept_surrender``;
+2. count emotional appeals, turning a third ``empathy`` into
+   ``overused_emotion`` as ``detect_response_type`` does;
+3. apply the ``rules.TRANSITIONS`` lookup;
+4. release hostages and offer surrender, both as masks;
+5. bump the turn and apply the end-of-turn checks.
+
+The caller picks each game's response type, usually from its own RNG
+stream, and passes them as an int array of ``RESPONSE_CODES``. Given the
+same response types, the arrays end up identical to what the scalar
+``GameState`` path produces.
+
+NumPy is optional. Importing this module works without it, but
+``BatchGameState`` raises ``ImproperlyConfigured`` when used.
+
+    batch = BatchGameState(100_000, hostages=6)
+    for _ in range(10):
+        batch.step(rng.integers(0, len(RESPONSE_TYPES), batch.size))
+    win_rate = batch.success.mean()
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+from .rules import MAX_LEVEL, RULES, build_transition
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Index of each response type in the transition arrays; anything else uses DEFAULT_RULE
+RESPONSE_TYPES = (*RULES, 'unpredictable')
+RESPONSE_CODES = {response_type: code for code, response_type in enumerate(RESPONSE_TYPES)}
+DEFAULT_CODE = RESPONSE_CODES['unpredictable']
+ACCEPT_SURRENDER = RESPONSE_CODES['accept_surrender']
+EMPATHY = RESPONSE_CODES['empathy']
+OVERUSED_EMOTION = RESPONSE_CODES['overused_emotion']
+MAX_EMOTIONAL_APPEALS = 2
+
+COUNTERS = ('tactical_empathy_success', 'mirroring_count', 'emotional_labeling_success',
+            'poor_choices', 'emotional_appeals_count')
+
+RELEASE_NONE, RELEASE_ONE, RELEASE_ALL = 0, 1, 2
+
+MAX_TURNS = 10
+WIN_RULE = {'max_tension': 2, 'min_trust': 7}
+
+_tables = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImproperlyConfigured("The batch engine requires NumPy (pip install numpy)")
+
+
+def transition_arrays():
+    """``rules.build_transition`` for every (code, tension, trust) in 0-10, as arrays indexed the same way"""
+    global _tables
+    _require_numpy()
+    if _tables is None:
+        shape = (len(RESPONSE_TYPES), MAX_LEVEL + 1, MAX_LEVEL + 1)
+        tables = {
+            'tension_delta': np.zeros(shape, dtype=np.int64),
+            'trust_delta': np.zeros(shape, dtype=np.int64),
+            'hostage_release': np.zeros(shape, dtype=np.int8),
+            'offer_surrender': np.zeros(shape, dtype=bool),
+            **{counter: np.zeros(len(RESPONSE_TYPES), dtype=np.int64) for counter in COUNTERS},
+        }
+        release_codes = {None: RELEASE_NONE, 'one': RELEASE_ONE, 'all': RELEASE_ALL}
+        for code, response_type in enumerate(RESPONSE_TYPES):
+            for tension in range(MAX_LEVEL + 1):
+                for trust in range(MAX_LEVEL + 1):
+                    transition = build_transition(response_type, tension, trust)
+                    tables['tension_delta'][code, tension, trust] = transition.tension_delta
+                    tables['trust_delta'][code, tension, trust] = transition.trust_delta
+                    tables['hostage_release'][code, tension, trust] = release_codes[transition.hostage_release]
+                    tables['offer_surrender'][code, tension, trust] = transition.offer_surrender
+            for counter in build_transition(response_type, 1, 1).counters:
+                tables[counter][code] += 1
+        _tables = tables
+    return _tables
+
+
+def encode_response_types(response_types):
+    """Map response type names to an int array; unknown names get the default rule"""
+    _require_numpy()
+    return np.array([RESPONSE_CODES.get(response_type, DEFAULT_CODE) for response_type in response_types],
+                    dtype=np.int64)
+
+
+class BatchGameState:
+    """Struct-of-arrays counterpart of the numeric parts of ``GameState``"""
+
+    def __init__(self, size, tension=5, trust=3, hostages=5, max_turns=MAX_TURNS, win_rule=None):
+        _require_numpy()
+        if not (0 <= tension <= MAX_LEVEL and 0 <= trust <= MAX_LEVEL):
+            raise ValueError(f"tension and trust must be between 0 and {MAX_LEVEL}")
+        self.size = size
+        self.max_turns = max_turns
+        self.win_rule = {**WIN_RULE, **(win_rule or {})}
+        self.turn = np.ones(size, dtype=np.int64)
+        self.tension = np.full(size, tension, dtype=np.int64)
+        self.trust = np.full(size, trust, dtype=np.int64)
+        self.hostages = np.full(size, hostages, dtype=np.int64)
+        self.hostages_released = np.zeros(size, dtype=np.int64)
+        self.surrender_offered = np.zeros(size, dtype=bool)
+        self.game_over = np.zeros(size, dtype=bool)
+        self.success = np.zeros(size, dtype=bool)
+        self.counters = {counter: np.zeros(size, dtype=np.int64) for counter in COUNTERS}
+
+    @property
+    def active(self):
+        return ~self.game_over
+
+    def step(self, response_codes):
+        """Advance every unfinished game by one turn; finished games are left untouched"""
+        tables = transition_arrays()
+        codes = np.asarray(response_codes, dtype=np.int64)
+        active = self.active.copy()
+
+        # detect_response_type only yields accept_surrender once it has been offered
+        accepted = active & (codes == ACCEPT_SURRENDER) & self.surrender_offered
+        self.hostages_released = np.where(accepted, self.hostages, self.hostages_released)
+        self.hostages = np.where(accepted, 0, self.hostages)
+        self.game_over |= accepted
+        self.success |= accepted
+
+        # detect_response_type counts every appeal and answers the third onwards as overused_emotion
+        appeals = self.counters['emotional_appeals_count']
+        appealing = active & (codes == EMPATHY)
+        appeals += appealing
+        codes = np.where(appealing & (appeals > MAX_EMOTIONAL_APPEALS), OVERUSED_EMOTION, codes)
+
+        # adjust_state
+        tension, trust = self.tension, self.trust
+        index = (codes, tension, trust)
+        release = np.where(active, tables['hostage_release'][index], RELEASE_NONE)
+        offer = active & tables['offer_surrender'][index]
+        self.tension = np.where(active, tension + tables['tension_delta'][index], tension)
+        self.trust = np.where(active, trust + tables['trust_delta'][index], trust)
+        for counter in COUNTERS:
+            self.counters[counter] += np.where(active, tables[counter][codes], 0)
+
+        # consider_hostage_release, skipped once the game is over
+        releasing = (release != RELEASE_NONE) & ~self.game_over & (self.hostages > self.hostages_released)
+        to_release = np.where(release == RELEASE_ALL, self.hostages - self.hostages_released, 1)
+        to_release = np.where(releasing, to_release, 0)
+        self.hostages_released += to_release
+        self.hostages -= to_release
+
+        self.surrender_offered |= offer
+
+        # process_ai_response, for games still running after this move
+        replying = active & ~self.game_over
+        self.turn += replying
+        escalated = replying & (self.tension >= 10)
+        self.hostages -= escalated
+        timed_out = replying & ~escalated & (self.turn >= self.max_turns)
+        won = timed_out & (self.tension <= self.win_rule['max_tension']) & (self.trust >= self.win_rule['min_trust'])
+        self.game_over |= escalated | timed_out
+        self.success = np.where(escalated | timed_out, won, self.success)
+
+    def run(self, response_codes):
+        """Play a (turns, size) array of response codes, stopping early once every game is over"""
+        for turn_codes in response_codes:
+            if not self.active.any():
+                break
+            self.step(turn_codes)
+        return self
+
+    def snapshot(self, index):
+        """One game's values under GameState attribute names"""
+        values = {
+            name: getattr(self, name)[index].item()
+            for name in ('turn', 'tension', 'trust', 'hostages', 'hostages_released',
+                         'surrender_offered', 'game_over', 'success')
+        }
+        values.update({counter: array[index].item() for counter, array in self.counters.items()})
+        return values
@@ -0,0 +1,277 @@
+"""Reproducible performance suite behind ``manage.py bench``.
+
+The suite has two groups of cases:
+- Engine cases time the pure game mechanics: detection, transitions,
+  session round trips, scoring and prompt building.
+- Request cases drive real views through the Django test client,
+  including a guest's turn on each guest game store. They run
+  against a throwaway test database and the in-process Grok stub, so no
+  network or API key is involved.
+
+Every case reports p50/p99 latency in microseconds and the number of SQL
+queries per call. Results can be saved as a JSON baseline and compared
+against later, which flags slower or chattier cases as regressions.
+"""
+import json
+import logging
+import random
+import statistics
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import context_window, grok_client, guest_store, leaderboard, prompts, score_stats
+from .game_logic import GameState, calculate_game_score
+from .grok_stub import start_stub_server
+from .models import Scenario, ScenarioAttempt, Score, User
+from .response_cache import response_cache
+from .scenario_manager import ScenarioManager
+
+logger = logging.getLogger(__name__)
+
+SUSPECT_LINE = "I want a car out front in ten minutes and nobody comes near this door"
+SHORT_INPUT = "What do you need from us?"
+LONG_INPUT = "we are going to get through this together and everyone walks out safe today " * 40
+RESPONSE_TYPES = ['empathy', 'mirror', 'calibrated', 'action', 'release_request', 'neutral', 'mistake']
+
+# Untimed calls before each case, so the scenario registry and connections are warm
+WARMUP_CALLS = 3
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(func, iterations, setup=None, count_queries=False):
+    """Call ``func`` ``iterations`` times and summarize; ``setup`` runs untimed before each call"""
+    for _ in range(WARMUP_CALLS):
+        if setup:
+            setup()
+        func()
+    samples = []
+    queries = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        if count_queries:
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                func()
+                samples.append(time.perf_counter() - start)
+            queries.append(len(context.captured_queries))
+        else:
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+    return {
+        'iterations': iterations,
+        'p50_us': round(statistics.median(samples) * 1e6, 2),
+        'p99_us': round(percentile(samples, 0.99) * 1e6, 2),
+        'queries': max(queries) if queries else 0,
+    }
+
+
+def _game_state(scenario=None, turns=5):
+    game_state = GameState(tension=6, trust=4, scenario=scenario)
+    game_state.messages.append(("suspect", SUSPECT_LINE))
+    for turn in range(turns):
+        game_state.messages.append(("player", f"I hear you. What would it take, turn {turn}?"))
+        game_state.messages.append(("suspect", SUSPECT_LINE))
+        game_state.turn += 1
+    return game_state
+
+
+def engine_cases(iterations):
+    """Pure-Python game mechanics; only from_dict needs the scenario registry"""
+    random.seed(0)
+    scenario = ScenarioManager.all()[0]
+    game_state = _game_state(scenario)
+    data = json.loads(json.dumps(game_state.to_dict()))
+    response_types = iter(RESPONSE_TYPES * iterations * 2)
+    finished = _game_state(scenario)
+    finished.game_over = True
+
+    def adjust():
+        state = GameState(tension=5, trust=5, hostages=3)
+        state.adjust_state(next(response_types))
+
+    def build_prompts():
+        grok_client.build_system_message(game_state, 'agitated')
+        grok_client.build_user_prompt(game_state, SHORT_INPUT, None, 'agitated')
+
+    return {
+        'detect_response_type/short': measure(lambda: game_state.detect_response_type(SHORT_INPUT), iterations),
+        'detect_response_type/long': measure(lambda: game_state.detect_response_type(LONG_INPUT), iterations),
+        'adjust_state': measure(adjust, iterations),
+        'game_state/to_dict': measure(game_state.to_dict, iterations),
+        'game_state/from_dict': measure(lambda: GameState.from_dict(data), iterations),
+        'calculate_game_score': measure(lambda: calculate_game_score(finished), iterations),
+        'build_prompts': measure(build_prompts, iterations),
+    }
+
+
+def _transcript(turns):
+    """Opening plus ``turns`` answered exchanges and the negotiator's next line"""
+    messages = [("suspect", SUSPECT_LINE)]
+    for turn in range(turns):
+        messages.append(("player", f"I hear you, and I want everyone out safe. What would it take, turn {turn}?"))
+        messages.append(("suspect", f"{SUSPECT_LINE}. You have had {turn} chances already."))
+    messages.append(("player", SHORT_INPUT))
+    return messages
+
+
+def context_cases(iterations, turns=9):
+    """History section of the user prompt at the last turn: bounded window vs. the full transcript"""
+    messages = _transcript(turns)
+    cache.clear()
+    # Warm the running summary as a game would have turn by turn
+    for turn in range(1, turns + 1):
+        context_window.history_section(_transcript(turn))
+    return {
+        f'context_window/turn{turns}': measure(lambda: context_window.history_section(messages), iterations),
+        f'full_history/turn{turns}': measure(lambda: context_window.full_history(messages), iterations),
+    }
+
+
+def context_tokens(turns=9):
+    """[(turn, windowed history tokens, full history tokens)] for a game of ``turns`` exchanges"""
+    cache.clear()
+    rows = []
+    for turn in range(turns + 1):
+        messages = _transcript(turn)
+        rows.append((turn, prompts.estimate_tokens(context_window.history_section(messages)),
+                     prompts.estimate_tokens(context_window.full_history(messages))))
+    return rows
+
+
+def seed_attempts(user, count, batch_size=5000):
+    """Bulk-create ``count`` finished attempts (and one score per ten) spread over the scenarios"""
+    scenarios = ScenarioManager.all()
+    now = timezone.now()
+    rng = random.Random(count)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        attempts = []
+        scores = []
+        for offset in range(created, created + size):
+            scenario = scenarios[offset % len(scenarios)]
+            ended = now - timedelta(minutes=offset)
+            score = rng.randint(1, 10)
+            attempts.append(ScenarioAttempt(
+                user=user, scenario=scenario, scenario_name=scenario.name, end_time=ended,
+                initial_tension=5, current_tension=rng.randint(1, 10), initial_trust=3,
+                current_trust=rng.randint(1, 10), initial_hostages=scenario.hostages,
+                current_hostages=scenario.hostages, success=score >= 7, final_score=score,
+                messages=[["suspect", scenario.opening_dialogue]],
+            ))
+            if offset % 10 == 0:
+                scores.append(Score(user=user, scenario=scenario, scenario_name=scenario.name,
+                                    score=score + rng.random(), created_at=ended))
+        ScenarioAttempt.objects.bulk_create(attempts, batch_size=1000)
+        Score.objects.bulk_create(scores, batch_size=1000)
+        created += size
+    leaderboard.rebuild()
+    score_stats.rebuild(user)
+
+
+def request_cases(sizes, iterations):
+    """Full requests through the test client; call inside a test database"""
+    results = {}
+    server, url = start_stub_server()
+    try:
+        with mock.patch.multiple(grok_client, API_URL=url, API_KEY='bench-key'):
+            results.update(_play_case(iterations))
+            results.update(_guest_play_cases(iterations))
+        for size in sizes:
+            user = User.objects.create_user(username=f'bench{size}', email=f'bench{size}@example.com',
+                                            password='bench-password')
+            started = time.perf_counter()
+            seed_attempts(user, size)
+            logger.info("Seeded %s attempts in %.1fs", size, time.perf_counter() - started)
+            client = Client()
+            client.force_login(user)
+            # The cached per-user summary and leaderboards would hide the database work on every call
+            results[f'scenario_list/{size}'] = measure(
+                lambda: client.get(reverse('scenario_list')), iterations, setup=cache.clear, count_queries=True)
+            results[f'stats/{size}'] = measure(
+                lambda: client.get(reverse('stats')), iterations, setup=cache.clear, count_queries=True)
+    finally:
+        server.shutdown()
+        grok_client.close_http_clients()
+        response_cache.reset()
+    return results
+
+
+def _play_case(iterations):
+    user = User.objects.create_user(username='bench-player', email='bench-player@example.com',
+                                    password='bench-password')
+    client = Client()
+    client.force_login(user)
+    scenario = Scenario.objects.order_by('id').first()
+    turns = {'played': 0}
+    lines = iter(range(10 ** 9))
+
+    def new_game_if_needed():
+        # Restart before the turn limit so the daily-play check never blocks the loop
+        if turns['played'] % 8 == 0:
+            client.get(reverse('start_game', args=[scenario.id]))
+        turns['played'] += 1
+
+    def play():
+        # A different line each time so the response cache never answers for the stub
+        client.post(reverse('play'), {'choice': f"What do you need, option {next(lines)}?"})
+
+    return {'views.play': measure(play, iterations, setup=new_game_if_needed, count_queries=True)}
+
+
+def _guest_play_cases(iterations):
+    """A guest's turn with the game in the session against the cache-first guest store.
+
+    The suspect answers with the offline mock reply, so the numbers compare
+    the storage paths rather than the Grok round trip.
+    """
+    scenario = Scenario.objects.order_by('id').first()
+    config = guest_store.get_config()
+    results = {}
+    for backend in ('session', 'cached_db'):
+        store_settings = override_settings(GUEST_GAME_STORE={**config, 'BACKEND': backend})
+        with store_settings, mock.patch.object(grok_client, 'API_KEY', None):
+            client = Client()
+            turns = {'played': 0}
+            lines = iter(range(10 ** 9))
+
+            def new_game_if_needed():
+                # Guests have no daily-play record until they finish, so restarting is enough
+                if turns['played'] % 8 == 0:
+                    client.get(reverse('start_game', args=[scenario.id]))
+                turns['played'] += 1
+
+            def play():
+                client.post(reverse('play'), {'choice': f"Talk to me, option {next(lines)}"})
+
+            results[f'views.play/guest/{backend}'] = measure(
+                play, iterations, setup=new_game_if_needed, count_queries=True)
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Regressions of ``results`` against ``baseline``: slower p50 beyond ``tolerance`` or more queries"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if result['p50_us'] > previous['p50_us'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {previous['p50_us']:.1f}us -> {result['p50_us']:.1f}us")
+        if result['queries'] > previous['queries']:
+            regressions.append(f"{name}: queries {previous['queries']} -> {result['queries']}")
+    return regressions
@@ -0,0 +1,238 @@
+"""Circuit breaker and adaptive timeout for the Grok API.
+
+Every call's outcome and latency go into rolling windows kept in the Django
+cache named by ``CACHE_ALIAS``. With a shared cache (Redis or Memcached)
+all workers see the same picture. On the default local-memory cache each
+process keeps its own breaker, which still trips on the failures that
+process sees. The windows are counters in fixed time buckets; keys expire
+on their own once a bucket falls out of the window.
+
+- closed: calls go through. Once at least ``MIN_CALLS`` calls in the window
+  have failed at a rate of ``ERROR_THRESHOLD`` or more, the circuit opens.
+- open: ``allow_request`` is False, and grok_client answers with the mock
+  reply instead of waiting on the API.
+- half-open: ``OPEN_SECONDS`` after opening, a single worker is allowed one
+  probe call. Success closes the circuit; failure opens it again.
+
+The adaptive timeout is ``TIMEOUT_MULTIPLIER`` times the p95 latency of
+recent successful calls, clamped between ``MIN_TIMEOUT`` and the client's
+own timeout. Each worker recomputes it at most every ``REFRESH_SECONDS``.
+
+Configured through ``settings.GROK_CIRCUIT_BREAKER``::
+
+    GROK_CIRCUIT_BREAKER = {
+        'ENABLED': True,
+        'CACHE_ALIAS': 'default',
+        'WINDOW_SECONDS': 60,
+        'BUCKET_SECONDS': 10,
+        'MIN_CALLS': 10,
+        'ERROR_THRESHOLD': 0.5,
+        'OPEN_SECONDS': 30,
+        'MIN_TIMEOUT': 2.0,
+        'TIMEOUT_MULTIPLIER': 2.0,
+        'REFRESH_SECONDS': 5,
+    }
+"""
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'WINDOW_SECONDS': 60,
+    'BUCKET_SECONDS': 10,
+    'MIN_CALLS': 10,
+    'ERROR_THRESHOLD': 0.5,
+    'OPEN_SECONDS': 30,
+    'MIN_TIMEOUT': 2.0,
+    'TIMEOUT_MULTIPLIER': 2.0,
+    'REFRESH_SECONDS': 5,
+}
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Upper bounds (seconds) of the shared latency histogram
+LATENCY_BOUNDS = (0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4, 5, 7.5, 10, 15, 20, 30, 60)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GROK_CIRCUIT_BREAKER', {})}
+
+
+class CircuitBreaker:
+    """Breaker state and rolling windows for one upstream, shared through the Django cache"""
+
+    def __init__(self, name, clock=time.time):
+        self.name = name
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.last_timeout = None
+        self._timeout_expires_at = 0.0
+
+    @property
+    def config(self):
+        return get_config()
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    def _key(self, *parts):
+        return ':'.join(('circuit', self.name, *map(str, parts)))
+
+    def _buckets(self, now):
+        """Time buckets covering the window, newest first"""
+        config = self.config
+        current = int(now // config['BUCKET_SECONDS'])
+        return range(current, current - config['WINDOW_SECONDS'] // config['BUCKET_SECONDS'], -1)
+
+    def _incr(self, key):
+        ttl = self.config['WINDOW_SECONDS'] + self.config['BUCKET_SECONDS']
+        self.cache.add(key, 0, ttl)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.set(key, 1, ttl)
+
+    def _get_state(self):
+        return self.cache.get(self._key('state')) or {'state': CLOSED, 'since': 0.0}
+
+    def _set_state(self, state, now):
+        self.cache.set(self._key('state'), {'state': state, 'since': now}, None)
+
+    def state(self):
+        """closed, open, or half_open once an open circuit's cool-down has passed"""
+        current = self._get_state()
+        if current['state'] == OPEN and self.clock() - current['since'] >= self.config['OPEN_SECONDS']:
+            return HALF_OPEN
+        return current['state']
+
+    def window(self):
+        """Calls, errors and per-bound latency counts since the window start (or the last close)"""
+        now = self.clock()
+        since = self._get_state()['since']
+        buckets = [b for b in self._buckets(now) if (b + 1) * self.config['BUCKET_SECONDS'] > since]
+        keys = [self._key(kind, bucket) for bucket in buckets for kind in ('calls', 'errors')]
+        keys += [self._key('latency', bucket, index) for bucket in buckets for index in range(len(LATENCY_BOUNDS))]
+        counts = self.cache.get_many(keys)
+        return {
+            'calls': sum(counts.get(self._key('calls', bucket), 0) for bucket in buckets),
+            'errors': sum(counts.get(self._key('errors', bucket), 0) for bucket in buckets),
+            'latency': [sum(counts.get(self._key('latency', bucket, index), 0) for bucket in buckets)
+                        for index in range(len(LATENCY_BOUNDS))],
+        }
+
+    def allow_request(self):
+        """Whether a call may go out now; in half-open only the worker that wins the probe slot may"""
+        if not self.config['ENABLED']:
+            return True
+        state = self.state()
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self.cache.add(self._key('probe'), 1, self.config['OPEN_SECONDS']):
+            logger.info("Circuit %s half-open; sending a probe call", self.name)
+            return True
+        metrics.increment('grok_circuit_rejections')
+        return False
+
+    def record(self, seconds, success):
+        """Feed one finished call into the windows and move the breaker if that changes its state
+
+        ``seconds`` is None for calls whose latency isn't comparable (streams); they only count
+        towards the error rate.
+        """
+        if not self.config['ENABLED']:
+            return
+        now = self.clock()
+        bucket = self._buckets(now)[0]
+        self._incr(self._key('calls', bucket))
+        if not success:
+            self._incr(self._key('errors', bucket))
+        elif seconds is not None:
+            index = next((i for i, bound in enumerate(LATENCY_BOUNDS) if seconds <= bound), len(LATENCY_BOUNDS) - 1)
+            self._incr(self._key('latency', bucket, index))
+
+        state = self.state()
+        if state == HALF_OPEN:
+            self.cache.delete(self._key('probe'))
+            if success:
+                self._close(now)
+            else:
+                self._open(now, "probe call failed")
+        elif state == CLOSED and not success:
+            window = self.window()
+            config = self.config
+            if window['calls'] >= config['MIN_CALLS'] and window['errors'] / window['calls'] >= config['ERROR_THRESHOLD']:
+                self._open(now, f"{window['errors']} of {window['calls']} calls failed")
+
+    def _open(self, now, reason):
+        self._set_state(OPEN, now)
+        metrics.increment('grok_circuit_opened')
+        logger.warning("Circuit %s opened: %s", self.name, reason)
+
+    def _close(self, now):
+        # Closing restarts the window, so failures from before the outage can't reopen it
+        self._set_state(CLOSED, now)
+        logger.info("Circuit %s closed", self.name)
+
+    def timeout(self, default):
+        """Adaptive timeout from the p95 of recent successful calls, never above ``default``"""
+        config = self.config
+        if not config['ENABLED']:
+            return default
+        now = self.clock()
+        with self._lock:
+            if self.last_timeout is not None and now < self._timeout_expires_at:
+                return min(self.last_timeout, default)
+        latency = self.window()['latency']
+        total = sum(latency)
+        timeout = default
+        if total >= config['MIN_CALLS']:
+            running = 0
+            for bound, count in zip(LATENCY_BOUNDS, latency):
+                running += count
+                if running >= total * 0.95:
+                    timeout = max(config['MIN_TIMEOUT'], min(default, bound * config['TIMEOUT_MULTIPLIER']))
+                    break
+        with self._lock:
+            self.last_timeout, self._timeout_expires_at = timeout, now + config['REFRESH_SECONDS']
+        return timeout
+
+    async def aallow_request(self):
+        return await sync_to_async(self.allow_request, thread_sensitive=False)()
+
+    async def arecord(self, seconds, success):
+        await sync_to_async(self.record, thread_sensitive=False)(seconds, success)
+
+    async def atimeout(self, default):
+        return await sync_to_async(self.timeout, thread_sensitive=False)(default)
+
+    def reset(self):
+        """Close the circuit and forget the windows and the cached timeout"""
+        now = self.clock()
+        keys = [self._key('state'), self._key('probe')]
+        for bucket in self._buckets(now):
+            keys += [self._key('calls', bucket), self._key('errors', bucket)]
+            keys += [self._key('latency', bucket, index) for index in range(len(LATENCY_BOUNDS))]
+        self.cache.delete_many(keys)
+        with self._lock:
+            self.last_timeout, self._timeout_expires_at = None, 0.0
+
+
+grok_breaker = CircuitBreaker('grok')
+
+metrics.gauge('grok_circuit_state', lambda: STATE_CODES[grok_breaker.state()],
+              "Grok circuit breaker state (0 closed, 1 half-open, 2 open)")
+metrics.gauge('grok_timeout_seconds', lambda: grok_breaker.last_timeout,
+              "Adaptive Grok API timeout last computed by this process")
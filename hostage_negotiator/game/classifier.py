@@ -0,0 +1,98 @@
+"""Keyword classification of negotiator input.
+
+Every keyword and phrase is compiled at import time into a single regex,
+with shared prefixes factored into a trie ("ca(?:n't|re)") so the engine
+tries at most one branch per character. One ``finditer`` pass reports
+every category present, matching whole words only (so "no" no longer fires
+on "know"), and ``GameState.detect_response_type`` applies its precedence
+to the result.
+"""
+import re
+from functools import lru_cache
+
+# Category -> keywords/phrases, matched on word boundaries
+KEYWORDS = {
+    'accept': ["yes", "accept", "agree", "okay", "ok"],
+    'empathy': ["please", "understand", "feel", "need", "help", "care", "trust", "believe"],
+    'action': [
+        "i'll get you", "i can get you", "i will get",
+        "let me get", "i'll have", "i can arrange", "offer",
+        "deal", "trade", "exchange"
+    ],
+    'release_request': [
+        "release the hostages", "let them go", "free the hostages",
+        "release them", "set them free"
+    ],
+    'mistake': ["no", "won't", "can't", "never", "don't", "stop"],
+    # Question openers; only count when followed by whitespace
+    'calibrated': ["how", "what", "tell", "explain"],
+}
+
+PHRASE_CATEGORIES = {
+    phrase: category for category, phrases in KEYWORDS.items() for phrase in phrases
+}
+
+SHINGLE_SIZE = 3
+
+_WORD = re.compile(r"[\w']+")
+
+
+def _trie_pattern(phrases):
+    """Regex source matching any of ``phrases``, longest first, with common prefixes merged"""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A phrase ending here makes the rest optional; greedy so the longer phrase wins
+        return f'(?:{pattern})?' if '' in node else pattern
+
+    return build(trie)
+
+
+PATTERN = re.compile(r"(?<![\w'])" + _trie_pattern(PHRASE_CATEGORIES) + r"(?![\w'])")
+
+
+def classify(text):
+    """Return the set of keyword categories present in ``text`` (already lowercased)"""
+    categories = set()
+    for match in PATTERN.finditer(text):
+        category = PHRASE_CATEGORIES[match.group()]
+        if category == 'calibrated' and not text[match.end():match.end() + 1].isspace():
+            continue
+        categories.add(category)
+    return categories
+
+
+def words(text):
+    return _WORD.findall(text.lower())
+
+
+@lru_cache(maxsize=256)
+def shingle_pattern(suspect_line):
+    """Compiled matcher for every three-word run of a suspect line, or None if it is too short.
+
+    Cached because the same suspect line is checked on every turn until the suspect speaks again.
+    """
+    tokens = words(suspect_line)
+    shingles = {
+        tuple(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+    if not shingles:
+        return None
+    # Punctuation between the mirrored words doesn't matter ("a car, now" mirrors "a car now")
+    source = _trie_pattern(' '.join(shingle) for shingle in shingles).replace(re.escape(' '), r"[^\w']+")
+    return re.compile(r"(?<![\w'])" + source + r"(?![\w'])")
+
+
+def mirrors(text, suspect_line):
+    """True if ``text`` (lowercased) repeats any three-word run of ``suspect_line``"""
+    pattern = shingle_pattern(suspect_line)
+    return pattern is not None and pattern.search(text) is not None
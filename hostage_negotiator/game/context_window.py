@@ -0,0 +1,193 @@
+"""Bounded conversation history for the Grok user prompt.
+
+The suspect sees three layers, in order:
+
+1. The scenario facts, pinned in the system message (see game/prompts.py).
+2. A running summary of the older exchanges, one short clipped line per
+   exchange. The summary is cached in a Django cache under a hash chain of
+   the exchanges it covers. Each turn looks up the previous summary and
+   appends one line, so nothing is re-summarized unless the cache entry has
+   been evicted. When the summary grows past ``SUMMARY_MAX_TOKENS``, its
+   oldest lines are dropped and counted as omitted.
+3. The last ``RECENT_EXCHANGES`` exchanges verbatim. The newest ones come
+   first when ``TOKEN_BUDGET`` is tight, and any recent exchange that no
+   longer fits is clipped like a summary line.
+
+An exchange is one negotiator line plus the suspect's replies to it. The
+opening line counts as an exchange with no negotiator line. System
+messages are left out. The negotiator's current line is not history; the
+user prompt carries it separately.
+
+Configured through ``settings.GROK_CONTEXT_WINDOW``::
+
+    GROK_CONTEXT_WINDOW = {
+        'ENABLED': True,
+        'RECENT_EXCHANGES': 3,
+        'TOKEN_BUDGET': 400,          # summary + recent exchanges
+        'SUMMARY_MAX_TOKENS': 160,
+        'CLIP_WORDS': 12,             # words kept per line in the summary
+        'CACHE_ALIAS': 'default',
+        'CACHE_TIMEOUT': 3600,
+    }
+"""
+import hashlib
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .prompts import estimate_tokens
+
+DEFAULTS = {
+    'ENABLED': True,
+    'RECENT_EXCHANGES': 3,
+    'TOKEN_BUDGET': 400,
+    'SUMMARY_MAX_TOKENS': 160,
+    'CLIP_WORDS': 12,
+    'CACHE_ALIAS': 'default',
+    'CACHE_TIMEOUT': 3600,
+}
+
+KEY_PREFIX = 'context-summary'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GROK_CONTEXT_WINDOW', {})}
+
+
+class Context(NamedTuple):
+    summary_lines: list
+    omitted: int
+    recent: list
+    tokens: int
+
+
+def exchanges(messages):
+    """[(negotiator line or None, suspect reply)] from a transcript, without the trailing unanswered line"""
+    result = []
+    for sender, text in messages:
+        if sender == 'player':
+            result.append([text, []])
+        elif sender == 'suspect':
+            if not result:
+                result.append([None, []])
+            result[-1][1].append(text)
+    if result and result[-1][0] is not None and not result[-1][1]:
+        result.pop()
+    return [(player, " ".join(replies)) for player, replies in result]
+
+
+def clip(text, words):
+    parts = text.split()
+    return " ".join(parts[:words]) + ("..." if len(parts) > words else "")
+
+
+def summary_line(number, exchange, words):
+    player, suspect = exchange
+    if player is None:
+        return f'- Opening: you said "{clip(suspect, words)}"'
+    return f'- Exchange {number}: negotiator "{clip(player, words)}"; you "{clip(suspect, words)}"'
+
+
+def _chain_keys(older):
+    """Cache key for every prefix of ``older``; each hash folds in the previous one"""
+    keys = []
+    digest = b''
+    for player, suspect in older:
+        digest = hashlib.md5(digest + f"{player}\x1f{suspect}\x1e".encode()).digest()
+        keys.append(f"{KEY_PREFIX}:{digest.hex()}")
+    return keys
+
+
+def _extend(summary, line, max_tokens):
+    lines = [*summary['lines'], line]
+    omitted = summary['omitted']
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+        omitted += 1
+    return {'lines': lines, 'omitted': omitted}
+
+
+def running_summary(older, config=None):
+    """{'lines', 'omitted'} summarizing ``older``; extends the cached summary of all but its last exchange"""
+    config = config or get_config()
+    empty = {'lines': [], 'omitted': 0}
+    if not older:
+        return empty
+    cache = caches[config['CACHE_ALIAS']]
+    keys = _chain_keys(older)
+    cached = cache.get_many(keys[-2:])
+    summary = cached.get(keys[-1])
+    if summary is not None:
+        return summary
+
+    words, max_tokens = config['CLIP_WORDS'], config['SUMMARY_MAX_TOKENS']
+    previous = cached.get(keys[-2]) if len(keys) > 1 else empty
+    if previous is None:
+        # Evicted or expired; fold the whole history once and carry on incrementally
+        metrics.increment('context_summary_rebuilds')
+        previous = empty
+        for number, exchange in enumerate(older[:-1]):
+            previous = _extend(previous, summary_line(number, exchange, words), max_tokens)
+    summary = _extend(previous, summary_line(len(older) - 1, older[-1], words), max_tokens)
+    cache.set(keys[-1], summary, config['CACHE_TIMEOUT'])
+    return summary
+
+
+def _render_exchange(exchange):
+    player, suspect = exchange
+    lines = [] if player is None else [f"Negotiator: {player}"]
+    return "\n".join([*lines, f"You: {suspect}"])
+
+
+def build_context(messages):
+    """The bounded history for a transcript whose last entry is the negotiator's current line"""
+    config = get_config()
+    history = exchanges(messages)
+    split = max(0, len(history) - config['RECENT_EXCHANGES'])
+    older, recent = history[:split], history[split:]
+
+    summary = running_summary(older, config)
+    summary_lines = list(summary['lines'])
+    budget = config['TOKEN_BUDGET'] - estimate_tokens("\n".join(summary_lines))
+
+    kept = []
+    for offset, exchange in enumerate(reversed(recent)):
+        rendered = _render_exchange(exchange)
+        cost = estimate_tokens(rendered)
+        if cost > budget:
+            # Everything older than this is clipped into the summary as well
+            for number, dropped in enumerate(recent[:len(recent) - offset], start=split):
+                summary_lines.append(summary_line(number, dropped, config['CLIP_WORDS']))
+            break
+        kept.append(rendered)
+        budget -= cost
+    kept.reverse()
+    tokens = estimate_tokens("\n".join([*summary_lines, *kept]))
+    return Context(summary_lines, summary['omitted'], kept, tokens)
+
+
+def render(context):
+    """History section for the user prompt; empty on the opening turn"""
+    sections = []
+    if context.summary_lines or context.omitted:
+        header = "Earlier in the negotiation"
+        if context.omitted:
+            header += f" ({context.omitted} earlier exchanges not shown)"
+        sections.append(header + ":\n" + "\n".join(context.summary_lines))
+    if context.recent:
+        sections.append("Most recent exchanges:\n" + "\n\n".join(context.recent))
+    return "\n\n".join(sections)
+
+
+def history_section(messages):
+    """Rendered bounded history, or '' when the context window is disabled"""
+    if not get_config()['ENABLED']:
+        return ''
+    return render(build_context(messages))
+
+
+def full_history(messages):
+    """Every exchange verbatim; the unbounded approach the context window replaces (for benchmarks)"""
+    return "\n\n".join(_render_exchange(exchange) for exchange in exchanges(messages))
@@ -0,0 +1,17 @@
+"""UTC calendar-day helpers shared by the leaderboards, score stats and views.
+
+Daily boards, daily stats and "played today" checks all bucket by the UTC
+date. Queries use ``utc_day_range`` rather than ``__date`` lookups, so the
+database can range-scan an index on the timestamp column.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+
+def utc_day(moment):
+    return moment.astimezone(dt_timezone.utc).date()
+
+
+def utc_day_range(day):
+    """(start, end) datetimes of a UTC day, for index-friendly ``__gte``/``__lt`` filters instead of ``__date``"""
+    start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    return start, start + timedelta(days=1)
@@ -0,0 +1,225 @@
+"""Request coalescing and deployment-wide rate limiting for Grok calls.
+
+- ``SingleFlight`` and ``AsyncSingleFlight`` collapse concurrent calls that
+  share a key into one. The first caller runs the function, and the callers
+  that arrive while it is in flight wait and get the same result or
+  exception. grok_client keys them on a fingerprint of the request payload.
+  That way players who open the same daily scenario with the same line
+  share one upstream call. If the leading coroutine is cancelled, say
+  because its client disconnected, the waiters get ``GrokBusyError`` and
+  take the usual fallback. They are not cancelled along with it.
+- ``RateLimiter`` caps requests per second across every worker that shares
+  the Django cache alias. It uses one counter per second (``cache.add`` plus
+  ``incr``). A caller over the limit sleeps until the next second and gives
+  up with ``GrokBusyError`` at its deadline. On a per-process cache every
+  worker would get the whole budget, so ``check_config`` refuses to enable
+  the limit there at startup.
+
+Concurrency per process is capped by grok_client's per-host semaphores.
+
+Configured through ``settings.GROK_RATE_LIMIT``::
+
+    GROK_RATE_LIMIT = {
+        'REQUESTS_PER_SECOND': None,   # None disables the deployment-wide limit
+        'CACHE_ALIAS': 'default',
+    }
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+from . import metrics
+
+DEFAULTS = {
+    'REQUESTS_PER_SECOND': None,
+    'CACHE_ALIAS': 'default',
+}
+
+
+# Cache backends whose contents aren't shared between worker processes
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GROK_RATE_LIMIT', {})}
+
+
+def check_config():
+    """Raise ImproperlyConfigured when the rate limit is enabled on a cache the workers don't share"""
+    config = get_config()
+    if not config['REQUESTS_PER_SECOND']:
+        return
+    backend = settings.CACHES.get(config['CACHE_ALIAS'], {}).get('BACKEND')
+    if backend is None or backend in LOCAL_CACHE_BACKENDS:
+        raise ImproperlyConfigured(
+            f"GROK_RATE_LIMIT needs a cache shared by all workers, but CACHES[{config['CACHE_ALIAS']!r}] is "
+            f"{backend}; configure Redis or Memcached, or leave REQUESTS_PER_SECOND unset"
+        )
+
+
+class GrokBusyError(Exception):
+    """Raised when a Grok call can't get a request slot before its queueing deadline"""
+
+
+def fingerprint(payload):
+    """Stable md5 of a request payload, for use as a coalescing key"""
+    return hashlib.md5(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-based single-flight: one execution per key at a time, shared by every waiting caller"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            metrics.increment('grok_coalesced')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """Single-flight for coroutines; calls are only shared within one event loop"""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func):
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        future = self._calls.get(flight_key)
+        if future is not None:
+            metrics.increment('grok_coalesced')
+            # A waiter being cancelled must not cancel the leader's call
+            return await asyncio.shield(future)
+        future = self._calls[flight_key] = loop.create_future()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # Only the leader's request is going away; the waiters fall back instead of being cancelled too
+            future.set_exception(GrokBusyError("The shared Grok call was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark it retrieved so an unshared failure doesn't log "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[flight_key]
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+class RateLimiter:
+    """Requests-per-second cap shared through the Django cache"""
+
+    def __init__(self, name, clock=time.time, sleep=time.sleep):
+        self.name = name
+        self.clock = clock
+        self.sleep = sleep
+
+    @property
+    def config(self):
+        return get_config()
+
+    def _key(self, now):
+        return f'rate:{self.name}:{int(now)}'
+
+    def _wait(self, count, now):
+        if count is None or count <= self.config['REQUESTS_PER_SECOND']:
+            return 0
+        return int(now) + 1 - now
+
+    def _take(self, now):
+        """Count this request in the current second; returns the wait before retrying, or 0 if admitted"""
+        if not self.config['REQUESTS_PER_SECOND']:
+            return 0
+        cache = caches[self.config['CACHE_ALIAS']]
+        key = self._key(now)
+        cache.add(key, 0, 2)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            count = None
+        return self._wait(count, now)
+
+    async def _atake(self, now):
+        """``_take`` through the cache's async API, so a network cache doesn't block the event loop"""
+        if not self.config['REQUESTS_PER_SECOND']:
+            return 0
+        cache = caches[self.config['CACHE_ALIAS']]
+        key = self._key(now)
+        await cache.aadd(key, 0, 2)
+        try:
+            count = await cache.aincr(key)
+        except ValueError:
+            count = None
+        return self._wait(count, now)
+
+    def acquire(self, deadline):
+        """Wait for a slot until ``deadline`` (a ``clock()`` timestamp), then raise GrokBusyError"""
+        while True:
+            now = self.clock()
+            wait = self._take(now)
+            if not wait:
+                return
+            if now + wait > deadline:
+                metrics.increment('grok_rate_limited')
+                raise GrokBusyError(f"{self.name}: over {self.config['REQUESTS_PER_SECOND']} requests/s")
+            self.sleep(wait)
+
+    async def aacquire(self, deadline):
+        while True:
+            now = self.clock()
+            wait = await self._atake(now)
+            if not wait:
+                return
+            if now + wait > deadline:
+                metrics.increment('grok_rate_limited')
+                raise GrokBusyError(f"{self.name}: over {self.config['REQUESTS_PER_SECOND']} requests/s")
+            await asyncio.sleep(wait)
@@ -2,11 +2,14 @@ import logging
 import random
 from dataclasses import dataclass
 from datetime import datetime
+from . import metrics
+from .classifier import classify, mirrors
+from .rules import get_transition
 from .scenario_manager import Scenario
 
-logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(slots=True)
 class GameState:
     turn: int = 1
     tension: int = 7  # Replaces mood (1-10 scale)
@@ -40,8 +43,11 @@ class GameState:
                 ("system", "Initial contact has been established. The suspect has provided proof of life for all hostages."),
                 ("system", "Your task now is to negotiate for a peaceful resolution.")
             ])
-        if self.promises_kept is None:
-            self.promises_kept = []
+        else:
+            # Stored transcripts come back from JSON as lists; keep messages as (sender, text) tuples
+            self.messages = [tuple(message) for message in self.messages]
+        # Copy so the state never shares a list with the caller, a session payload or a cached dict
+        self.promises_kept = [] if self.promises_kept is None else list(self.promises_kept)
 
     def detect_response_type(self, text):
         """Enhanced response type detection with anti-exploit mechanics"""
@@ -54,51 +60,43 @@ class GameState:
             self.similar_inputs_count = 0
             self.last_input_type = text.strip()
 
+        # One pass over the input finds every keyword category present
+        categories = classify(text)
+
         # Check for surrender acceptance - this should be checked first
-        if self.surrender_offered and any(word in text for word in ["yes", "accept", "agree", "okay", "ok"]):
+        if self.surrender_offered and 'accept' in categories:
             self.game_over = True
             self.success = True
             self.release_hostages(surrender=True)
             return 'accept_surrender'
 
         # Emotional Appeal Detection
-        emotional_keywords = ["please", "understand", "feel", "need", "help", "care", "trust", "believe"]
-        if any(word in text for word in emotional_keywords):
+        if 'empathy' in categories:
             self.emotional_appeals_count += 1
             if self.emotional_appeals_count <= 2:
                 return 'empathy'
             return 'overused_emotion'
 
         # Calibrated Questions
-        if any(word + " " in text for word in ["how", "what", "tell", "explain"]) and "?" in text:
+        if 'calibrated' in categories and "?" in text:
             return 'calibrated'
 
         # Bargaining Detection
-        if any(phrase in text for phrase in [
-            "i'll get you", "i can get you", "i will get",
-            "let me get", "i'll have", "i can arrange", "offer",
-            "deal", "trade", "exchange"
-        ]):
+        if 'action' in categories:
             return 'action'
 
         # Mirroring Detection
-        last_suspect_message = next((msg[1].lower() for msg in reversed(self.messages)
+        last_suspect_message = next((msg[1] for msg in reversed(self.messages)
                                     if msg[0] == 'suspect'), '')
-        words = last_suspect_message.split()
-        if len(words) >= 3:
-            key_phrases = [' '.join(words[i:i+3]) for i in range(len(words)-2)]
-            if any(phrase in text for phrase in key_phrases):
-                return 'mirror'
+        if mirrors(text, last_suspect_message):
+            return 'mirror'
 
         # Hostage Release Request
-        if any(phrase in text for phrase in [
-            "release the hostages", "let them go", "free the hostages",
-            "release them", "set them free"
-        ]):
+        if 'release_request' in categories:
             return 'release_request'
 
         # Mistake Detection
-        if any(word in text for word in ["no", "won't", "can't", "never", "don't", "stop"]):
+        if 'mistake' in categories:
             return 'mistake'
 
         # Random humor/irrationality (20% chance)
@@ -118,91 +116,24 @@ class GameState:
             return 'resigned'
 
     def adjust_state(self, response_type):
-        """Enhanced state adjustment with trust and tension mechanics"""
-        logging.debug(f"Adjusting state for response type: {response_type}")
-
-        # Base changes for each response type (tension, trust, score)
-        changes = {
-            'empathy': {
-                'tension': -2, 
-                'trust': 2,
-                'tactical_empathy_success': 1
-            },
-            'mirror': {
-                'tension': -1, 
-                'trust': 2,
-                'mirroring_count': 1
-            },
-            'emotional_label': {
-                'tension': -2, 
-                'trust': 2,
-                'emotional_labeling_success': 1
-            },
-            'action': {
-                'tension': -2 if self.trust > 5 else 2,
-                'trust': 2 if self.tension <= 7 else -1
-            },
-            'calibrated': {
-                'tension': -2,
-                'trust': 3
-            },
-            'release_request': {
-                'tension': 3 if self.trust < 5 else -1,
-                'trust': -2 if self.tension >= 8 else 1
-            },
-            'accept_surrender': {
-                'tension': 0,
-                'trust': 0
-            },
-            'neutral': {
-                'tension': 1,
-                'trust': -1,
-                'poor_choices': 1
-            },
-            'mistake': {
-                'tension': 3,
-                'trust': -3,
-                'poor_choices': 1
-            },
-            'overused_emotion': {
-                'tension': 2,
-                'trust': -2,
-                'emotional_appeals_count': 1
-            }
-        }
+        """Apply the precomputed transition for this response type (balance lives in rules.py)"""
+        logger.debug("Adjusting state for response type: %s", response_type)
+
+        transition = get_transition(response_type, self.tension, self.trust)
+
+        self.tension += transition.tension_delta
+        self.trust += transition.trust_delta
 
-        change = changes.get(response_type, {'tension': 0, 'trust': 0})
-        
-        # Process realistic consequences
-        self.tension = max(1, min(10, self.tension + change.get('tension', 0)))
-        self.trust = max(1, min(10, self.trust + change.get('trust', 0)))
-        
         # Update counters
-        if change.get('tactical_empathy_success'):
-            self.tactical_empathy_success += 1
-        if change.get('mirroring_count'):
-            self.mirroring_count += 1
-        if change.get('emotional_labeling_success'):
-            self.emotional_labeling_success += 1
-        if change.get('poor_choices'):
-            self.poor_choices += 1
-        if change.get('emotional_appeals_count'):
-            self.emotional_appeals_count += 1
+        for counter in transition.counters:
+            setattr(self, counter, getattr(self, counter) + 1)
 
         # Consider hostage release based on trust and tension
-        emotional_state = self.get_emotional_state()
-        if not self.game_over:
-            if emotional_state == 'resigned' and self.trust >= 2:
-                self.consider_hostage_release(all_hostages=True)
-            elif emotional_state == 'strategic' and self.trust >= 4:
-                self.consider_hostage_release()
-            elif emotional_state == 'agitated' and self.trust >= 6:
-                self.consider_hostage_release()
-            elif emotional_state == 'volatile' and self.trust >= 8:
-                self.consider_hostage_release()
+        if transition.hostage_release and not self.game_over:
+            self.consider_hostage_release(all_hostages=transition.hostage_release == 'all')
 
         # Consider surrender
-        if self.tension <= 2 and self.trust >= 8 and not self.surrender_offered:
+        if transition.offer_surrender and not self.surrender_offered:
             self.surrender_offered = True
             self.messages.append(("system", "The suspect is ready to surrender. Do you accept?"))
 
@@ -237,7 +168,7 @@ class GameState:
         """Process AI response and update game state"""
         try:
             if not response:
-                logging.warning("Received empty AI response, using fallback")
+                logger.warning("Received empty AI response, using fallback")
                 response = "I understand your message. Let's continue our negotiation."
 
             self.messages.append(("suspect", response))
@@ -266,7 +197,7 @@ class GameState:
                     self.messages.append(("system", "Time has run out. Negotiation failed."))
                 return False  # Return False to indicate game should end
         except Exception as e:
-            logging.error(f"Error processing AI response: {str(e)}")
+            logger.error("Error processing AI response: %s", e)
             self.messages.append(("system", "There was an issue with the negotiation. Please try again."))
             return False
         return True
@@ -283,37 +214,42 @@ class GameState:
             'tension': self.tension,
             'trust': self.trust,
             'hostages': self.hostages,
-            'messages': self.messages,
+            'messages': list(self.messages),
             'game_over': self.game_over,
             'success': self.success,
             'scenario_id': self.scenario.id if self.scenario else None,
             'good_choice_streak': self.good_choice_streak,
-            'promises_kept': self.promises_kept,
+            'promises_kept': list(self.promises_kept),
             'rapport': self.rapport,
             'hostages_released': self.hostages_released,
             'surrender_offered': self.surrender_offered,
             'poor_choices': self.poor_choices,
             'similar_inputs_count': self.similar_inputs_count,
             'last_input_type': self.last_input_type,
-            'emotional_appeals_count': self.emotional_appeals_count
+            'emotional_appeals_count': self.emotional_appeals_count,
+            'tactical_empathy_success': self.tactical_empathy_success,
+            'tactical_empathy_failure': self.tactical_empathy_failure,
+            'mirroring_count': self.mirroring_count,
+            'emotional_labeling_success': self.emotional_labeling_success,
+            'emotional_labeling_failure': self.emotional_labeling_failure
         }
 
     @classmethod
     def from_dict(cls, data):
-        from .models import Scenario
+        from .scenario_manager import ScenarioManager
         instance = cls(
             turn=data['turn'],
             tension=data['tension'],
             trust=data['trust'],
             hostages=data['hostages']
         )
-        instance.messages = data['messages']
+        instance.messages = [tuple(message) for message in data['messages']]
         instance.game_over = data['game_over']
         instance.success = data['success']
         if data.get('scenario_id'):
-            instance.scenario = Scenario.objects.get(id=data['scenario_id'])
+            instance.scenario = ScenarioManager.get(data['scenario_id'])
         instance.good_choice_streak = data.get('good_choice_streak', 0)
-        instance.promises_kept = data.get('promises_kept', [])
+        instance.promises_kept = list(data.get('promises_kept', []))
         instance.rapport = data.get('rapport', 0)
         instance.hostages_released = data.get('hostages_released', 0)
         instance.surrender_offered = data.get('surrender_offered', False)
@@ -321,6 +257,11 @@ class GameState:
         instance.similar_inputs_count = data.get('similar_inputs_count', 0)
         instance.last_input_type = data.get('last_input_type')
         instance.emotional_appeals_count = data.get('emotional_appeals_count', 0)
+        instance.tactical_empathy_success = data.get('tactical_empathy_success', 0)
+        instance.tactical_empathy_failure = data.get('tactical_empathy_failure', 0)
+        instance.mirroring_count = data.get('mirroring_count', 0)
+        instance.emotional_labeling_success = data.get('emotional_labeling_success', 0)
+        instance.emotional_labeling_failure = data.get('emotional_labeling_failure', 0)
         return instance
 
 def calculate_game_score(game_state):
@@ -356,9 +297,10 @@ def calculate_game_score(game_state):
 
     return round(final_score, 2)  # Return with 2 decimal places
 
+@metrics.timed('game.process_turn')
 def process_turn(game_state, choice):
     """Process a turn based on player's choice"""
-    logging.debug(f"Processing turn with choice: {choice}")
+    logger.debug("Processing turn with choice: %s", choice)
     
     # Check turn limit
     if game_state.turn >= 10:
@@ -373,7 +315,7 @@ def process_turn(game_state, choice):
     # Process the turn
     game_state.messages.append(("player", choice))
     response_type = game_state.detect_response_type(choice)
-    logging.debug(f"Detected response type: {response_type}")
+    logger.debug("Detected response type: %s", response_type)
     game_state.adjust_state(response_type)
 
     return True, "Turn processed successfully"
@@ -404,13 +346,13 @@ def save_game_score(user_id, game_state):
 
         return new_score
     except Exception as e:
-        logging.error(f"Error saving score: {str(e)}")
+        logger.error("Error saving score: %s", e)
         db.session.rollback()
         return None
 
 def release_hostages(self, surrender=False):
     """Handle the release of hostages"""
-    logging.debug(f"Releasing hostages, surrender={surrender}")
+    logger.debug("Releasing hostages, surrender=%s", surrender)
     if surrender:
         self.hostages_released = self.hostages
         self.hostages = 0  # All hostages are released
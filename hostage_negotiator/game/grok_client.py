@@ -1,37 +1,183 @@
 import os
 from dotenv import load_dotenv
+import asyncio
 import json
+import queue
 import random
-import requests
+import re
+import threading
+import time
 import logging
-from functools import lru_cache
-import hashlib
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+from asgiref.sync import sync_to_async
+
+from . import context_window, metrics, prompts
+from .circuit_breaker import grok_breaker
+from .flow_control import AsyncSingleFlight, GrokBusyError, RateLimiter, SingleFlight, fingerprint
+from .logs import log_payload
+from .response_cache import response_cache, make_cache_key, is_cacheable
+from .solver import get_hint
 
 # Load .env file
 load_dotenv()
 
 # Use uppercase for environment variables by convention
 API_KEY = os.getenv("API_KEY")
+API_URL = os.getenv("GROK_API_URL", "https://api.x.ai/v1/chat/completions")
+API_TIMEOUT = float(os.getenv("GROK_API_TIMEOUT", "15"))
+
+# Connection pool shared by every request in the process
+MAX_CONNECTIONS = int(os.getenv("GROK_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GROK_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("GROK_KEEPALIVE_EXPIRY", "30"))
+MAX_REQUESTS_PER_HOST = int(os.getenv("GROK_MAX_REQUESTS_PER_HOST", "10"))
+# How long a call may queue for a request slot before falling back
+QUEUE_TIMEOUT = float(os.getenv("GROK_QUEUE_TIMEOUT", "5"))
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
-@lru_cache(maxsize=1000)
-def get_cached_response(input_hash, tension, suspect_type):
-    """Cache for AI responses based on input and context"""
-    return None
+class GrokAPIError(Exception):
+    """Raised when the Grok API answers a streaming request with an error"""
+
+_client_lock = threading.Lock()
+_sync_client = None
+_sync_host_limits = {}
+# (event loop, AsyncClient, per-host semaphores) for the loop that created them
+_async_state = None
+
+# Identical in-flight payloads share one upstream call
+_single_flight = SingleFlight()
+_async_single_flight = AsyncSingleFlight()
+_rate_limiter = RateLimiter('grok')
+
+def _client_options():
+    """Keyword arguments shared by the sync and async pooled clients"""
+    return {
+        "http2": HTTP2_AVAILABLE,
+        "timeout": httpx.Timeout(API_TIMEOUT, connect=5.0),
+        "limits": httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        "headers": {"Content-Type": "application/json"},
+    }
 
+def get_http_client():
+    """Return the process-wide pooled HTTP client used for Grok calls"""
+    global _sync_client
+    if _sync_client is None:
+        with _client_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(**_client_options())
+    return _sync_client
+
+def get_async_http_client():
+    """Return the pooled async HTTP client bound to the running event loop"""
+    return _get_async_state()[1]
+
+def _get_async_state():
+    global _async_state
+    loop = asyncio.get_running_loop()
+    if _async_state is None or _async_state[0] is not loop:
+        # Connections can't be shared across event loops, so a new loop gets a new pool
+        _async_state = (loop, httpx.AsyncClient(**_client_options()), {})
+    return _async_state
+
+def close_http_clients():
+    """Close the sync pool; the async pool is closed with ``aclose_http_clients``"""
+    global _sync_client
+    with _client_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+        _sync_host_limits.clear()
+
+async def aclose_http_clients():
+    """Close the async pool owned by the running event loop"""
+    global _async_state
+    if _async_state is not None and _async_state[0] is asyncio.get_running_loop():
+        await _async_state[1].aclose()
+        _async_state = None
+
+def _queue_timeout(host):
+    metrics.increment('grok_queue_timeouts')
+    raise GrokBusyError(f"No request slot for {host} within {QUEUE_TIMEOUT}s")
+
+@contextmanager
+def _host_limit(url):
+    """Cap in-flight requests per upstream host (per process) and per second (per deployment)
+
+    Callers over either limit queue for up to ``QUEUE_TIMEOUT`` seconds, then get ``GrokBusyError``.
+    """
+    host = urlsplit(url).netloc
+    deadline = time.time() + QUEUE_TIMEOUT
+    with _client_lock:
+        semaphore = _sync_host_limits.get(host)
+        if semaphore is None:
+            semaphore = _sync_host_limits[host] = threading.BoundedSemaphore(MAX_REQUESTS_PER_HOST)
+    if not semaphore.acquire(timeout=QUEUE_TIMEOUT):
+        _queue_timeout(host)
+    try:
+        _rate_limiter.acquire(deadline)
+        yield
+    finally:
+        semaphore.release()
+
+@asynccontextmanager
+async def _async_host_limit(url):
+    """Async counterpart of ``_host_limit`` for the running event loop"""
+    host = urlsplit(url).netloc
+    deadline = time.time() + QUEUE_TIMEOUT
+    semaphores = _get_async_state()[2]
+    semaphore = semaphores.get(host)
+    if semaphore is None:
+        semaphore = semaphores[host] = asyncio.Semaphore(MAX_REQUESTS_PER_HOST)
+    try:
+        await asyncio.wait_for(semaphore.acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _queue_timeout(host)
+    try:
+        await _rate_limiter.aacquire(deadline)
+        yield
+    finally:
+        semaphore.release()
+
+def get_cache_key(game_state, choice, offer=None):
+    """Response cache key for this turn, or None when the turn shouldn't be cached"""
+    if offer or not response_cache.enabled or not is_cacheable(game_state.scenario):
+        return None
+    return make_cache_key(game_state, choice)
+
+async def aget_cache_key(game_state, choice, offer=None):
+    """``get_cache_key`` off the event loop; the key renders the history section, which uses the Django cache"""
+    return await sync_to_async(get_cache_key, thread_sensitive=False)(game_state, choice, offer)
+
+def get_reply_text(response):
+    """The suspect's line from a successful API response, or None for fallbacks"""
+    if response.get('fallback') or not response.get('choices'):
+        return None
+    return response['choices'][0]['message']['content']
+
+@metrics.timed('grok.get_ai_response')
 def get_ai_response(game_state, choice, offer=None, green_beret_action=None):
     """Generate an AI response based on game state and player choice."""
     try:
-        # Generate cache key
-        cache_key = hashlib.md5(
-            f"{choice}:{game_state.tension}:{game_state.scenario.suspect_type}".encode()
-        ).hexdigest()
-
         # Check cache first
-        cached_response = get_cached_response(cache_key, game_state.tension, game_state.scenario.suspect_type)
-        if cached_response:
-            return cached_response
+        cache_key = None if green_beret_action else get_cache_key(game_state, choice, offer)
+        if cache_key:
+            cached_reply = response_cache.get(cache_key)
+            if cached_reply is not None:
+                return json.dumps(build_ai_response(cached_reply, game_state))
 
         if not API_KEY:
             return json.dumps(get_mock_response(game_state))
@@ -47,6 +193,11 @@ def get_ai_response(game_state, choice, offer=None, green_beret_action=None):
         if green_beret_action:
             return handle_green_beret_scenario(game_state, green_beret_action)
 
+        # Answer right away while the API is failing instead of tying up the worker
+        if not grok_breaker.allow_request():
+            metrics.increment('grok_fallbacks')
+            return json.dumps(get_mock_response(game_state))
+
         # Build system message
         system_message = build_system_message(game_state, emotional_state)
 
@@ -60,12 +211,56 @@ def get_ai_response(game_state, choice, offer=None, green_beret_action=None):
         processed_response = process_api_response(response, game_state)
         
         # Cache the response
-        get_cached_response(cache_key, tension_level, game_state.scenario.suspect_type)
+        reply = get_reply_text(response)
+        if cache_key and reply is not None:
+            response_cache.set(cache_key, reply)
         
         return json.dumps(processed_response)
 
     except Exception as e:
-        logger.error(f"Error in get_ai_response: {e}")
+        logger.error("Error in get_ai_response: %s", e)
+        metrics.increment('grok_api_errors')
+        metrics.increment('grok_fallbacks')
+        return json.dumps(get_fallback_response(game_state.tension))
+
+@metrics.timed('grok.get_ai_response')
+async def get_ai_response_async(game_state, choice, offer=None, green_beret_action=None):
+    """Async variant of ``get_ai_response`` for ASGI views; shares the same prompt and parsing logic."""
+    try:
+        cache_key = None if green_beret_action else await aget_cache_key(game_state, choice, offer)
+        if cache_key:
+            cached_reply = await response_cache.aget(cache_key)
+            if cached_reply is not None:
+                return json.dumps(build_ai_response(cached_reply, game_state))
+
+        if not API_KEY:
+            return json.dumps(get_mock_response(game_state))
+
+        emotional_state = get_emotional_state(game_state.tension)
+
+        if green_beret_action:
+            return handle_green_beret_scenario(game_state, green_beret_action)
+
+        if not await grok_breaker.aallow_request():
+            metrics.increment('grok_fallbacks')
+            return json.dumps(get_mock_response(game_state))
+
+        system_message = build_system_message(game_state, emotional_state)
+        user_prompt = await abuild_user_prompt(game_state, choice, offer, emotional_state)
+
+        response = await make_api_call_async(system_message, user_prompt)
+        processed_response = process_api_response(response, game_state)
+
+        reply = get_reply_text(response)
+        if cache_key and reply is not None:
+            await response_cache.aset(cache_key, reply)
+
+        return json.dumps(processed_response)
+
+    except Exception as e:
+        logger.error("Error in get_ai_response_async: %s", e)
+        metrics.increment('grok_api_errors')
+        metrics.increment('grok_fallbacks')
         return json.dumps(get_fallback_response(game_state.tension))
 
 def get_emotional_state(tension):
@@ -87,42 +282,21 @@ def handle_green_beret_scenario(game_state, action_type):
         return handle_tactical_intervention(game_state)
 
 def build_system_message(game_state, emotional_state):
-    """Build the system message for the AI"""
-    return f"""You are a highly realistic hostage-taker AI in a {emotional_state} state.
-Current Profile:
-- Tension: {game_state.tension}/10
-- Trust: {game_state.trust}/10
-- Hostages: {game_state.hostages - game_state.hostages_released}
-- Demand: {game_state.scenario.demand}
-
-Emotional State Rules:
-{get_emotional_state_rules(emotional_state)}"""
+    """Build the system message for the AI; identical on every turn of a scenario (see game/prompts.py)"""
+    return prompts.system_message(game_state.scenario)
 
 def build_user_prompt(game_state, choice, offer, emotional_state):
-    """Build the user prompt for the AI"""
-    return f"""Current Situation:
-Turn: {game_state.turn}/10
-Tension: {game_state.tension}/10
-Trust: {game_state.trust}/10
-Emotional State: {emotional_state}
-
-Negotiator Says: "{choice}"
-{f'Offer: {offer}' if offer else ''}
-
-Generate a response that:
-1. Matches tension level ({game_state.tension}/10)
-2. Shows authentic crisis behavior
-3. Maintains scenario consistency
-4. Keeps focus on demands"""
+    """Build the user prompt for the AI: bounded history plus everything that changes per turn"""
+    history = context_window.history_section(game_state.messages)
+    return prompts.user_prompt(game_state, choice, offer, emotional_state, history)
 
-def make_api_call(system_message, user_prompt):
-    """Make the API call to the AI service"""
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
+async def abuild_user_prompt(game_state, choice, offer, emotional_state):
+    """``build_user_prompt`` off the event loop; the history summary reads and writes the Django cache"""
+    return await sync_to_async(build_user_prompt, thread_sensitive=False)(game_state, choice, offer, emotional_state)
+
+def build_payload(system_message, user_prompt):
+    """Build the chat completions request body"""
+    return {
         "model": "grok-2",  # Updated model name
         "messages": [
             {"role": "system", "content": system_message},
@@ -131,26 +305,263 @@ def make_api_call(system_message, user_prompt):
         "max_tokens": 150,
         "temperature": 0.7
     }
-    
-    logger.debug("Making API call to Grok")
-    logger.debug(f"Payload: {payload}")
-    
-    response = requests.post(
-        "https://api.x.ai/v1/chat/completions",
-        json=payload,
-        headers=headers,
-        timeout=15
-    )
-    
-    logger.debug(f"API response status: {response.status_code}")
-    logger.debug(f"API response content: {response.text}")
-    
+
+def _auth_headers():
+    return {"Authorization": f"Bearer {API_KEY}"}
+
+def _request_timeout(seconds):
+    return httpx.Timeout(seconds, connect=min(5.0, seconds))
+
+def _is_healthy(status_code):
+    """Whether a response counts as a success for the circuit breaker; client errors other than 429 do"""
+    return status_code < 500 and status_code != 429
+
+def _parse_api_response(response):
+    """Turn an HTTP response into the chat completions dict, falling back on errors"""
+    logger.debug("API response status: %s", response.status_code)
+    log_payload(logger, "API response content", response.text)
+
     if response.status_code != 200:
-        logger.error(f"API error: {response.text}")
-        return {"choices": [{"message": {"content": get_fallback_response(0)["suspect_response"]}}]}
-        
+        logger.error("API error %s: %.500s", response.status_code, response.text)
+        metrics.increment('grok_api_errors')
+        metrics.increment('grok_fallbacks')
+        return {
+            "choices": [{"message": {"content": get_fallback_response(0)["suspect_response"]}}],
+            "fallback": True
+        }
+
     return response.json()
 
+@metrics.timed('grok.api_call')
+def make_api_call(system_message, user_prompt):
+    """Make the API call to the AI service over the pooled keep-alive client"""
+    payload = build_payload(system_message, user_prompt)
+
+    logger.debug("Making API call to Grok")
+    log_payload(logger, "Payload", payload)
+
+    return _single_flight.do(fingerprint(payload), lambda: _post(payload))
+
+def _post(payload):
+    """POST ``payload`` under the request limits, reporting the outcome to the circuit breaker"""
+    metrics.increment('grok_prompt_tokens_estimated', prompts.estimate_payload_tokens(payload)['prompt'])
+    timeout = _request_timeout(grok_breaker.timeout(API_TIMEOUT))
+    with _host_limit(API_URL):
+        started = time.perf_counter()
+        try:
+            response = get_http_client().post(API_URL, json=payload, headers=_auth_headers(), timeout=timeout)
+        except httpx.HTTPError:
+            grok_breaker.record(time.perf_counter() - started, False)
+            raise
+    grok_breaker.record(time.perf_counter() - started, _is_healthy(response.status_code))
+
+    return _parse_api_response(response)
+
+@metrics.timed('grok.api_call')
+async def make_api_call_async(system_message, user_prompt):
+    """Async variant of ``make_api_call``"""
+    payload = build_payload(system_message, user_prompt)
+
+    logger.debug("Making async API call to Grok")
+    log_payload(logger, "Payload", payload)
+
+    return await _async_single_flight.do(fingerprint(payload), lambda: _apost(payload))
+
+async def _apost(payload):
+    """Async variant of ``_post``"""
+    metrics.increment('grok_prompt_tokens_estimated', prompts.estimate_payload_tokens(payload)['prompt'])
+    timeout = _request_timeout(await grok_breaker.atimeout(API_TIMEOUT))
+    async with _async_host_limit(API_URL):
+        started = time.perf_counter()
+        try:
+            response = await get_async_http_client().post(API_URL, json=payload, headers=_auth_headers(),
+                                                          timeout=timeout)
+        except httpx.HTTPError:
+            await grok_breaker.arecord(time.perf_counter() - started, False)
+            raise
+    await grok_breaker.arecord(time.perf_counter() - started, _is_healthy(response.status_code))
+
+    return _parse_api_response(response)
+
+def _parse_stream_line(line, state):
+    """Parse one server-sent event line; returns the text delta, or None"""
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        state["done"] = True
+        return None
+    choices = json.loads(data).get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content")
+
+# Marks the end of a streamed reply in the reader's queue
+_STREAM_END = object()
+# Reader tasks still draining upstream after their consumer went away
+_background_reads = set()
+
+def _stream_payload(system_message, user_prompt):
+    payload = build_payload(system_message, user_prompt)
+    payload["stream"] = True
+    return payload
+
+def _read_stream(payload, deltas):
+    """Read a streaming reply into ``deltas`` under the host limit; runs on its own thread"""
+    state = {"done": False}
+    recorded = False
+    try:
+        with _host_limit(API_URL):
+            try:
+                with get_http_client().stream("POST", API_URL, json=payload, headers=_auth_headers()) as response:
+                    grok_breaker.record(None, _is_healthy(response.status_code))
+                    recorded = True
+                    if response.status_code != 200:
+                        response.read()
+                        raise GrokAPIError(f"API error {response.status_code}: {response.text}")
+                    for line in response.iter_lines():
+                        delta = _parse_stream_line(line, state)
+                        if delta:
+                            deltas.put(delta)
+                        if state["done"]:
+                            break
+            except httpx.HTTPError:
+                if not recorded:
+                    grok_breaker.record(None, False)
+                raise
+    except Exception as e:
+        deltas.put(e)
+    finally:
+        deltas.put(_STREAM_END)
+
+def stream_api_call(system_message, user_prompt):
+    """Yield reply text deltas from a ``stream=True`` chat completions call
+
+    A reader thread holds the host slot only while Grok is sending; a slow
+    or stalled client reads from the buffered deltas without holding it.
+    """
+    logger.debug("Making streaming API call to Grok")
+    deltas = queue.SimpleQueue()
+    threading.Thread(target=_read_stream, args=(_stream_payload(system_message, user_prompt), deltas),
+                     daemon=True).start()
+    while True:
+        item = deltas.get()
+        if item is _STREAM_END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+async def _aread_stream(payload, deltas):
+    """Async counterpart of ``_read_stream``; runs as its own task"""
+    state = {"done": False}
+    recorded = False
+    try:
+        async with _async_host_limit(API_URL):
+            try:
+                async with get_async_http_client().stream("POST", API_URL, json=payload,
+                                                           headers=_auth_headers()) as response:
+                    await grok_breaker.arecord(None, _is_healthy(response.status_code))
+                    recorded = True
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise GrokAPIError(f"API error {response.status_code}: {response.text}")
+                    async for line in response.aiter_lines():
+                        delta = _parse_stream_line(line, state)
+                        if delta:
+                            deltas.put_nowait(delta)
+                        if state["done"]:
+                            break
+            except httpx.HTTPError:
+                if not recorded:
+                    await grok_breaker.arecord(None, False)
+                raise
+    except Exception as e:
+        deltas.put_nowait(e)
+    finally:
+        deltas.put_nowait(_STREAM_END)
+
+async def stream_api_call_async(system_message, user_prompt):
+    """Async variant of ``stream_api_call``; the upstream read is a separate task"""
+    logger.debug("Making async streaming API call to Grok")
+    deltas = asyncio.Queue()
+    task = asyncio.ensure_future(_aread_stream(_stream_payload(system_message, user_prompt), deltas))
+    # Keep a reference so the read finishes (and frees its slot) even if this generator is dropped
+    _background_reads.add(task)
+    task.add_done_callback(_background_reads.discard)
+    while True:
+        item = await deltas.get()
+        if item is _STREAM_END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+def chunk_text(text):
+    """Split a complete reply into word-sized chunks so it can be streamed like a live one"""
+    return re.findall(r"\S+\s*", text)
+
+def stream_ai_response(game_state, choice, offer=None):
+    """Yield the suspect's reply in chunks from the cache, the mock, the streaming API or the fallback."""
+    cache_key = get_cache_key(game_state, choice, offer)
+    if cache_key:
+        cached_reply = response_cache.get(cache_key)
+        if cached_reply is not None:
+            yield from chunk_text(cached_reply)
+            return
+
+    if not API_KEY or not grok_breaker.allow_request():
+        yield from chunk_text(get_mock_response(game_state)["suspect_response"])
+        return
+
+    emitted = []
+    try:
+        emotional_state = get_emotional_state(game_state.tension)
+        system_message = build_system_message(game_state, emotional_state)
+        user_prompt = build_user_prompt(game_state, choice, offer, emotional_state)
+        for delta in stream_api_call(system_message, user_prompt):
+            emitted.append(delta)
+            yield delta
+    except Exception as e:
+        logger.error("Error in stream_ai_response: %s", e)
+        if not emitted:
+            yield from chunk_text(get_fallback_response(game_state.tension)["suspect_response"])
+        return
+
+    if cache_key and emitted:
+        response_cache.set(cache_key, "".join(emitted))
+
+async def stream_ai_response_async(game_state, choice, offer=None):
+    """Async variant of ``stream_ai_response``"""
+    cache_key = await aget_cache_key(game_state, choice, offer)
+    if cache_key:
+        cached_reply = await response_cache.aget(cache_key)
+        if cached_reply is not None:
+            for chunk in chunk_text(cached_reply):
+                yield chunk
+            return
+
+    if not API_KEY or not await grok_breaker.aallow_request():
+        for chunk in chunk_text(get_mock_response(game_state)["suspect_response"]):
+            yield chunk
+        return
+
+    emitted = []
+    try:
+        emotional_state = get_emotional_state(game_state.tension)
+        system_message = build_system_message(game_state, emotional_state)
+        user_prompt = await abuild_user_prompt(game_state, choice, offer, emotional_state)
+        async for delta in stream_api_call_async(system_message, user_prompt):
+            emitted.append(delta)
+            yield delta
+    except Exception as e:
+        logger.error("Error in stream_ai_response_async: %s", e)
+        if not emitted:
+            for chunk in chunk_text(get_fallback_response(game_state.tension)["suspect_response"]):
+                yield chunk
+        return
+
+    if cache_key and emitted:
+        await response_cache.aset(cache_key, "".join(emitted))
+
 def get_mock_response(game_state):
     """Generate more realistic mock responses based on game state"""
     emotional_state = game_state.get_emotional_state()
@@ -191,15 +602,8 @@ def get_mock_response(game_state):
     }
 
 def get_contextual_hint(game_state):
-    """Generate contextual hints based on game state"""
-    if game_state.tension >= 8:
-        return "Tension is very high. Focus on de-escalation."
-    elif game_state.trust <= 3:
-        return "Trust is low. Show empathy and understanding."
-    elif game_state.turn >= 8:
-        return "Time is running out. Consider making a significant offer."
-    else:
-        return "Keep building rapport through active listening."
+    """Hint for the solver's optimal next move (see game/solver.py)"""
+    return get_hint(game_state)
 
 def get_fallback_response(tension):
     """Get fallback response based on tension level"""
@@ -253,18 +657,12 @@ History:
         return response.choices[0].message.content
 
     except Exception as e:
-        logging.error(f"Error generating game analysis: {e}")
+        logger.error("Error generating game analysis: %s", e)
         return "Unable to generate analysis at this time. Please try again later."
 
 def get_emotional_state_rules(emotional_state):
     """Get rules for different emotional states"""
-    rules = {
-        'volatile': "Highly unstable, prone to violent outbursts, requires extreme caution",
-        'agitated': "Easily provoked, needs reassurance, sensitive to threats",
-        'strategic': "Calculated responses, focused on demands, evaluates options",
-        'resigned': "More open to negotiation, showing signs of fatigue or doubt"
-    }
-    return rules.get(emotional_state, rules['strategic'])
+    return prompts.get_emotional_state_rules(emotional_state)
 
 def process_api_response(response, game_state):
     """Process the API response and format it for the game"""
@@ -273,35 +671,33 @@ def process_api_response(response, game_state):
             return get_fallback_response(game_state.tension)
 
         ai_message = response['choices'][0]['message']['content']
-        
-        # Calculate remaining hostages
-        remaining_hostages = game_state.hostages - game_state.hostages_released
-        
-        # Add the AI response to messages
-        game_state.messages.append(("suspect", ai_message))
-        
-        return {
-            "tension_level": game_state.tension,
-            "trust_level": game_state.trust,
-            "suspect_response": ai_message,
-            "counter_offer": None,
-            "daily_hint": get_contextual_hint(game_state),
-            "hostage_count": remaining_hostages,
-            "turn_count": game_state.turn,
-            "hostages_released": game_state.hostages_released,
-            "messages": game_state.messages  # Include updated messages
-        }
+        return build_ai_response(ai_message, game_state)
     except Exception as e:
-        logger.error(f"Error processing API response: {e}")
+        logger.error("Error processing API response: %s", e)
         return get_fallback_response(game_state.tension)
 
+def build_ai_response(ai_message, game_state):
+    """Record the suspect's reply on the game state and format it for the game"""
+    # Calculate remaining hostages
+    remaining_hostages = game_state.hostages - game_state.hostages_released
+    
+    # Add the AI response to messages
+    game_state.messages.append(("suspect", ai_message))
+    
+    return {
+        "tension_level": game_state.tension,
+        "trust_level": game_state.trust,
+        "suspect_response": ai_message,
+        "counter_offer": None,
+        "daily_hint": get_contextual_hint(game_state),
+        "hostage_count": remaining_hostages,
+        "turn_count": game_state.turn,
+        "hostages_released": game_state.hostages_released,
+        "messages": game_state.messages  # Include updated messages
+    }
+
 def test_grok_connection():
     """Test the Grok API connection"""
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     payload = {
         "model": "grok-2",  # Updated model name
         "messages": [
@@ -312,18 +708,13 @@ def test_grok_connection():
     }
     
     try:
-        response = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            json=payload,
-            headers=headers,
-            timeout=15
-        )
+        response = get_http_client().post(API_URL, json=payload, headers=_auth_headers())
         
-        logger.debug(f"Test API status: {response.status_code}")
-        logger.debug(f"Test API response: {response.text}")
+        logger.debug("Test API status: %s", response.status_code)
+        logger.debug("Test API response: %s", response.text)
         
         return response.status_code == 200
         
     except Exception as e:
-        logger.error(f"Test API error: {e}")
+        logger.error("Test API error: %s", e)
         return False
@@ -0,0 +1,106 @@
+"""Local stand-in for the Grok chat completions endpoint.
+
+Used by the benchmark commands and tests so the HTTP path can be exercised
+without an API key or network access.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_REPLY = "I'm listening. Tell me what happens next."
+
+
+class StubGrokHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection alive between calls
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.request_count += 1
+
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        if self.server.status != 200:
+            self._error_reply()
+            return
+
+        if request.get("stream"):
+            self._stream_reply()
+            return
+
+        body = json.dumps({
+            "id": f"stub-{self.server.request_count}",
+            "object": "chat.completion",
+            "model": "grok-2",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.server.reply},
+                "finish_reason": "stop"
+            }]
+        }).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error_reply(self):
+        body = json.dumps({"error": "stub error"}).encode()
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_reply(self):
+        """Answer as server-sent events, one word per chunk, using chunked transfer encoding"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        for word in re.findall(r"\S+\s*", self.server.reply):
+            event = {
+                "id": f"stub-{self.server.request_count}",
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]
+            }
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_stub_server(host="127.0.0.1", port=0, delay=0.0, reply=STUB_REPLY, token_delay=0.0, status=200):
+    """Create (but don't start) a stub server; ``port=0`` picks a free port"""
+    server = ThreadingHTTPServer((host, port), StubGrokHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.token_delay = token_delay
+    server.reply = reply
+    server.status = status
+    server.request_count = 0
+    return server
+
+
+def start_stub_server(**kwargs):
+    """Start a stub server on a background thread and return (server, url)"""
+    server = make_stub_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1/chat/completions"
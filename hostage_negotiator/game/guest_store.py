@@ -0,0 +1,185 @@
+"""Where a guest's in-progress game lives between turns.
+
+A guest game is a small dict: ``scenario_name``, ``start_time`` and the
+session-codec encoded ``game_state`` (see game/session_codec.py). Two
+backends are available:
+
+- ``session`` (the default): the dict is stored in the Django session, so
+  every turn rewrites the session row, and the row lives as long as the
+  session cookie.
+- ``cached_db``: the session holds only a random game key, written once
+  when the game starts. Each turn writes the dict to a Django cache, which
+  must be shared between workers (Redis or Memcached). It is written
+  behind to a ``GuestGame`` row when the game starts, when it ends, and
+  otherwise at most every ``FLUSH_SECONDS``.
+
+A ``cached_db`` cache miss (an evicted entry, or a cache restart) falls back
+to the row, which can be up to ``FLUSH_SECONDS`` behind. The turns played
+since the last flush are lost and the guest plays them again. Every
+fallback is counted in ``guest_game_cache_misses`` and logged with the
+row's age. Set ``FLUSH_SECONDS`` to 0 to write every turn through.
+
+A per-process cache such as the default ``LocMemCache`` would send every
+worker to a different copy of the game. ``check_config`` refuses it at
+startup unless ``ALLOW_LOCAL_CACHE`` is set, which is meant for tests and
+single-process runs.
+
+Abandoned games expire from the cache after ``TTL`` seconds of inactivity.
+Their rows are ignored after the same time and are deleted by
+``manage.py cleanup_guest_games``. Finished games are removed right away.
+
+Configured through ``settings.GUEST_GAME_STORE``::
+
+    GUEST_GAME_STORE = {
+        'BACKEND': 'session',        # 'session' or 'cached_db'
+        'CACHE_ALIAS': 'default',    # must be shared by every worker
+        'ALLOW_LOCAL_CACHE': False,  # accept a per-process cache anyway
+        'TTL': 7200,                 # seconds an idle guest game is kept
+        'FLUSH_SECONDS': 30,         # longest gap between database writes
+    }
+"""
+import logging
+import secrets
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from . import metrics
+from .flow_control import LOCAL_CACHE_BACKENDS
+from .models import GuestGame
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BACKEND': 'session',
+    'CACHE_ALIAS': 'default',
+    'ALLOW_LOCAL_CACHE': False,
+    'TTL': 7200,
+    'FLUSH_SECONDS': 30,
+}
+
+SESSION_ATTEMPT = 'guest_current_attempt'
+SESSION_GAME_KEY = 'guest_game'
+KEY_PREFIX = 'guest-game'
+
+BACKENDS = ('session', 'cached_db')
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GUEST_GAME_STORE', {})}
+
+
+def check_config():
+    """Raise ImproperlyConfigured for an unknown backend, or ``cached_db`` on a per-process cache"""
+    config = get_config()
+    if config['BACKEND'] not in BACKENDS:
+        raise ImproperlyConfigured(f"GUEST_GAME_STORE['BACKEND'] must be one of {BACKENDS}, not {config['BACKEND']!r}")
+    if config['BACKEND'] != 'cached_db' or config['ALLOW_LOCAL_CACHE']:
+        return
+    alias = config['CACHE_ALIAS']
+    if alias not in settings.CACHES:
+        raise ImproperlyConfigured(f"GUEST_GAME_STORE['CACHE_ALIAS'] {alias!r} is not in CACHES")
+    if settings.CACHES[alias]['BACKEND'] in LOCAL_CACHE_BACKENDS:
+        raise ImproperlyConfigured(
+            f"The cached_db guest store needs a cache shared by all workers, but CACHES[{alias!r}] is "
+            f"{settings.CACHES[alias]['BACKEND']}; configure Redis or Memcached, or use the session backend"
+        )
+
+
+class SessionGuestStore:
+    """The whole game in the session; rewritten with the session on every turn"""
+
+    def load(self, session):
+        return session.get(SESSION_ATTEMPT)
+
+    def save(self, session, attempt, finished=False):
+        session[SESSION_ATTEMPT] = attempt
+
+    def discard(self, session):
+        session.pop(SESSION_ATTEMPT, None)
+
+
+class CachedDbGuestStore:
+    """The game in a shared cache, written behind to ``GuestGame``; the session only keeps its key"""
+
+    def __init__(self, config, clock=time.time):
+        self.config = config
+        self.clock = clock
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    def cache_key(self, key):
+        return f"{KEY_PREFIX}:{key}"
+
+    def get(self, key):
+        """The game stored under ``key``, from the cache or else its row; None once it has expired"""
+        entry = self.cache.get(self.cache_key(key))
+        if entry is not None:
+            return entry['attempt']
+        metrics.increment('guest_game_cache_misses')
+        now = timezone.now()
+        row = GuestGame.objects.filter(
+            key=key, updated_at__gte=now - timedelta(seconds=self.config['TTL'])
+        ).only('data', 'updated_at').first()
+        if row is None:
+            return None
+        logger.warning("Guest game %s not in the cache; restored its row from %.0fs ago, later turns are lost",
+                       key, (now - row.updated_at).total_seconds())
+        # The row is as fresh as the last flush, so the next save doesn't need to write it again
+        self.cache.set(self.cache_key(key), {'attempt': row.data, 'flushed_at': self.clock()}, self.config['TTL'])
+        return row.data
+
+    def load(self, session):
+        key = session.get(SESSION_GAME_KEY)
+        if not key:
+            # A game started while guests were stored in the session; it moves over on its next save
+            return session.get(SESSION_ATTEMPT)
+        return self.get(key)
+
+    def _flush(self, key, attempt):
+        metrics.increment('guest_game_flushes')
+        if not GuestGame.objects.filter(key=key).update(data=attempt, updated_at=timezone.now()):
+            GuestGame.objects.create(key=key, data=attempt)
+
+    def save(self, session, attempt, finished=False):
+        """Cache the game; its row is written on the first save, when ``finished`` and once the last write is stale"""
+        key = session.get(SESSION_GAME_KEY)
+        entry = None
+        if key is None:
+            key = session[SESSION_GAME_KEY] = secrets.token_hex(16)
+            session.pop(SESSION_ATTEMPT, None)
+        else:
+            entry = self.cache.get(self.cache_key(key))
+        now = self.clock()
+        flushed_at = entry['flushed_at'] if entry else None
+        if finished or flushed_at is None or now - flushed_at >= self.config['FLUSH_SECONDS']:
+            self._flush(key, attempt)
+            flushed_at = now
+        self.cache.set(self.cache_key(key), {'attempt': attempt, 'flushed_at': flushed_at}, self.config['TTL'])
+
+    def discard(self, session):
+        key = session.pop(SESSION_GAME_KEY, None)
+        session.pop(SESSION_ATTEMPT, None)
+        if key:
+            self.cache.delete(self.cache_key(key))
+            GuestGame.objects.filter(key=key).delete()
+
+
+def get_store():
+    config = get_config()
+    if config['BACKEND'] == 'session':
+        return SessionGuestStore()
+    return CachedDbGuestStore(config)
+
+
+def cleanup(older_than=None):
+    """Delete rows of guest games idle for ``older_than`` seconds (``TTL`` by default); returns the count"""
+    seconds = get_config()['TTL'] if older_than is None else older_than
+    deleted, _ = GuestGame.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=seconds)).delete()
+    logger.info("Deleted %s abandoned guest games", deleted)
+    return deleted
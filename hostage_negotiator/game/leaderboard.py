@@ -0,0 +1,154 @@
+"""Materialized daily and all-time leaderboards.
+
+Each board keeps at most ``SIZE`` ``LeaderboardEntry`` rows. ``record_score``
+is called when a score is saved. It adds the score only if it beats the
+board's current minimum, then trims the board back to ``SIZE``. Reading a
+board never touches the ``Score`` table. The top lists, already flattened
+into plain rows for the template, are cached until the board changes.
+
+Configured through ``settings.LEADERBOARD``::
+
+    LEADERBOARD = {
+        'SIZE': 10,            # entries kept per board
+        'CACHE_TIMEOUT': 300,  # seconds a rendered board stays cached
+    }
+
+``manage.py rebuild_leaderboard`` recreates every board from ``Score``.
+"""
+import heapq
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .dates import utc_day
+from .models import LeaderboardEntry, Score
+
+logger = logging.getLogger(__name__)
+
+DAILY = 'daily'
+ALL_TIME = 'all_time'
+
+DEFAULTS = {
+    'SIZE': 10,
+    'CACHE_TIMEOUT': 300,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LEADERBOARD', {})}
+
+
+def cache_key(board, day=None):
+    return f'leaderboard:{board}:{day.isoformat() if day else ""}'
+
+
+def boards_for(score):
+    """The (board, day) pairs a score competes on"""
+    return [(DAILY, utc_day(score.created_at)), (ALL_TIME, None)]
+
+
+def record_score(score):
+    """Add a freshly saved score to every board it qualifies for"""
+    size = get_config()['SIZE']
+    for board, day in boards_for(score):
+        with transaction.atomic():
+            entries = LeaderboardEntry.objects.select_for_update().filter(board=board, day=day)
+            values = sorted(entries.values_list('value', flat=True), reverse=True)
+            if len(values) >= size and score.score <= values[size - 1]:
+                continue
+            LeaderboardEntry.objects.create(
+                board=board, day=day, score=score, value=score.score, created_at=score.created_at
+            )
+            _trim(board, day, size)
+        cache.delete(cache_key(board, day))
+
+
+def _trim(board, day, size):
+    """Delete everything below the top ``size`` entries of a board"""
+    overflow = LeaderboardEntry.objects.filter(board=board, day=day).order_by(
+        '-value', 'created_at', 'id'
+    ).values_list('id', flat=True)[size:]
+    overflow = list(overflow)
+    if overflow:
+        LeaderboardEntry.objects.filter(id__in=overflow).delete()
+
+
+def top_scores(board, day=None):
+    """Rows of ``{'username', 'scenario_name', 'score'}`` for one board, best first"""
+    if board == DAILY and day is None:
+        day = utc_day(timezone.now())
+    key = cache_key(board, day)
+    rows = cache.get(key)
+    if rows is None:
+        config = get_config()
+        entries = LeaderboardEntry.objects.filter(board=board, day=day).select_related(
+            'score__user'
+        ).order_by('-value', 'created_at', 'id')[:config['SIZE']]
+        rows = [
+            {
+                'username': entry.score.user.username if entry.score.user else None,
+                'scenario_name': entry.score.scenario_name,
+                'score': entry.value,
+            }
+            for entry in entries
+        ]
+        cache.set(key, rows, config['CACHE_TIMEOUT'])
+    return rows
+
+
+def daily_top_scores():
+    return top_scores(DAILY)
+
+
+def all_time_top_scores():
+    return top_scores(ALL_TIME)
+
+
+def rebuild(since=None):
+    """Recreate the boards from ``Score`` history. Returns the number of entries written.
+
+    With ``since`` (a date), only daily boards from that day on are rebuilt;
+    the all-time board is always rebuilt in full.
+    """
+    size = get_config()['SIZE']
+    # Bounded min-heaps per board: (value, -created_at order, id)
+    heaps = {}
+    # Rows copied in by the old update_all_time_leaderboard are duplicates of daily scores
+    scores = Score.objects.filter(is_daily=True).values_list('id', 'score', 'created_at').order_by('id')
+    for score_id, value, created_at in scores.iterator():
+        day = utc_day(created_at)
+        keys = [(ALL_TIME, None)]
+        if since is None or day >= since:
+            keys.append((DAILY, day))
+        for board_key in keys:
+            heap = heaps.setdefault(board_key, [])
+            # Ties keep the earlier score, matching the read order of top_scores
+            item = (value, -created_at.timestamp(), -score_id, created_at)
+            if len(heap) < size:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    with transaction.atomic():
+        stale = LeaderboardEntry.objects.filter(board=ALL_TIME)
+        daily = LeaderboardEntry.objects.filter(board=DAILY)
+        if since is not None:
+            daily = daily.filter(day__gte=since)
+        stale_keys = {(ALL_TIME, None)} | set(daily.values_list('board', 'day').distinct())
+        stale.delete()
+        daily.delete()
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(board=board, day=day, score_id=-neg_id, value=value, created_at=created_at)
+            for (board, day), heap in heaps.items()
+            for value, _, neg_id, created_at in heap
+        ], batch_size=500)
+
+    for board, day in stale_keys | set(heaps):
+        cache.delete(cache_key(board, day))
+    written = sum(len(heap) for heap in heaps.values())
+    logger.info("Rebuilt %s leaderboards with %s entries", len(heaps), written)
+    return written
+
@@ -0,0 +1,118 @@
+"""Logging helpers for the game app.
+
+Loggers are configured only through ``settings.LOGGING``; no module calls
+``basicConfig`` on import. Two pieces keep logging off the request path:
+
+- ``log_payload`` writes a DEBUG dump of a request or response body for a
+  sampled fraction of calls. It skips even building the message unless
+  DEBUG is enabled for that logger.
+- ``QueueingStreamHandler`` is a ``QueueHandler`` with its own
+  ``QueueListener`` thread. The worker only enqueues the record as logged.
+  Interpolating the arguments, applying the formatter and the stream I/O
+  all happen in the listener thread, so don't log an object that is
+  mutated right afterwards. When the bounded queue is full, records are
+  dropped and counted instead of blocking.
+
+  The listener starts with the first record a process emits, not when
+  ``dictConfig`` builds the handler. Every worker of a preforking server
+  starts its own and never inherits a dead thread across ``fork``. It is
+  stopped, and the queue drained, at exit.
+
+Configured through ``settings.GAME_LOGGING``::
+
+    GAME_LOGGING = {
+        'PAYLOAD_SAMPLE_RATE': 0.01,   # fraction of payload dumps kept at DEBUG
+    }
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+DEFAULTS = {
+    'PAYLOAD_SAMPLE_RATE': 0.01,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GAME_LOGGING', {})}
+
+
+def log_payload(logger, label, payload, rate=None):
+    """DEBUG-log ``payload`` for a sampled fraction of calls; free when DEBUG is off"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if rate is None:
+        rate = get_config()['PAYLOAD_SAMPLE_RATE']
+    if rate >= 1 or random.random() < rate:
+        logger.debug("%s (sampled at %s): %s", label, rate, payload)
+
+
+class QueueingStreamHandler(QueueHandler):
+    """Queue records for a background thread that writes them to ``stream`` (stderr by default)"""
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.target = logging.StreamHandler(stream)
+        self.listener = None
+        # Process the listener was started in; None until the first record
+        self._started_pid = None
+        atexit.register(self.close)
+
+    @property
+    def started(self):
+        return self._started_pid == os.getpid()
+
+    def start(self):
+        if self._started_pid is not None:
+            # Forked after the parent started its listener: the thread and anything queued stayed behind
+            self.queue = queue.Queue(self.queue_size)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self._started_pid = os.getpid()
+
+    def setFormatter(self, fmt):
+        # Records are formatted in the listener thread, by the handler that writes them
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        return record
+
+    def emit(self, record):
+        # Called under the handler lock, so only one thread starts the listener
+        if not self.started:
+            self.start()
+        super().emit(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block the worker on log I/O; the count shows up on the next close
+            self.dropped += 1
+
+    def flush(self):
+        """Wait until every queued record has been written"""
+        if self.started:
+            self.listener.stop()
+            self.target.flush()
+            self.listener.start()
+
+    def close(self):
+        if self.started:
+            self.listener.stop()
+            self._started_pid = None
+        if self.dropped:
+            self.target.handle(logging.makeLogRecord({
+                'msg': "Log queue was full; dropped %s records", 'args': (self.dropped,), 'levelno': logging.WARNING,
+                'levelname': 'WARNING', 'name': __name__,
+            }))
+            self.dropped = 0
+        self.target.close()
+        super().close()
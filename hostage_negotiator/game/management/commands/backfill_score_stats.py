@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game import score_stats
+from game.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-user daily and lifetime score statistics from Score history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild this username')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']!r}")
+        written = score_stats.rebuild(user=user)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} score stats rows"))
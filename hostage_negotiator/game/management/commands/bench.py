@@ -0,0 +1,62 @@
+import json
+import logging
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from game import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Run the performance suite (engine, member and guest views.play with a stub Grok server, "
+            "scenario_list and stats at several attempt counts) and optionally save or compare a JSON baseline")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Timed calls per request case')
+        parser.add_argument('--engine-iterations', type=int, default=5000, help='Timed calls per engine case')
+        parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000],
+                            help='Finished attempts to seed for the scenario_list and stats cases')
+        parser.add_argument('--engine-only', action='store_true', help='Skip the cases that need a database')
+        parser.add_argument('--save', type=Path, help='Write the results to this JSON baseline')
+        parser.add_argument('--compare', type=Path, help='Fail if results regress against this JSON baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p50 slowdown against the baseline (0.25 = 25%%)')
+
+    def handle(self, *args, **options):
+        # Per-turn debug logging would be most of what the engine cases measure
+        logging.disable(logging.DEBUG)
+        results = {}
+        if options['engine_only']:
+            results.update(benchmarks.engine_cases(options['engine_iterations']))
+            results.update(benchmarks.context_cases(options['engine_iterations']))
+        else:
+            setup_test_environment()
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                results.update(benchmarks.engine_cases(options['engine_iterations']))
+                results.update(benchmarks.context_cases(options['engine_iterations']))
+                results.update(benchmarks.request_cases(options['sizes'], options['iterations']))
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        self.stdout.write(f"{'case':<32}{'p50 us':>12}{'p99 us':>12}{'queries':>9}")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<32}{result['p50_us']:>12.1f}{result['p99_us']:>12.1f}{result['queries']:>9}")
+
+        self.stdout.write(f"\n{'history tokens at turn':<32}{'windowed':>12}{'full':>12}")
+        for turn, windowed, full in benchmarks.context_tokens():
+            self.stdout.write(f"{turn:<32}{windowed:>12}{full:>12}")
+
+        if options['save']:
+            options['save'].write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f"Saved baseline to {options['save']}")
+        if options['compare']:
+            baseline = json.loads(options['compare'].read_text())
+            regressions = benchmarks.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
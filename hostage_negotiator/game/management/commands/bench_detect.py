@@ -0,0 +1,98 @@
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from game.game_logic import GameState
+
+
+def legacy_detect_response_type(self, text):
+    """The sequential ``any(word in text ...)`` scans replaced by game.classifier, kept for comparison"""
+    text = text.lower()
+
+    if self.last_input_type and text.strip() == self.last_input_type:
+        self.similar_inputs_count += 1
+    else:
+        self.similar_inputs_count = 0
+        self.last_input_type = text.strip()
+
+    if self.surrender_offered and any(word in text for word in ["yes", "accept", "agree", "okay", "ok"]):
+        return 'accept_surrender'
+
+    emotional_keywords = ["please", "understand", "feel", "need", "help", "care", "trust", "believe"]
+    if any(word in text for word in emotional_keywords):
+        self.emotional_appeals_count += 1
+        if self.emotional_appeals_count <= 2:
+            return 'empathy'
+        return 'overused_emotion'
+
+    if any(word + " " in text for word in ["how", "what", "tell", "explain"]) and "?" in text:
+        return 'calibrated'
+
+    if any(phrase in text for phrase in [
+        "i'll get you", "i can get you", "i will get",
+        "let me get", "i'll have", "i can arrange", "offer",
+        "deal", "trade", "exchange"
+    ]):
+        return 'action'
+
+    last_suspect_message = next((msg[1].lower() for msg in reversed(self.messages)
+                                if msg[0] == 'suspect'), '')
+    words = last_suspect_message.split()
+    if len(words) >= 3:
+        key_phrases = [' '.join(words[i:i+3]) for i in range(len(words)-2)]
+        if any(phrase in text for phrase in key_phrases):
+            return 'mirror'
+
+    if any(phrase in text for phrase in [
+        "release the hostages", "let them go", "free the hostages",
+        "release them", "set them free"
+    ]):
+        return 'release_request'
+
+    if any(word in text for word in ["no", "won't", "can't", "never", "don't", "stop"]):
+        return 'mistake'
+
+    if random.random() < 0.2:
+        return 'unpredictable'
+
+    return 'neutral'
+
+
+FILLER = "we are going to get through this together and everyone walks out safe today "
+SUSPECT_LINE = ("I have been waiting for hours and nobody in that building has given me a straight "
+                "answer about the car the money or the lawyer I asked for")
+
+
+def make_state(transcript_length, suspect_line=SUSPECT_LINE):
+    state = GameState()
+    for i in range(transcript_length):
+        state.messages.append(("player" if i % 2 else "suspect", suspect_line if i % 2 == 0 else FILLER))
+    return state
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark GameState.detect_response_type against the pre-compiled-matcher implementation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=2000, help='Calls per case')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        cases = [
+            ('short, 10 msgs', "We are here to listen to you", 10, SUSPECT_LINE),
+            ('long, 10 msgs', FILLER * 40, 10, SUSPECT_LINE),
+            ('long, 500 msgs', FILLER * 40, 500, SUSPECT_LINE),
+            ('short miss, 500 msgs', "the weather is nice", 500, SUSPECT_LINE),
+            ('long suspect line', "the weather is nice", 10, SUSPECT_LINE * 20),
+            ('long both', FILLER * 40, 10, SUSPECT_LINE * 20),
+        ]
+        self.stdout.write(f"{'case':<22}{'legacy us':>12}{'compiled us':>14}{'speedup':>10}")
+        for label, text, transcript_length, suspect_line in cases:
+            timings = []
+            for detect in (legacy_detect_response_type, GameState.detect_response_type):
+                state = make_state(transcript_length, suspect_line)
+                random.seed(0)
+                seconds = timeit.timeit(lambda: detect(state, text), number=number)
+                timings.append(seconds / number * 1e6)
+            self.stdout.write(f"{label:<22}{timings[0]:>12.2f}{timings[1]:>14.2f}{timings[0] / timings[1]:>9.1f}x")
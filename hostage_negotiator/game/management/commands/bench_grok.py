@@ -0,0 +1,85 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from django.core.management.base import BaseCommand
+
+from game import grok_client
+from game.grok_stub import start_stub_server
+
+
+def _summary(label, latencies, elapsed):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return (f"{label:<10} {len(latencies) / elapsed:8.1f} req/s  "
+            f"p50 {statistics.median(latencies) * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms")
+
+
+class Command(BaseCommand):
+    help = "Benchmark Grok calls: one connection per call vs. the pooled sync and async clients"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--delay', type=float, default=0.0,
+                            help='Latency added by the in-process stub server')
+        parser.add_argument('--url', help='Benchmark an already running endpoint instead of the stub')
+
+    def handle(self, *args, **options):
+        server = None
+        url = options['url']
+        if not url:
+            server, url = start_stub_server(delay=options['delay'])
+        grok_client.API_URL = url
+        total, concurrency = options['requests'], options['concurrency']
+
+        # A distinct prompt per call, so single-flight coalescing doesn't hide the connection costs
+        def prompt(index):
+            return f"user {index}"
+
+        def unpooled(index):
+            start = time.perf_counter()
+            # What the old requests.post path did: a fresh connection per call
+            with httpx.Client() as client:
+                client.post(url, json=grok_client.build_payload("system", prompt(index)))
+            return time.perf_counter() - start
+
+        def pooled(index):
+            start = time.perf_counter()
+            grok_client.make_api_call("system", prompt(index))
+            return time.perf_counter() - start
+
+        async def run_async():
+            async def one(index):
+                start = time.perf_counter()
+                await grok_client.make_api_call_async("system", prompt(index))
+                return time.perf_counter() - start
+
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def limited(index):
+                async with semaphore:
+                    return await one(index)
+
+            try:
+                return await asyncio.gather(*(limited(index) for index in range(total)))
+            finally:
+                await grok_client.aclose_http_clients()
+
+        try:
+            for label, call in (('unpooled', unpooled), ('pooled', pooled)):
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    latencies = list(executor.map(call, range(total)))
+                self.stdout.write(_summary(label, latencies, time.perf_counter() - start))
+
+            start = time.perf_counter()
+            latencies = asyncio.run(run_async())
+            self.stdout.write(_summary('async', latencies, time.perf_counter() - start))
+        finally:
+            grok_client.close_http_clients()
+            if server:
+                server.shutdown()
+                server.server_close()
@@ -0,0 +1,48 @@
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from game.game_logic import GameState
+from game.session_codec import decode_game_state, encode_game_state
+
+
+def play_turns(turns):
+    game_state = GameState(tension=6, trust=4)
+    game_state.messages.append(("suspect", "Nobody comes closer or this ends badly. I want a car out front."))
+    for turn in range(turns):
+        game_state.messages.append(("player", f"I hear you. What would it take to get one person out safely, turn {turn}?"))
+        game_state.messages.append(("suspect", "You keep asking questions. Get me the car and we talk about people."))
+        game_state.turn += 1
+    return game_state
+
+
+class Command(BaseCommand):
+    help = "Compare the guest session codec with the previous to_dict JSON encoding"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=2000, help='Round trips per measurement')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        self.stdout.write(f"{'turns':>5}{'json bytes':>12}{'codec bytes':>13}"
+                          f"{'json enc/dec us':>18}{'codec enc/dec us':>19}")
+        for turns in (1, 5, 10, 25):
+            game_state = play_turns(turns)
+
+            # Old path: to_dict() through Django's JSON session serializer
+            legacy = json.dumps(game_state.to_dict(), separators=(',', ':'))
+            legacy_encode = timeit.timeit(
+                lambda: json.dumps(game_state.to_dict(), separators=(',', ':')), number=number)
+            legacy_decode = timeit.timeit(lambda: GameState.from_dict(json.loads(legacy)), number=number)
+
+            encoded = encode_game_state(game_state)
+            codec_encode = timeit.timeit(lambda: encode_game_state(game_state), number=number)
+            # The session serializer still wraps the codec string in JSON
+            codec_decode = timeit.timeit(lambda: decode_game_state(json.loads(json.dumps(encoded))), number=number)
+
+            self.stdout.write(
+                f"{turns:>5}{len(legacy):>12}{len(encoded):>13}"
+                f"{legacy_encode / number * 1e6:>9.1f}/{legacy_decode / number * 1e6:<8.1f}"
+                f"{codec_encode / number * 1e6:>10.1f}/{codec_decode / number * 1e6:<8.1f}"
+            )
@@ -0,0 +1,19 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from game import guest_store
+
+
+class Command(BaseCommand):
+    help = "Delete guest games that have been idle longer than GUEST_GAME_STORE['TTL'], and optionally expired sessions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, help="Idle seconds before a game is deleted (default: the store's TTL)")
+        parser.add_argument('--sessions', action='store_true', help='Also run clearsessions to drop expired sessions')
+
+    def handle(self, *args, **options):
+        deleted = guest_store.cleanup(options['older_than'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} abandoned guest games"))
+        if options['sessions']:
+            call_command('clearsessions')
+            self.stdout.write(self.style.SUCCESS("Cleared expired sessions"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from game.grok_stub import make_stub_server
+
+
+class Command(BaseCommand):
+    help = "Run a local stub of the Grok chat completions API (point GROK_API_URL at it)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--delay', type=float, default=0.0,
+                            help='Seconds to sleep before answering, to mimic model latency')
+
+    def handle(self, *args, **options):
+        server = make_stub_server(options['host'], options['port'], options['delay'])
+        host, port = server.server_address[:2]
+        self.stdout.write(f"Stub Grok API listening on http://{host}:{port}/v1/chat/completions")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from game import leaderboard
+from game.models import Score
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized daily and all-time leaderboards from Score history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help='Only rebuild daily boards from this day (YYYY-MM-DD); all-time is always rebuilt')
+        parser.add_argument('--drop-legacy-copies', action='store_true',
+                            help='Delete the is_daily=False rows written by the old all-time leaderboard job')
+
+    def handle(self, *args, **options):
+        if options['drop_legacy_copies']:
+            deleted, _ = Score.objects.filter(is_daily=False).delete()
+            self.stdout.write(f"Deleted {deleted} legacy all-time score copies")
+        written = leaderboard.rebuild(since=options['since'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} leaderboard entries"))
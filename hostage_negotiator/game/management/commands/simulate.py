@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game.models import Scenario
+from game.scenario_manager import ScenarioManager
+from game.simulation import POLICIES, simulate
+
+
+class Command(BaseCommand):
+    help = "Batch-play negotiations against the mock suspect and report win rate, scores and game length"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=1000, help='Games per scenario')
+        parser.add_argument('--policy', choices=sorted(POLICIES), default='random')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+        parser.add_argument('--scenario', type=int, action='append', dest='scenario_ids',
+                            help='Scenario id to simulate; repeat for several (default: all)')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            scenarios = ([ScenarioManager.get(scenario_id) for scenario_id in options['scenario_ids']]
+                         if options['scenario_ids'] else None)
+        except Scenario.DoesNotExist as e:
+            raise CommandError(str(e))
+        report = simulate(scenarios, options['games'], options['policy'], options['seed'], options['workers'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{'scenario':<36}{'games':>7}{'win %':>8}{'score':>8}{'p10':>7}{'p90':>7}{'turns':>8}")
+        for row in report['scenarios']:
+            self.stdout.write(
+                f"{row['name'][:35]:<36}{row['games']:>7}{row['win_rate'] * 100:>7.1f}%"
+                f"{row['score_mean'] or 0:>8.2f}{row['score_p10'] or 0:>7.2f}{row['score_p90'] or 0:>7.2f}"
+                f"{row['turns_mean'] or 0:>8.2f}"
+            )
+        # None when the run finished too quickly for the clock to measure
+        rate = report['games_per_second']
+        rate = 'n/a' if rate is None else f"{rate:.0f}"
+        self.stdout.write(
+            f"{report['policy']} policy, seed {report['seed']}: {rate} games/s "
+            f"on {report['workers']} worker(s) in {report['seconds']:.2f}s"
+        )
@@ -0,0 +1,51 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from game import solver
+from game.rules import MAX_LEVEL, MIN_LEVEL
+from game.scenario_manager import ScenarioManager
+
+
+class Command(BaseCommand):
+    help = "Solve every scenario exactly and report optimal win probability, best score and difficulty"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the ratings as JSON')
+        parser.add_argument('--write', action='store_true',
+                            help='Also write the policy file hints are served from (settings.SOLVER_POLICY_FILE)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = []
+        for scenario in ScenarioManager.all():
+            solution = solver.solve(scenario.initial_mood)
+            rows.append({
+                'scenario_id': scenario.id,
+                'name': scenario.name,
+                'initial_mood': scenario.initial_mood,
+                'win_probability': solution.start.win_probability,
+                'best_score': round(solution.start.expected_score, 2),
+                'opening_move': solution.start.move,
+                'difficulty': solution.difficulty,
+            })
+        if options['write']:
+            # Every mood a scenario can be created with, not only the current ones
+            moods = set(range(MIN_LEVEL, MAX_LEVEL + 1)) | {row['initial_mood'] for row in rows}
+            path = solver.write_policies(moods)
+            self.stderr.write(f"Wrote policies for {len(moods)} moods to {path}")
+        elapsed = time.perf_counter() - started
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        self.stdout.write(f"{'scenario':<36}{'mood':>5}{'win %':>8}{'best':>7}{'difficulty':>12}  opening move")
+        for row in rows:
+            self.stdout.write(
+                f"{row['name'][:35]:<36}{row['initial_mood']:>5}{row['win_probability'] * 100:>7.1f}%"
+                f"{row['best_score']:>7.2f}{row['difficulty']:>12.3f}  {row['opening_move']}"
+            )
+        moods = len({row['initial_mood'] for row in rows})
+        self.stdout.write(f"Solved {moods} distinct initial moods for {len(rows)} scenarios in {elapsed:.2f}s")
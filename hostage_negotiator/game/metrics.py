@@ -0,0 +1,262 @@
+"""Timing spans and counters for the turn pipeline.
+
+Wrap code in ``span('name')`` or decorate it with ``@timed('name')`` to
+record its duration. ``increment('name')`` bumps a counter. Both feed two
+places:
+
+- A process-wide registry, served in the Prometheus text format by the
+  ``/metrics`` view.
+- The current request's totals. ``MetricsMiddleware`` writes these as one
+  JSON log line per request on the ``game.metrics`` logger.
+
+``gauge('name', func, help)`` registers a callable that is read at scrape
+time, for values that live elsewhere (such as shared circuit breaker
+state).
+
+When disabled, ``span`` returns a shared no-op context manager and ``timed``
+and ``increment`` return after a single flag check, so instrumentation can
+stay in hot paths.
+
+Configured through ``settings.GAME_METRICS``::
+
+    GAME_METRICS = {
+        'ENABLED': False,
+        'LOG_REQUESTS': True,   # per-request JSON log line
+        'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    }
+
+The registry is per process. Under a multi-worker server, scrape each
+worker or aggregate the results.
+"""
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'LOG_REQUESTS': True,
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+}
+
+PREFIX = 'hostage'
+
+_config = None
+_NULL_SPAN = nullcontext()
+_request_metrics = contextvars.ContextVar('game_request_metrics', default=None)
+
+
+def get_config():
+    global _config
+    if _config is None:
+        _config = {**DEFAULTS, **getattr(settings, 'GAME_METRICS', {})}
+    return _config
+
+
+def enabled():
+    return get_config()['ENABLED']
+
+
+@receiver(setting_changed)
+def _reset_config(setting, **kwargs):
+    global _config
+    if setting == 'GAME_METRICS':
+        _config = None
+        registry.reset()
+
+
+class Registry:
+    """Counters and per-span latency histograms for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.spans = {}
+        # name -> (func, help); registered at import time, so reset() leaves them alone
+        self.gauges = {}
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        buckets = get_config()['BUCKETS']
+        with self._lock:
+            histogram = self.spans.get(name)
+            if histogram is None:
+                histogram = self.spans[name] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(buckets):
+                if seconds <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        buckets = get_config()['BUCKETS']
+        with self._lock:
+            counters = dict(self.counters)
+            spans = {name: {**histogram, 'buckets': list(histogram['buckets'])}
+                     for name, histogram in self.spans.items()}
+
+        lines = []
+        for name, value in sorted(counters.items()):
+            metric = f'{PREFIX}_{name}_total'
+            lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+        for name, (func, help_text) in sorted(self.gauges.items()):
+            try:
+                value = func()
+            except Exception:
+                logger.exception("Gauge %s failed", name)
+                continue
+            if value is None:
+                continue
+            metric = f'{PREFIX}_{name}'
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge', f'{metric} {value}']
+        if spans:
+            metric = f'{PREFIX}_span_seconds'
+            lines += [f'# HELP {metric} Time spent in instrumented spans', f'# TYPE {metric} histogram']
+            for name, histogram in sorted(spans.items()):
+                for bound, count in zip(buckets, histogram['buckets']):
+                    lines.append(f'{metric}_bucket{{span="{name}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'{metric}_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+                lines.append(f'{metric}_count{{span="{name}"}} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.spans.clear()
+
+
+registry = Registry()
+
+
+def _record(name, seconds):
+    registry.observe(name, seconds)
+    current = _request_metrics.get()
+    if current is not None:
+        current['spans'][name] = current['spans'].get(name, 0.0) + seconds
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name):
+    """Context manager timing its block under ``name``"""
+    if not enabled():
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    """Decorator timing every call of a sync or async function under ``name``"""
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not enabled():
+                    return await func(*args, **kwargs)
+                with _Span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name, amount=1):
+    if not enabled():
+        return
+    registry.increment(name, amount)
+    current = _request_metrics.get()
+    if current is not None:
+        current['counters'][name] = current['counters'].get(name, 0) + amount
+
+
+def gauge(name, func, help_text=''):
+    """Export ``func()`` as a gauge on every scrape; a None value is left out"""
+    registry.gauges[name] = (func, help_text)
+
+
+class MetricsMiddleware:
+    """Times each request and logs its spans and counters as one JSON line"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not enabled():
+            return self.get_response(request)
+        token, started = self._start()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            self._finish(request, response, token, started)
+
+    async def __acall__(self, request):
+        if not enabled():
+            return await self.get_response(request)
+        token, started = self._start()
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            self._finish(request, response, token, started)
+
+    def _start(self):
+        return _request_metrics.set({'spans': {}, 'counters': {}}), time.perf_counter()
+
+    def _finish(self, request, response, token, started):
+        duration = time.perf_counter() - started
+        current = _request_metrics.get()
+        _request_metrics.reset(token)
+        registry.observe('http.request', duration)
+        if get_config()['LOG_REQUESTS']:
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code if response is not None else 500,
+                'duration_ms': round(duration * 1000, 2),
+                'spans_ms': {name: round(seconds * 1000, 2) for name, seconds in current['spans'].items()},
+                'counters': current['counters'],
+            }, sort_keys=True))
+
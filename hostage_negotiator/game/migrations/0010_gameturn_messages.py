@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0009_create_default_admin"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="gameturn",
+            name="messages",
+            field=models.JSONField(default=list),
+        ),
+    ]
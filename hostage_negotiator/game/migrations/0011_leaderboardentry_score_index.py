@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-17 21:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0010_gameturn_messages"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaderboardEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("board", models.CharField(choices=[("daily", "Daily"), ("all_time", "All time")], max_length=10)),
+                ("day", models.DateField(blank=True, null=True)),
+                ("value", models.FloatField()),
+                ("created_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="score",
+            index=models.Index(fields=["is_daily", "created_at", "score"], name="game_score_is_dail_57ea75_idx"),
+        ),
+        migrations.AddField(
+            model_name="leaderboardentry",
+            name="score",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="leaderboard_entries", to="game.score"),
+        ),
+        migrations.AddIndex(
+            model_name="leaderboardentry",
+            index=models.Index(fields=["board", "day", "-value"], name="game_leader_board_dfe885_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="leaderboardentry",
+            constraint=models.UniqueConstraint(fields=("board", "day", "score"), name="unique_leaderboard_score"),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0011_leaderboardentry_score_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScoreStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField(blank=True, null=True)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("total", models.FloatField(default=0)),
+                ("minimum", models.FloatField(null=True)),
+                ("maximum", models.FloatField(null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="score_stats",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("user", "day"), name="unique_user_score_stats_day"),
+                    models.UniqueConstraint(
+                        condition=models.Q(("day__isnull", True)),
+                        fields=("user",),
+                        name="unique_user_score_stats_lifetime",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0012_scorestats"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="scenarioattempt",
+            index=models.Index(fields=["user", "-start_time", "-id"], name="game_scenar_user_id_1b37d2_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scenarioattempt",
+            index=models.Index(condition=models.Q(("end_time__isnull", True)), fields=["user"], name="game_attempt_active_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scenarioattempt",
+            index=models.Index(condition=models.Q(("end_time__isnull", False)), fields=["user", "start_time", "scenario"], name="game_attempt_finished_idx"),
+        ),
+    ]
@@ -0,0 +1,54 @@
+import heapq
+from datetime import timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of game.leaderboard.rebuild as of this migration, so later changes to the module can't break it
+
+
+def backfill_leaderboards(apps, schema_editor):
+    Score = apps.get_model("game", "Score")
+    LeaderboardEntry = apps.get_model("game", "LeaderboardEntry")
+    size = getattr(settings, "LEADERBOARD", {}).get("SIZE", 10)
+
+    # Bounded min-heaps per (board, day): (value, -created_at order, -id, created_at)
+    heaps = {}
+    scores = Score.objects.filter(is_daily=True).values_list("id", "score", "created_at").order_by("id")
+    for score_id, value, created_at in scores.iterator():
+        day = created_at.astimezone(timezone.utc).date()
+        for board_key in (("all_time", None), ("daily", day)):
+            heap = heaps.setdefault(board_key, [])
+            item = (value, -created_at.timestamp(), -score_id, created_at)
+            if len(heap) < size:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    # Also replaces any duplicate all-time rows before the constraint below is added. Rendered
+    # boards still in the cache expire on their own (LEADERBOARD['CACHE_TIMEOUT']).
+    LeaderboardEntry.objects.all().delete()
+    LeaderboardEntry.objects.bulk_create([
+        LeaderboardEntry(board=board, day=day, score_id=-neg_id, value=value, created_at=created_at)
+        for (board, day), heap in heaps.items()
+        for value, _, neg_id, created_at in heap
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0014_guestgame"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_leaderboards, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="leaderboardentry",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("day__isnull", True)),
+                fields=("board", "score"),
+                name="unique_leaderboard_all_time_score",
+            ),
+        ),
+    ]
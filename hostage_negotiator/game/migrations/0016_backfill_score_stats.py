@@ -0,0 +1,36 @@
+from datetime import timezone
+
+from django.db import migrations
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+
+# Frozen copy of game.score_stats.rebuild as of this migration, so later changes to the module can't break it
+
+
+def backfill_score_stats(apps, schema_editor):
+    Score = apps.get_model("game", "Score")
+    ScoreStats = apps.get_model("game", "ScoreStats")
+    aggregates = {"count": Count("id"), "total": Sum("score"), "minimum": Min("score"), "maximum": Max("score")}
+
+    # Scores saved before 0012 created the table never went through the signals
+    scores = Score.objects.filter(is_daily=True, user__isnull=False)
+    daily = scores.annotate(day=TruncDate("created_at", tzinfo=timezone.utc)).values(
+        "user_id", "day"
+    ).annotate(**aggregates).order_by()
+    lifetime = scores.values("user_id").annotate(**aggregates).order_by()
+
+    stats = [ScoreStats(**row) for row in daily]
+    stats += [ScoreStats(day=None, **row) for row in lifetime]
+    ScoreStats.objects.all().delete()
+    ScoreStats.objects.bulk_create(stats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0015_leaderboard_backfill_all_time_unique"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_score_stats, migrations.RunPython.noop),
+    ]
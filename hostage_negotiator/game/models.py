@@ -5,6 +5,8 @@ import jwt
 from django.conf import settings
 import time
 
+from . import metrics
+
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     last_played_date = models.DateField(null=True, blank=True)
@@ -26,17 +28,14 @@ class User(AbstractUser):
             return None
 
     def get_daily_average(self):
-        today = datetime.utcnow().date()
-        daily_scores = Score.objects.filter(user=self, created_at__date=today)
-        if not daily_scores:
-            return None
-        return sum(s.score for s in daily_scores) / len(daily_scores)
+        """Average of today's (UTC) scores, or None; see game.score_stats"""
+        from .score_stats import daily_average
+        return daily_average(self)
 
     def get_lifetime_average(self):
-        scores = Score.objects.filter(user=self)
-        if not scores:
-            return None
-        return sum(s.score for s in scores) / len(scores)
+        """Average of every score, or None; see game.score_stats"""
+        from .score_stats import lifetime_average
+        return lifetime_average(self)
 
 class Scenario(models.Model):
     name = models.CharField(max_length=255)
@@ -113,6 +112,17 @@ class ScenarioAttempt(models.Model):
     last_input_type = models.CharField(max_length=50, null=True)
     emotional_appeals_count = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # History, newest first
+            models.Index(fields=['user', '-start_time', '-id']),
+            # The player's in-progress attempt
+            models.Index(fields=['user'], condition=models.Q(end_time__isnull=True), name='game_attempt_active_idx'),
+            # "Already played today": finished attempts by start time, scenario included for start_game
+            models.Index(fields=['user', 'start_time', 'scenario'], condition=models.Q(end_time__isnull=False),
+                         name='game_attempt_finished_idx'),
+        ]
+
     def update_emotional_state(self):
         if self.current_tension >= 7:
             self.emotional_state = 'volatile'
@@ -123,59 +133,97 @@ class ScenarioAttempt(models.Model):
         else:
             self.emotional_state = 'resigned'
 
+    # GameState attribute -> column mirrored on every turn
+    STATE_FIELDS = {
+        'tension': 'current_tension',
+        'trust': 'current_trust',
+        'hostages': 'current_hostages',
+        'hostages_released': 'hostages_released',
+        'turn': 'current_turn',
+        'game_over': 'game_over',
+        'success': 'success',
+        'good_choice_streak': 'good_choice_streak',
+        'promises_kept': 'promises_kept',
+        'rapport': 'rapport',
+        'surrender_offered': 'surrender_offered',
+        'poor_choices': 'poor_choices',
+        'similar_inputs_count': 'similar_inputs_count',
+        'last_input_type': 'last_input_type',
+        'emotional_appeals_count': 'emotional_appeals_count',
+        'mirroring_count': 'mirroring_count',
+        'emotional_labeling_success': 'emotional_labeling_success',
+        'emotional_labeling_failure': 'emotional_labeling_failure',
+        'tactical_empathy_success': 'tactical_empathy_success',
+        'tactical_empathy_failure': 'tactical_empathy_failure',
+    }
+
+    def get_transcript(self):
+        """Rebuild the conversation: opening messages stored on the attempt plus each turn's delta"""
+        transcript = list(self.messages)
+        for turn_messages in self.turns.order_by('turn_number', 'id').values_list('messages', flat=True):
+            transcript.extend(turn_messages)
+        return transcript
+
     def get_game_state(self):
         """Convert attempt data to GameState object"""
         from .game_logic import GameState
+        from .scenario_manager import ScenarioManager
         
+        messages = self.get_transcript()
+        # Remember where the stored transcript ends so the next update only writes the new messages
+        self._transcript_length = len(messages)
         game_state = GameState(
-            turn=self.current_turn,
-            tension=self.current_tension,
-            trust=self.current_trust,
-            hostages=self.current_hostages,
-            messages=self.messages,
-            game_over=self.game_over,
-            success=self.success,
-            scenario=self.scenario,
-            good_choice_streak=self.good_choice_streak,
-            promises_kept=self.promises_kept,
-            rapport=self.rapport,
-            hostages_released=self.hostages_released,
-            surrender_offered=self.surrender_offered,
-            poor_choices=self.poor_choices,
-            similar_inputs_count=self.similar_inputs_count,
-            last_input_type=self.last_input_type,
-            emotional_appeals_count=self.emotional_appeals_count
+            messages=messages,
+            scenario=ScenarioManager.get(self.scenario_id),
+            **{attr: getattr(self, field) for attr, field in self.STATE_FIELDS.items()}
         )
         return game_state
 
+    @metrics.timed('db.save_turn')
     def update_from_game_state(self, game_state):
-        """Update attempt with current game state"""
-        self.current_tension = game_state.tension
-        self.current_trust = game_state.trust
-        self.current_hostages = game_state.hostages
-        self.messages = game_state.messages
-        self.hostages_released = game_state.hostages_released
-        self.current_turn = game_state.turn  # Make sure this line exists
-        self.total_turns = game_state.turn
-        self.game_over = game_state.game_over
-        self.success = game_state.success
-        self.good_choice_streak = game_state.good_choice_streak
-        self.promises_kept = game_state.promises_kept
-        self.rapport = game_state.rapport
-        self.poor_choices = game_state.poor_choices
-        self.similar_inputs_count = game_state.similar_inputs_count
-        self.last_input_type = game_state.last_input_type
-        self.emotional_appeals_count = game_state.emotional_appeals_count
+        """Persist a turn: append a GameTurn with the new messages and update only the changed columns"""
+        previous = {field: getattr(self, field) for field in self.STATE_FIELDS.values()}
+        changed = []
+        for attr, field in self.STATE_FIELDS.items():
+            value = getattr(game_state, attr)
+            if previous[field] != value:
+                setattr(self, field, value)
+                changed.append(field)
+        if self.total_turns != game_state.turn:
+            self.total_turns = game_state.turn
+            changed.append('total_turns')
         
+        emotional_state = self.emotional_state
         self.update_emotional_state()
+        if self.emotional_state != emotional_state:
+            changed.append('emotional_state')
         
         if game_state.game_over:
             self.end_time = datetime.utcnow()
             self.final_tension = game_state.tension
             self.final_trust = game_state.trust
             self.final_hostages = game_state.hostages
+            changed += ['end_time', 'final_tension', 'final_trust', 'final_hostages']
         
-        self.save()
+        transcript_length = getattr(self, '_transcript_length', None)
+        if transcript_length is None:
+            transcript_length = len(self.get_transcript())
+        new_messages = [list(message) for message in game_state.messages[transcript_length:]]
+        if new_messages:
+            GameTurn.objects.create(
+                attempt=self,
+                turn_number=previous['current_turn'],
+                player_input=next((text for sender, text in reversed(new_messages) if sender == 'player'), ''),
+                game_response=next((text for sender, text in reversed(new_messages) if sender == 'suspect'), ''),
+                tension_change=game_state.tension - previous['current_tension'],
+                trust_change=game_state.trust - previous['current_trust'],
+                hostages_released=game_state.hostages_released - previous['hostages_released'],
+                messages=new_messages
+            )
+            self._transcript_length = len(game_state.messages)
+        
+        if changed:
+            self.save(update_fields=changed)
 
     def __str__(self):
         return f"Attempt #{self.id} - {self.scenario_name} by {self.user.username if self.user else 'Guest'}"
@@ -193,44 +241,75 @@ class Score(models.Model):
         indexes = [
             models.Index(fields=['scenario']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['is_daily', 'created_at', 'score']),
         ]
 
-    @classmethod
-    def get_daily_top_scores(cls, limit=10):
-        today = datetime.utcnow().date()
-        return cls.objects.filter(
-            created_at__date=today,
-            is_daily=True
-        ).select_related('user', 'scenario').order_by('-score')[:limit]
-
-    @classmethod
-    def get_all_time_top_scores(cls, limit=10):
-        return cls.objects.filter(
-            is_daily=False
-        ).select_related('user', 'scenario').order_by('-score')[:limit]
-
-    @classmethod
-    def update_all_time_leaderboard(cls):
-        today = datetime.utcnow().date()
-        daily_top_scores = cls.objects.filter(
-            created_at__date=today,
-            is_daily=True
-        ).order_by('-score')[:10]
-        
-        for score in daily_top_scores:
-            cls.objects.create(
-                user=score.user,
-                scenario=score.scenario,
-                guest_identifier=score.guest_identifier,
-                score=score.score,
-                scenario_name=score.scenario_name,
-                is_daily=False,
-                created_at=score.created_at
-            )
-
     def __str__(self):
         return f"Score: {self.score} - {self.scenario_name} by {self.user.username if self.user else 'Guest'}"
 
+class LeaderboardEntry(models.Model):
+    """One row of a materialized top-K board; see game.leaderboard"""
+    BOARDS = [
+        ('daily', 'Daily'),
+        ('all_time', 'All time'),
+    ]
+
+    board = models.CharField(max_length=10, choices=BOARDS)
+    # The UTC day for daily boards, null for the all-time board
+    day = models.DateField(null=True, blank=True)
+    score = models.ForeignKey(Score, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    value = models.FloatField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'day', 'score'], name='unique_leaderboard_score'),
+            # NULLs are distinct in the constraint above, so the all-time board needs its own
+            models.UniqueConstraint(fields=['board', 'score'], condition=models.Q(day__isnull=True),
+                                    name='unique_leaderboard_all_time_score'),
+        ]
+        indexes = [
+            models.Index(fields=['board', 'day', '-value']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_board_display()} {self.day or ''} - {self.value}"
+
+class ScoreStats(models.Model):
+    """Running count/sum/min/max of a user's scores for one UTC day, or lifetime when day is null"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='score_stats')
+    day = models.DateField(null=True, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0)
+    minimum = models.FloatField(null=True)
+    maximum = models.FloatField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_user_score_stats_day'),
+            models.UniqueConstraint(fields=['user'], condition=models.Q(day__isnull=True),
+                                    name='unique_user_score_stats_lifetime'),
+        ]
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.user_id} {self.day or 'lifetime'}: {self.count} scores"
+
+class GuestGame(models.Model):
+    """Durable copy of a guest's in-progress game, written behind the cache; see game.guest_store"""
+    key = models.CharField(max_length=32, unique=True)
+    # scenario_name, start_time and the session-codec encoded game_state
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Guest game {self.key} - {self.data.get('scenario_name', '')}"
+
 class GameTurn(models.Model):
     attempt = models.ForeignKey(ScenarioAttempt, on_delete=models.CASCADE, related_name='turns')
     turn_number = models.IntegerField()
@@ -239,6 +318,8 @@ class GameTurn(models.Model):
     tension_change = models.IntegerField()
     trust_change = models.IntegerField()
     hostages_released = models.IntegerField(default=0)
+    # Messages appended to the transcript during this turn, including system notices
+    messages = models.JSONField(default=list)
     timestamp = models.DateTimeField(auto_now_add=True)
     
     class Meta:
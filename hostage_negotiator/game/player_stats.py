@@ -0,0 +1,123 @@
+"""Per-user dashboard numbers for the stats page.
+
+On a cache miss, three queries over the user's ``ScenarioAttempt`` rows
+build the dashboard:
+
+- Totals and tactic counters, from one conditional aggregation
+  (``Count(..., filter=Q(...))`` and ``Sum`` per counter).
+- A per-scenario breakdown: one grouped query over finished attempts.
+- A weekly success-rate trend: one grouped query over attempts finished
+  in the last ``TREND_WEEKS`` weeks.
+
+The result is cached per user and dropped when they start or finish an
+attempt (``attempt_saved`` is connected in ``GameConfig.ready``).
+
+Configured through ``settings.PLAYER_STATS``::
+
+    PLAYER_STATS = {
+        'CACHE_TIMEOUT': 300,
+        'TREND_WEEKS': 8,
+    }
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from .models import ScenarioAttempt
+
+DEFAULTS = {
+    'CACHE_TIMEOUT': 300,
+    'TREND_WEEKS': 8,
+}
+
+# Dashboard label -> ScenarioAttempt counter column
+TACTICS = {
+    'mirroring': 'mirroring_count',
+    'tactical_empathy_success': 'tactical_empathy_success',
+    'tactical_empathy_failure': 'tactical_empathy_failure',
+    'emotional_labeling_success': 'emotional_labeling_success',
+    'emotional_labeling_failure': 'emotional_labeling_failure',
+    'emotional_appeals': 'emotional_appeals_count',
+    'poor_choices': 'poor_choices',
+    'hostages_released': 'hostages_released',
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PLAYER_STATS', {})}
+
+
+def cache_key(user_id):
+    return f'player-stats:{user_id}'
+
+
+def _rate(successes, attempts):
+    return round(successes / attempts * 100, 1) if attempts else None
+
+
+def totals(user):
+    """Every user-level aggregate in one query"""
+    row = ScenarioAttempt.objects.filter(user=user).aggregate(
+        total_attempts=Count('id'),
+        finished_attempts=Count('id', filter=Q(end_time__isnull=False)),
+        successful_attempts=Count('id', filter=Q(success=True)),
+        average_score=Avg('final_score'),
+        best_score=Max('final_score'),
+        **{name: Sum(column) for name, column in TACTICS.items()},
+    )
+    row['tactics'] = {name: row.pop(name) or 0 for name in TACTICS}
+    row['success_rate'] = _rate(row['successful_attempts'], row['finished_attempts'])
+    return row
+
+
+def by_scenario(user):
+    """[{'scenario_id', 'scenario_name', 'attempts', 'successes', 'success_rate', 'average_score', 'best_score'}]"""
+    rows = ScenarioAttempt.objects.filter(user=user, end_time__isnull=False).values(
+        'scenario_id', 'scenario_name'
+    ).annotate(
+        attempts=Count('id'),
+        successes=Count('id', filter=Q(success=True)),
+        average_score=Avg('final_score'),
+        best_score=Max('final_score'),
+    ).order_by('-attempts', 'scenario_name')
+    return [{**row, 'success_rate': _rate(row['successes'], row['attempts'])} for row in rows]
+
+
+def success_trend(user, weeks):
+    """[{'week', 'attempts', 'successes', 'success_rate'}] for weeks with finished attempts, oldest first"""
+    since = timezone.now() - timedelta(weeks=weeks)
+    rows = ScenarioAttempt.objects.filter(user=user, end_time__gte=since).annotate(
+        week=TruncWeek('end_time')
+    ).values('week').annotate(
+        attempts=Count('id'),
+        successes=Count('id', filter=Q(success=True)),
+    ).order_by('week')
+    return [{**row, 'week': row['week'].date(), 'success_rate': _rate(row['successes'], row['attempts'])}
+            for row in rows]
+
+
+def get_player_stats(user):
+    """Cached ``totals`` plus ``by_scenario`` and ``trend`` for the stats page"""
+    key = cache_key(user.id)
+    stats = cache.get(key)
+    if stats is None:
+        config = get_config()
+        stats = totals(user)
+        stats['by_scenario'] = by_scenario(user)
+        stats['trend'] = success_trend(user, config['TREND_WEEKS'])
+        cache.set(key, stats, config['CACHE_TIMEOUT'])
+    return stats
+
+
+def invalidate(user_id):
+    cache.delete(cache_key(user_id))
+
+
+def attempt_saved(sender, instance, created=False, **kwargs):
+    """post_save handler: a new attempt changes the totals, a finished one every number on the dashboard"""
+    if instance.user_id and (created or instance.end_time is not None):
+        invalidate(instance.user_id)
@@ -0,0 +1,131 @@
+"""Prompt building for Grok calls.
+
+The system message holds only what is fixed for a scenario: the persona,
+the suspect, the setting, the demand and the rules for every emotional
+state. It is rendered once per scenario and then reused byte for byte on
+every turn, so the upstream prefix cache can match it. Everything that
+changes per turn goes into the user prompt: tension, trust, remaining
+hostages, the current emotional state, the bounded conversation history
+(see game/context_window.py) and the negotiator's line. The user prompt is
+filled from one pre-built template.
+
+``ScenarioManager.registry()`` pre-renders the system message for every
+scenario when it loads, and clears the cache again when it is invalidated.
+
+Token counts are estimates, about four characters per token for English
+text. They are for metrics and budgeting, not exact billing.
+"""
+import threading
+
+EMOTIONAL_STATE_RULES = {
+    'volatile': "Highly unstable, prone to violent outbursts, requires extreme caution",
+    'agitated': "Easily provoked, needs reassurance, sensitive to threats",
+    'strategic': "Calculated responses, focused on demands, evaluates options",
+    'resigned': "More open to negotiation, showing signs of fatigue or doubt",
+}
+
+# Tension ranges that map to each emotional state (see grok_client.get_emotional_state)
+EMOTIONAL_STATE_TENSION = {
+    'volatile': '7-10',
+    'agitated': '4-6',
+    'strategic': '2-3',
+    'resigned': '0-1',
+}
+
+_STATE_RULES = "\n".join(
+    f"- {state} (tension {EMOTIONAL_STATE_TENSION[state]}): {rules}"
+    for state, rules in EMOTIONAL_STATE_RULES.items()
+)
+
+SYSTEM_TEMPLATE = """You are a highly realistic hostage-taker AI.
+Who you are: {suspect}
+Setting: {setting}
+Demand: {demand}
+
+Emotional State Rules:
+""" + _STATE_RULES + """
+
+Each message gives your current tension, trust, hostages and emotional state. \
+Stay in that emotional state."""
+
+USER_TEMPLATE = """{history}Current Situation:
+Turn: {turn}/10
+Tension: {tension}/10
+Trust: {trust}/10
+Hostages: {hostages}
+Emotional State: {emotional_state}
+
+Negotiator Says: "{choice}"
+{offer}
+
+Generate a response that:
+1. Matches tension level ({tension}/10)
+2. Shows authentic crisis behavior
+3. Maintains scenario consistency
+4. Keeps focus on demands"""
+
+CHARS_PER_TOKEN = 4
+
+_lock = threading.Lock()
+# (scenario id, suspect, setting, demand) -> rendered system message
+_system_messages = {}
+
+
+def get_emotional_state_rules(emotional_state):
+    return EMOTIONAL_STATE_RULES.get(emotional_state, EMOTIONAL_STATE_RULES['strategic'])
+
+
+def _system_key(scenario):
+    return (scenario.id, scenario.suspect, scenario.setting, scenario.demand)
+
+
+def _render_system(scenario):
+    return SYSTEM_TEMPLATE.format(suspect=scenario.suspect, setting=scenario.setting, demand=scenario.demand)
+
+
+def system_message(scenario):
+    """The scenario's system message; rendered once, then the same string every turn"""
+    key = _system_key(scenario)
+    message = _system_messages.get(key)
+    if message is None:
+        message = _render_system(scenario)
+        with _lock:
+            message = _system_messages.setdefault(key, message)
+    return message
+
+
+def user_prompt(game_state, choice, offer, emotional_state, history=''):
+    """Per-turn prompt; ``history`` is the bounded conversation section from game/context_window.py"""
+    return USER_TEMPLATE.format(
+        history=f"{history}\n\n" if history else '',
+        turn=game_state.turn,
+        tension=game_state.tension,
+        trust=game_state.trust,
+        hostages=game_state.hostages - game_state.hostages_released,
+        emotional_state=emotional_state,
+        choice=choice,
+        offer=f'Offer: {offer}' if offer else '',
+    )
+
+
+def prebuild(scenarios):
+    """Render the system message for every scenario up front"""
+    rendered = {_system_key(scenario): _render_system(scenario) for scenario in scenarios}
+    with _lock:
+        _system_messages.update(rendered)
+
+
+def clear():
+    with _lock:
+        _system_messages.clear()
+
+
+def estimate_tokens(text):
+    return max(1, -(-len(text) // CHARS_PER_TOKEN)) if text else 0
+
+
+def estimate_payload_tokens(payload):
+    """Estimated prompt tokens of a chat completions payload, plus ``max_tokens`` for the reply"""
+    prompt = sum(estimate_tokens(message['content']) for message in payload['messages'])
+    completion = payload.get('max_tokens', 0)
+    return {'prompt': prompt, 'completion_max': completion, 'total': prompt + completion}
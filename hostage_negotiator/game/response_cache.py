@@ -0,0 +1,211 @@
+"""Cache of suspect replies from the Grok API.
+
+Replies are keyed on the normalized player input plus the coarse game context
+(tension band, trust band, scenario and suspect type), so repeated lines in
+the same situation skip the LLM round-trip. The key also carries a digest of
+the conversation history the prompt includes, so a reply is only reused for
+the same conversation so far. In practice that means opening lines, or
+every turn when the context window is disabled. Only the reply text is
+cached; the rest of the response is rebuilt from the live game state.
+
+Configured through ``settings.GROK_RESPONSE_CACHE``::
+
+    GROK_RESPONSE_CACHE = {
+        'BACKEND': 'local',          # 'local' (in-process LRU), 'django' or 'none'
+        'TTL': 600,                  # seconds
+        'MAX_ENTRIES': 1000,         # local backend only
+        'CACHE_ALIAS': 'default',    # django backend only
+        'EXCLUDED_SCENARIOS': [],    # scenario ids or names that are never cached
+    }
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import context_window, metrics
+
+DEFAULTS = {
+    'BACKEND': 'local',
+    'TTL': 600,
+    'MAX_ENTRIES': 1000,
+    'CACHE_ALIAS': 'default',
+    'EXCLUDED_SCENARIOS': [],
+}
+
+KEY_PREFIX = 'grok-reply'
+
+_PUNCTUATION = re.compile(r"[^\w\s']+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GROK_RESPONSE_CACHE', {})}
+
+
+def normalize_input(text):
+    """Lowercase, drop punctuation and collapse whitespace so trivial variations share a key"""
+    text = _PUNCTUATION.sub(' ', text.lower())
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def trust_band(trust):
+    if trust >= 7:
+        return 'high'
+    elif trust >= 4:
+        return 'medium'
+    return 'low'
+
+
+def make_cache_key(game_state, choice):
+    """md5 key over the normalized input, the banded game context and the prompt's history section"""
+    scenario = game_state.scenario
+    history = context_window.history_section(game_state.messages)
+    raw = ":".join([
+        normalize_input(choice),
+        game_state.get_emotional_state(),
+        trust_band(game_state.trust),
+        str(scenario.id),
+        scenario.suspect_type,
+        hashlib.md5(history.encode()).hexdigest(),
+    ])
+    return f"{KEY_PREFIX}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def is_cacheable(scenario):
+    excluded = {str(value) for value in get_config()['EXCLUDED_SCENARIOS']}
+    return str(scenario.id) not in excluded and scenario.name not in excluded
+
+
+class LocalResponseCache:
+    """In-process LRU with per-entry expiry"""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+
+class DjangoResponseCache:
+    """Backed by a Django cache alias; size limits come from that cache's own OPTIONS"""
+
+    def __init__(self, ttl, alias):
+        self.ttl = ttl
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.ttl)
+
+    def clear(self):
+        self.cache.clear()
+
+    async def aget(self, key):
+        return await self.cache.aget(key)
+
+    async def aset(self, key, value):
+        await self.cache.aset(key, value, self.ttl)
+
+
+class ResponseCache:
+    """Front end used by grok_client: picks the backend and keeps hit/miss counters"""
+
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            config = get_config()
+            if config['BACKEND'] == 'django':
+                self._backend = DjangoResponseCache(config['TTL'], config['CACHE_ALIAS'])
+            elif config['BACKEND'] == 'local':
+                self._backend = LocalResponseCache(config['TTL'], config['MAX_ENTRIES'])
+        return self._backend
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def _count(self, value):
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.increment('grok_cache_misses' if value is None else 'grok_cache_hits')
+        return value
+
+    def get(self, key):
+        return self._count(self.backend.get(key))
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    async def aget(self, key):
+        return self._count(await self.backend.aget(key))
+
+    async def aset(self, key, value):
+        await self.backend.aset(key, value)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def reset(self):
+        """Drop the backend (re-read from settings on next use) and zero the counters"""
+        if self._backend is not None:
+            self._backend.clear()
+        self._backend = None
+        self.hits = 0
+        self.misses = 0
+
+
+response_cache = ResponseCache()
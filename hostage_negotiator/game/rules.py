@@ -0,0 +1,130 @@
+"""Balance rules for ``GameState.adjust_state``.
+
+The rules below are the single place to tweak how each response type moves
+tension and trust. They are expanded once at import into ``TRANSITIONS``, a
+table indexed by (response_type, tension, trust), so the per-turn hot path is
+one dict lookup.
+
+A delta is either a number or a conditional on the state *before* the move::
+
+    {'if': ('trust', '>', 5), 'then': -2, 'else': 2}
+"""
+import operator
+from collections import namedtuple
+
+MIN_LEVEL = 1
+MAX_LEVEL = 10
+
+RULES = {
+    'empathy': {'tension': -2, 'trust': 2, 'counters': ['tactical_empathy_success']},
+    'mirror': {'tension': -1, 'trust': 2, 'counters': ['mirroring_count']},
+    'emotional_label': {'tension': -2, 'trust': 2, 'counters': ['emotional_labeling_success']},
+    'action': {
+        'tension': {'if': ('trust', '>', 5), 'then': -2, 'else': 2},
+        'trust': {'if': ('tension', '<=', 7), 'then': 2, 'else': -1},
+    },
+    'calibrated': {'tension': -2, 'trust': 3},
+    'release_request': {
+        'tension': {'if': ('trust', '<', 5), 'then': 3, 'else': -1},
+        'trust': {'if': ('tension', '>=', 8), 'then': -2, 'else': 1},
+    },
+    'accept_surrender': {'tension': 0, 'trust': 0},
+    'neutral': {'tension': 1, 'trust': -1, 'counters': ['poor_choices']},
+    'mistake': {'tension': 3, 'trust': -3, 'counters': ['poor_choices']},
+    'overused_emotion': {'tension': 2, 'trust': -2, 'counters': ['emotional_appeals_count']},
+}
+
+# Applied to any response type without a rule (e.g. 'unpredictable')
+DEFAULT_RULE = {'tension': 0, 'trust': 0}
+
+# Checked in order against the state *after* the move: (emotional state, minimum trust, release everyone)
+HOSTAGE_RELEASE_RULES = [
+    ('resigned', 2, True),
+    ('strategic', 4, False),
+    ('agitated', 6, False),
+    ('volatile', 8, False),
+]
+
+SURRENDER_RULE = {'max_tension': 2, 'min_trust': 8}
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+}
+
+# tension_delta/trust_delta are already clamped; hostage_release is None, 'one' or 'all'
+Transition = namedtuple('Transition', 'tension_delta trust_delta counters hostage_release offer_surrender')
+
+
+def emotional_state(tension):
+    if tension >= 7:
+        return 'volatile'
+    elif 4 <= tension <= 6:
+        return 'agitated'
+    elif 2 <= tension <= 3:
+        return 'strategic'
+    else:
+        return 'resigned'
+
+
+def _clamp(value):
+    return max(MIN_LEVEL, min(MAX_LEVEL, value))
+
+
+def _delta(spec, state):
+    if isinstance(spec, dict):
+        attribute, op, threshold = spec['if']
+        return spec['then'] if OPERATORS[op](state[attribute], threshold) else spec['else']
+    return spec
+
+
+def build_transition(response_type, tension, trust):
+    """Evaluate the rules for one state; used to fill the table and for out-of-range states"""
+    rule = RULES.get(response_type, DEFAULT_RULE)
+    state = {'tension': tension, 'trust': trust}
+    new_tension = _clamp(tension + _delta(rule.get('tension', 0), state))
+    new_trust = _clamp(trust + _delta(rule.get('trust', 0), state))
+
+    hostage_release = None
+    mood = emotional_state(new_tension)
+    for rule_state, min_trust, release_all in HOSTAGE_RELEASE_RULES:
+        if mood == rule_state:
+            if new_trust >= min_trust:
+                hostage_release = 'all' if release_all else 'one'
+            break
+
+    offer_surrender = (new_tension <= SURRENDER_RULE['max_tension']
+                       and new_trust >= SURRENDER_RULE['min_trust'])
+
+    return Transition(
+        tension_delta=new_tension - tension,
+        trust_delta=new_trust - trust,
+        counters=tuple(rule.get('counters', ())),
+        hostage_release=hostage_release,
+        offer_surrender=offer_surrender,
+    )
+
+
+def build_table():
+    levels = range(MIN_LEVEL, MAX_LEVEL + 1)
+    return {
+        (response_type, tension, trust): build_transition(response_type, tension, trust)
+        for response_type in [*RULES, None]
+        for tension in levels
+        for trust in levels
+    }
+
+
+TRANSITIONS = build_table()
+
+
+def get_transition(response_type, tension, trust):
+    if response_type not in RULES:
+        response_type = None  # DEFAULT_RULE
+    transition = TRANSITIONS.get((response_type, tension, trust))
+    if transition is None:
+        transition = build_transition(response_type, tension, trust)
+    return transition
@@ -1,6 +1,12 @@
+import threading
+import time
 from dataclasses import dataclass
 from datetime import datetime
 
+from django.conf import settings
+
+from . import prompts
+
 
 @dataclass
 class Scenario:
@@ -709,3 +715,66 @@ class ScenarioManager:
         daily_seed = day_of_year * 24 + current_hour
         scenario_index = daily_seed % len(cls._scenarios)
         return cls._scenarios[scenario_index]
+
+    # Process-wide cache of Scenario rows keyed by id. Scenarios are seeded by
+    # migration and rarely edited, so every game path reads them from here.
+    # The post_save/post_delete handlers wired in GameConfig.ready() reset it,
+    # but only in the process that made the change; other processes pick up
+    # edits when their copy is older than settings.SCENARIO_REGISTRY_TTL
+    # seconds. A row added elsewhere is fetched on its first lookup.
+    _registry = None
+    _registry_loaded_at = 0.0
+    _registry_lock = threading.Lock()
+
+    @classmethod
+    def registry(cls):
+        """Return {id: Scenario} for every row, loading it with one query on first use and after the TTL"""
+        registry = cls._registry
+        ttl = getattr(settings, 'SCENARIO_REGISTRY_TTL', 300)
+        if registry is None or (ttl is not None and time.monotonic() - cls._registry_loaded_at > ttl):
+            from .models import Scenario as ScenarioModel
+
+            with cls._registry_lock:
+                if cls._registry is registry:
+                    cls._registry = {scenario.id: scenario for scenario in ScenarioModel.objects.all()}
+                    cls._registry_loaded_at = time.monotonic()
+                    prompts.prebuild(cls._registry.values())
+                registry = cls._registry
+        return registry
+
+    @classmethod
+    def get(cls, scenario_id):
+        """Scenario row by id without a query; raises Scenario.DoesNotExist like objects.get"""
+        from .models import Scenario as ScenarioModel
+
+        try:
+            scenario_id = int(scenario_id)
+        except (TypeError, ValueError):
+            raise ScenarioModel.DoesNotExist(f"Invalid scenario id {scenario_id!r}")
+        scenario = cls.registry().get(scenario_id)
+        if scenario is None:
+            # The row may have been added by another process since we loaded; fetch just that one
+            scenario = ScenarioModel.objects.filter(pk=scenario_id).first()
+            if scenario is None:
+                raise ScenarioModel.DoesNotExist(f"Scenario {scenario_id} does not exist")
+            with cls._registry_lock:
+                if cls._registry is not None:
+                    cls._registry = {**cls._registry, scenario.id: scenario}
+            prompts.prebuild([scenario])
+        return scenario
+
+    @classmethod
+    def all(cls):
+        """Every Scenario row in id order"""
+        return [cls.registry()[scenario_id] for scenario_id in sorted(cls.registry())]
+
+    @classmethod
+    def latest(cls):
+        """Most recently created Scenario row, or None if there are none"""
+        return max(cls.registry().values(), key=lambda scenario: (scenario.created_at, scenario.id), default=None)
+
+    @classmethod
+    def invalidate(cls, **kwargs):
+        """Drop the registry and its pre-rendered prompts; accepts signal kwargs so it can be connected directly"""
+        cls._registry = None
+        prompts.clear()
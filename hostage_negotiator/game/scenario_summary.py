@@ -0,0 +1,68 @@
+"""Per-user scenario summary shown on the scenario list.
+
+Attempt counts and best scores for every scenario come from one grouped
+query over the user's finished attempts, and completed scenarios from one
+query on the progress M2M. The result is cached per user and dropped when
+one of their attempts finishes or their completed scenarios change (the
+handlers are connected in ``GameConfig.ready``).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import GameProgress, ScenarioAttempt
+
+DEFAULT_TIMEOUT = 300
+
+
+def cache_key(user_id):
+    return f'scenario-summary:{user_id}'
+
+
+def get_scenario_summary(user):
+    """Return {scenario_id: {'attempts_count', 'best_score', 'completed'}} for ``user``'s finished attempts"""
+    key = cache_key(user.id)
+    summary = cache.get(key)
+    if summary is not None:
+        return summary
+
+    progress, _ = GameProgress.objects.get_or_create(user=user)
+    completed = set(progress.completed_scenarios.values_list('id', flat=True))
+    rows = ScenarioAttempt.objects.filter(
+        user=user,
+        end_time__isnull=False
+    ).values('scenario_id').annotate(
+        attempts_count=Count('id'),
+        best_score=Max('final_score')
+    ).order_by()
+
+    summary = {
+        row['scenario_id']: {'attempts_count': row['attempts_count'], 'best_score': row['best_score'], 'completed': False}
+        for row in rows
+    }
+    for scenario_id in completed:
+        summary.setdefault(scenario_id, {'attempts_count': 0, 'best_score': None, 'completed': False})['completed'] = True
+
+    cache.set(key, summary, getattr(settings, 'SCENARIO_SUMMARY_TIMEOUT', DEFAULT_TIMEOUT))
+    return summary
+
+
+def invalidate_scenario_summary(user_id):
+    cache.delete(cache_key(user_id))
+
+
+def attempt_saved(sender, instance, **kwargs):
+    """post_save handler: a finished attempt changes its user's counts and best score"""
+    if instance.user_id and instance.end_time is not None:
+        invalidate_scenario_summary(instance.user_id)
+
+
+def completed_scenarios_changed(sender, instance, **kwargs):
+    """m2m_changed handler for GameProgress.completed_scenarios"""
+    if isinstance(instance, GameProgress):
+        invalidate_scenario_summary(instance.user_id)
+    else:
+        # Changed from the Scenario side; pk_set holds the affected GameProgress ids
+        user_ids = GameProgress.objects.filter(pk__in=kwargs.get('pk_set') or ()).values_list('user_id', flat=True)
+        for user_id in user_ids:
+            invalidate_scenario_summary(user_id)
@@ -0,0 +1,147 @@
+"""Per-user rolling score statistics.
+
+``ScoreStats`` keeps a running count, sum, min and max of each user's
+scores for every UTC day and one lifetime row (``day`` null). Averages are
+a single-row read instead of a scan of the user's ``Score`` rows.
+
+The rows are maintained from ``Score`` signals, which are connected in
+``GameConfig.ready``:
+
+- A new score is added with one atomic ``UPDATE`` per row, or an
+  ``INSERT`` for the user's first score of the day.
+- A deleted score has its two rows recomputed with ``Avg`` and friends,
+  since a min or max can't be un-applied.
+
+Only ``is_daily`` scores count; the ``is_daily=False`` rows are legacy
+copies written by the old all-time leaderboard job. Scores written with
+``bulk_create`` bypass the signals. Run ``manage.py backfill_score_stats``
+after bulk loads. Migration 0016 built the rows from the history that
+existed before the table did.
+
+When a user has no stats row, or ``SCORE_STATS['ENABLED']`` is False, the
+averages fall back to a database ``Avg()``.
+"""
+import logging
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Max, Min, Sum
+from django.db.models.functions import Greatest, Least, TruncDate
+from django.utils import timezone
+
+from .dates import utc_day, utc_day_range
+from .models import Score, ScoreStats
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SCORE_STATS', {})}
+
+
+def _counts(score):
+    return score.user_id is not None and score.is_daily
+
+
+def _apply(score, day):
+    """Add ``score`` to an existing row with one atomic UPDATE; returns whether the row existed"""
+    return ScoreStats.objects.filter(user_id=score.user_id, day=day).update(
+        count=F('count') + 1,
+        total=F('total') + score.score,
+        minimum=Least('minimum', score.score),
+        maximum=Greatest('maximum', score.score),
+        updated_at=timezone.now(),
+    )
+
+
+def record(score):
+    """Fold one new score into the user's daily and lifetime rows"""
+    if not _counts(score):
+        return
+    for day in (utc_day(score.created_at), None):
+        if _apply(score, day):
+            continue
+        try:
+            with transaction.atomic():
+                ScoreStats.objects.create(user_id=score.user_id, day=day, count=1, total=score.score,
+                                          minimum=score.score, maximum=score.score)
+        except IntegrityError:
+            # Another request created the row first; apply ours on top of it
+            _apply(score, day)
+
+
+def _aggregates():
+    return {'count': Count('id'), 'total': Sum('score'), 'minimum': Min('score'), 'maximum': Max('score')}
+
+
+def _scores(user_id, day):
+    """The user's counted scores, limited to one UTC day unless ``day`` is None"""
+    scores = Score.objects.filter(user_id=user_id, is_daily=True)
+    if day is not None:
+        start, end = utc_day_range(day)
+        scores = scores.filter(created_at__gte=start, created_at__lt=end)
+    return scores
+
+
+def recompute(user_id, day):
+    """Rebuild one row from ``Score``; deletes it when the user has no scores left in it"""
+    values = _scores(user_id, day).aggregate(**_aggregates())
+    if not values['count']:
+        ScoreStats.objects.filter(user_id=user_id, day=day).delete()
+        return
+    ScoreStats.objects.update_or_create(user_id=user_id, day=day, defaults=values)
+
+
+def score_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record(instance)
+
+
+def score_deleted(sender, instance, **kwargs):
+    if _counts(instance):
+        recompute(instance.user_id, utc_day(instance.created_at))
+        recompute(instance.user_id, None)
+
+
+def rebuild(user=None):
+    """Recreate stats rows from ``Score`` history with two grouped queries. Returns the number of rows."""
+    scores = Score.objects.filter(is_daily=True, user__isnull=False)
+    rows = ScoreStats.objects.all()
+    if user is not None:
+        scores = scores.filter(user=user)
+        rows = rows.filter(user=user)
+    daily = scores.annotate(day=TruncDate('created_at', tzinfo=dt_timezone.utc)).values(
+        'user_id', 'day'
+    ).annotate(**_aggregates()).order_by()
+    lifetime = scores.values('user_id').annotate(**_aggregates()).order_by()
+
+    stats = [ScoreStats(**row) for row in daily]
+    stats += [ScoreStats(day=None, **row) for row in lifetime]
+    with transaction.atomic():
+        rows.delete()
+        ScoreStats.objects.bulk_create(stats, batch_size=1000)
+    logger.info("Rebuilt %s score stats rows", len(stats))
+    return len(stats)
+
+
+def _average(user, day):
+    if get_config()['ENABLED']:
+        row = ScoreStats.objects.filter(user=user, day=day).only('count', 'total').first()
+        if row is not None:
+            return row.average
+    # No row yet (no scores, or history not backfilled) or stats disabled: let the database average
+    return _scores(user.id, day).aggregate(average=Avg('score'))['average']
+
+
+def daily_average(user, day=None):
+    """Average score for a UTC day (today by default), or None"""
+    return _average(user, day or utc_day(timezone.now()))
+
+
+def lifetime_average(user):
+    return _average(user, None)
@@ -0,0 +1,150 @@
+"""Compact, versioned encoding of ``GameState`` for guest sessions.
+
+Instead of the ``to_dict`` JSON object (field names repeated in every
+session write), a guest game is stored as a short ASCII string::
+
+    base64( version byte | flags byte | payload )
+
+The payload is a positional list of the ``FIELDS`` values followed by the
+transcript, with senders replaced by small integers. It is packed with
+msgpack when installed (JSON otherwise) and zlib-compressed once it passes
+``COMPRESS_MIN_BYTES``. Sessions written by older code (plain ``to_dict``
+dicts) are still decoded.
+
+Configured through ``settings.GUEST_SESSION_CODEC``::
+
+    GUEST_SESSION_CODEC = {
+        'COMPRESS_MIN_BYTES': 512,   # compress payloads at least this large
+        'COMPRESS_LEVEL': 6,
+        'MAX_BYTES': 32768,          # trim the oldest messages above this size
+    }
+"""
+import base64
+import json
+import logging
+import zlib
+
+from django.conf import settings
+
+from . import metrics
+from .game_logic import GameState
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+FLAG_ZLIB = 0x01
+FLAG_MSGPACK = 0x02
+
+# Order matters: it is the on-the-wire layout for VERSION 1
+FIELDS = (
+    'turn', 'tension', 'trust', 'hostages', 'game_over', 'success', 'scenario_id',
+    'good_choice_streak', 'promises_kept', 'rapport', 'hostages_released',
+    'surrender_offered', 'poor_choices', 'similar_inputs_count', 'last_input_type',
+    'emotional_appeals_count', 'tactical_empathy_success', 'tactical_empathy_failure',
+    'mirroring_count', 'emotional_labeling_success', 'emotional_labeling_failure',
+)
+
+SENDERS = ('system', 'suspect', 'player')
+SENDER_CODES = {sender: code for code, sender in enumerate(SENDERS)}
+
+# Opening messages that are never trimmed (two system notices and the suspect's opening line)
+KEEP_OPENING_MESSAGES = 3
+
+DEFAULTS = {
+    'COMPRESS_MIN_BYTES': 512,
+    'COMPRESS_LEVEL': 6,
+    'MAX_BYTES': 32768,
+}
+
+
+class SessionCodecError(ValueError):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GUEST_SESSION_CODEC', {})}
+
+
+def _pack(record):
+    if msgpack is not None:
+        return msgpack.packb(record, use_bin_type=True), FLAG_MSGPACK
+    return json.dumps(record, separators=(',', ':')).encode(), 0
+
+
+def _unpack(payload, flags):
+    if flags & FLAG_MSGPACK:
+        if msgpack is None:
+            raise SessionCodecError("Session state was written with msgpack, which is not installed")
+        return msgpack.unpackb(payload, raw=False)
+    return json.loads(payload)
+
+
+def _encode_record(record, config):
+    payload, flags = _pack(record)
+    if len(payload) >= config['COMPRESS_MIN_BYTES']:
+        payload = zlib.compress(payload, config['COMPRESS_LEVEL'])
+        flags |= FLAG_ZLIB
+    return base64.b64encode(bytes([VERSION, flags]) + payload).decode('ascii')
+
+
+@metrics.timed('session.encode')
+def encode_game_state(game_state):
+    """Serialize a GameState for the session, trimming old messages if it exceeds MAX_BYTES"""
+    config = get_config()
+    data = game_state.to_dict()
+    messages = [[SENDER_CODES.get(sender, sender), text] for sender, text in data['messages']]
+    record = [data[field] for field in FIELDS]
+    encoded = _encode_record(record + [messages], config)
+
+    original_length = len(messages)
+    while len(encoded) > config['MAX_BYTES'] and len(messages) > KEEP_OPENING_MESSAGES + 1:
+        # Drop the oldest quarter of the conversation after the opening; the latest lines matter most
+        trimmable = len(messages) - KEEP_OPENING_MESSAGES - 1
+        del messages[KEEP_OPENING_MESSAGES:KEEP_OPENING_MESSAGES + max(1, trimmable // 4)]
+        encoded = _encode_record(record + [messages], config)
+    if len(messages) < original_length:
+        logger.warning("Guest session state over %s bytes; trimmed transcript from %s to %s messages",
+                       config['MAX_BYTES'], original_length, len(messages))
+    return encoded
+
+
+@metrics.timed('session.decode')
+def decode_game_state(value):
+    """Inverse of ``encode_game_state``; also accepts legacy ``to_dict`` dicts"""
+    if isinstance(value, dict):
+        try:
+            return GameState.from_dict(value)
+        except (KeyError, TypeError, ValueError) as e:
+            raise SessionCodecError(f"Malformed legacy session state: {e!r}") from e
+
+    try:
+        blob = base64.b64decode(value.encode('ascii'), validate=True)
+    except (ValueError, AttributeError) as e:
+        raise SessionCodecError(f"Malformed session state: {e}") from e
+    if len(blob) < 2:
+        raise SessionCodecError("Session state is too short")
+
+    version, flags, payload = blob[0], blob[1], blob[2:]
+    if version != VERSION:
+        raise SessionCodecError(f"Unsupported session state version {version}")
+    try:
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        record = _unpack(payload, flags)
+        data = dict(zip(FIELDS, record))
+        data['messages'] = [
+            (SENDERS[sender] if isinstance(sender, int) else sender, text)
+            for sender, text in record[len(FIELDS)]
+        ]
+        return GameState.from_dict(data)
+    except SessionCodecError:
+        raise
+    except Exception as e:
+        # Truncated or tampered payloads fail in zlib, the unpacker or from_dict; all mean the same thing
+        raise SessionCodecError(f"Corrupt session state: {e!r}") from e
@@ -0,0 +1,209 @@
+"""Headless batch play of negotiations for balance testing.
+
+Each game is played the same way as in the browser: ``process_turn`` for the
+player's line, then the mock suspect from ``get_mock_response`` answers
+through ``GameState.process_ai_response``. No HTTP or database access is
+involved. The parent process loads the scenarios once and sends workers
+plain model instances, so a ``ProcessPoolExecutor`` can spread the games
+over every core.
+
+Each game reseeds the ``random`` module from (seed, scenario id, game index).
+Results therefore depend only on ``seed`` and not on how games are split
+across workers.
+
+    from game.simulation import simulate
+    report = simulate(games=1000, policy='scripted', seed=42)
+"""
+import logging
+import os
+import random
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from .classifier import words
+from .game_logic import GameState, calculate_game_score, process_turn
+from .grok_client import get_mock_response
+from .scenario_manager import ScenarioManager
+
+logger = logging.getLogger(__name__)
+
+MAX_TURNS = 10
+CHUNK_SIZE = 250
+
+# Player lines grouped by the response type they are written to trigger
+LINES = {
+    'empathy': ["I understand this is hard for you", "I want to help you get through this"],
+    'calibrated': ["What do you need from us right now?", "How can we make this work for everyone?"],
+    'action': ["I can arrange some food for everyone", "Let's make a deal here"],
+    'release_request': ["Release the hostages and we can talk", "Let them go first"],
+    'mistake': ["No, that won't happen", "Stop making threats"],
+    'neutral': ["We are still here", "The team is outside"],
+}
+ACCEPT_LINE = "Yes, I accept your surrender"
+SCRIPT = ['calibrated', 'mirror', 'empathy', 'calibrated', 'mirror', 'action', 'calibrated', 'mirror', 'empathy']
+
+
+def mirror_line(game_state, rng):
+    last_suspect_message = next((text for sender, text in reversed(game_state.messages) if sender == 'suspect'), '')
+    tokens = words(last_suspect_message)
+    if len(tokens) < 3:
+        return rng.choice(LINES['calibrated'])
+    start = rng.randrange(len(tokens) - 2)
+    return "So you're saying " + ' '.join(tokens[start:start + 3])
+
+
+def line_for(kind, game_state, rng):
+    if kind == 'mirror':
+        return mirror_line(game_state, rng)
+    return rng.choice(LINES[kind])
+
+
+def random_policy(game_state, rng):
+    """Uniformly random line type; accepts surrender when offered"""
+    if game_state.surrender_offered:
+        return ACCEPT_LINE
+    return line_for(rng.choice([*LINES, 'mirror']), game_state, rng)
+
+
+def scripted_policy(game_state, rng):
+    """Textbook de-escalation sequence: questions, mirroring and limited empathy"""
+    if game_state.surrender_offered:
+        return ACCEPT_LINE
+    return line_for(SCRIPT[(game_state.turn - 1) % len(SCRIPT)], game_state, rng)
+
+
+POLICIES = {
+    'random': random_policy,
+    'scripted': scripted_policy,
+}
+
+
+def play_game(scenario, policy, seed):
+    """Play one game to the end; returns (success, score, turns)"""
+    random.seed(seed)
+    rng = random.Random(seed)
+    game_state = GameState(tension=5, trust=3, hostages=scenario.hostages, scenario=scenario)
+    game_state.messages.append(("suspect", scenario.opening_dialogue))
+
+    while not game_state.game_over:
+        if game_state.turn >= MAX_TURNS:
+            # Same close-out as views._finish_game
+            game_state.game_over = True
+            game_state.success = game_state.tension <= 2 and game_state.trust >= 7
+            break
+        processed, _ = process_turn(game_state, policy(game_state, rng))
+        if not processed or game_state.game_over:
+            break
+        game_state.process_ai_response(get_mock_response(game_state)['suspect_response'])
+
+    game_state.game_over = True
+    return game_state.success, calculate_game_score(game_state), game_state.turn
+
+
+def game_seed(seed, scenario_id, index):
+    return f"{seed}:{scenario_id}:{index}"
+
+
+def _play_chunk(scenario, policy_name, seed, start, stop):
+    policy = POLICIES[policy_name]
+    return scenario.id, [play_game(scenario, policy, game_seed(seed, scenario.id, index)) for index in range(start, stop)]
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    # Per-turn debug logging would dominate the run time
+    logging.disable(logging.DEBUG)
+
+
+@dataclass
+class ScenarioReport:
+    scenario_id: int
+    name: str
+    games: int = 0
+    wins: int = 0
+    scores: list = field(default_factory=list)
+    turns: list = field(default_factory=list)
+
+    @property
+    def win_rate(self):
+        return self.wins / self.games if self.games else 0.0
+
+    def score_histogram(self):
+        """Count of games per whole-number score band (1-10)"""
+        return dict(sorted(Counter(int(score) for score in self.scores).items()))
+
+    def turns_histogram(self):
+        return dict(sorted(Counter(self.turns).items()))
+
+    def to_dict(self):
+        scores = sorted(self.scores)
+        return {
+            'scenario_id': self.scenario_id,
+            'name': self.name,
+            'games': self.games,
+            'win_rate': round(self.win_rate, 4),
+            'score_mean': round(statistics.fmean(scores), 3) if scores else None,
+            'score_median': statistics.median(scores) if scores else None,
+            'score_p10': scores[len(scores) // 10] if scores else None,
+            'score_p90': scores[len(scores) * 9 // 10] if scores else None,
+            'score_histogram': self.score_histogram(),
+            'turns_mean': round(statistics.fmean(self.turns), 3) if self.turns else None,
+            'turns_histogram': self.turns_histogram(),
+        }
+
+
+def simulate(scenarios=None, games=1000, policy='random', seed=0, workers=None):
+    """Play ``games`` games per scenario and return {'scenarios': [...], 'games_per_second': ...}
+
+    ``scenarios`` defaults to every scenario in the registry. ``workers=1`` plays
+    in-process; otherwise a process pool with ``workers`` (default: all cores) is used.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy {policy!r}; choose from {', '.join(POLICIES)}")
+    scenarios = list(scenarios) if scenarios is not None else ScenarioManager.all()
+    workers = workers or os.cpu_count() or 1
+    reports = {scenario.id: ScenarioReport(scenario.id, scenario.name) for scenario in scenarios}
+    tasks = [
+        (scenario, policy, seed, start, min(start + CHUNK_SIZE, games))
+        for scenario in scenarios
+        for start in range(0, games, CHUNK_SIZE)
+    ]
+
+    started = time.perf_counter()
+    if workers == 1:
+        previous_disable = logging.root.manager.disable
+        logging.disable(logging.DEBUG)
+        try:
+            results = [_play_chunk(*task) for task in tasks]
+        finally:
+            logging.disable(previous_disable)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            results = list(executor.map(_play_chunk, *zip(*tasks))) if tasks else []
+    elapsed = time.perf_counter() - started
+
+    for scenario_id, outcomes in results:
+        report = reports[scenario_id]
+        for success, score, turns in outcomes:
+            report.games += 1
+            report.wins += bool(success)
+            report.scores.append(score)
+            report.turns.append(turns)
+
+    total = sum(report.games for report in reports.values())
+    logger.info("Simulated %s games in %.2fs with %s worker(s)", total, elapsed, workers)
+    return {
+        'policy': policy,
+        'seed': seed,
+        'workers': workers,
+        'seconds': elapsed,
+        'games_per_second': total / elapsed if elapsed else None,
+        'scenarios': [report.to_dict() for report in reports.values()],
+    }
@@ -0,0 +1,279 @@
+"""Exact solver for the negotiation state machine.
+
+A game lasts at most ten turns, tension and trust stay within 1-10, and the
+player chooses from a handful of response types, so the whole game tree can
+be solved by backward dynamic programming. The solver state is::
+
+    (turn, tension, trust, surrender_offered, emotional_appeals, poor_choices)
+
+Values are capped wherever the rules stop telling them apart:
+- ``emotional_appeals``: only "fewer than two appeals" versus "two or more"
+  changes the outcome.
+- ``poor_choices``: the tactical score bottoms out at five.
+
+Hostages are left out of the state entirely. They never feed back into
+tension, trust, the win rule or ``calculate_game_score``, so a scenario is
+characterized by ``initial_mood`` alone.
+
+Each move is evaluated as ``process_turn`` followed by
+``process_ai_response``. A line with no keywords is the only random move:
+it counts as ``unpredictable`` 20% of the time and ``neutral`` otherwise.
+The policy first maximizes the win probability and then the expected final
+score. ``solve`` builds the complete policy table for one ``initial_mood``.
+
+Solving takes seconds, so it never happens on the request path.
+``manage.py solve_scenarios --write`` solves every mood once and writes the
+policies to ``settings.SOLVER_POLICY_FILE``, one digit per state.
+``best_move`` and ``get_hint`` index into that file, which is loaded once
+per process (``GameConfig.ready`` warms it). A mood missing from the file
+gets the fallback hint.
+"""
+import json
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+
+from . import metrics
+from .game_logic import GameState, calculate_game_score
+from .rules import MAX_LEVEL, MIN_LEVEL, get_transition
+
+MAX_TURNS = 10
+UNPREDICTABLE_CHANCE = 0.2
+START_TENSION = 5
+START_TRUST = 3
+
+# Player moves and the response types they produce: [(probability, response_type)]
+MOVES = {
+    'calibrated': [(1.0, 'calibrated')],
+    'mirror': [(1.0, 'mirror')],
+    'empathy': [(1.0, 'empathy')],
+    'action': [(1.0, 'action')],
+    'release_request': [(1.0, 'release_request')],
+    'mistake': [(1.0, 'mistake')],
+    'small_talk': [(UNPREDICTABLE_CHANCE, 'unpredictable'), (1 - UNPREDICTABLE_CHANCE, 'neutral')],
+}
+
+HINTS = {
+    'accept_surrender': "They're ready to give up. Accept the surrender.",
+    'calibrated': "Ask an open 'how' or 'what' question to keep them talking.",
+    'mirror': "Repeat the last few words they said back to them.",
+    'empathy': "Acknowledge how they feel; empathy lowers tension while it's fresh.",
+    'action': "Offer something concrete in exchange.",
+    'release_request': "Ask them to release the hostages.",
+    'mistake': "Hold the line and refuse their demand.",
+    'small_talk': "Keep things calm and low-key for now.",
+}
+FALLBACK_HINT = "Keep building rapport through active listening."
+
+MAX_POOR_CHOICES = 5
+
+# Move names in policy file order; a policy stores each state's move as its index here
+POLICY_MOVES = ('accept_surrender', *MOVES)
+POLICY_FILE = Path(__file__).with_name('solver_policies.json')
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Outcome:
+    win_probability: float
+    expected_score: float
+    move: str = None
+
+
+@dataclass
+class Solution:
+    initial_mood: int
+    policy: dict
+    start: Outcome
+
+    @property
+    def difficulty(self):
+        """0 (trivial) to 1 (unwinnable even with perfect play), blending win chance and best score"""
+        return round(1 - (self.start.win_probability * 0.5 + self.start.expected_score / 20), 3)
+
+    def move_for(self, game_state):
+        return self.policy.get(state_key(game_state))
+
+
+class _Mood:
+    """Stand-in scenario for ``calculate_game_score``, which only reads ``initial_mood``"""
+    __slots__ = ('initial_mood',)
+
+    def __init__(self, initial_mood):
+        self.initial_mood = initial_mood
+
+
+def state_key(game_state):
+    return (
+        game_state.turn,
+        game_state.tension,
+        game_state.trust,
+        game_state.surrender_offered,
+        min(game_state.emotional_appeals_count, 2),
+        min(game_state.poor_choices, MAX_POOR_CHOICES),
+    )
+
+
+def state_index(key):
+    """Position of a ``state_key`` in ``all_states()`` order, or None outside the solved space"""
+    turn, tension, trust, surrender_offered, appeals, poor_choices = key
+    if not (1 <= turn < MAX_TURNS and MIN_LEVEL <= tension <= MAX_LEVEL and MIN_LEVEL <= trust <= MAX_LEVEL):
+        return None
+    levels = MAX_LEVEL - MIN_LEVEL + 1
+    index = ((turn - 1) * levels + tension - MIN_LEVEL) * levels + trust - MIN_LEVEL
+    return ((index * 2 + bool(surrender_offered)) * 3 + appeals) * (MAX_POOR_CHOICES + 1) + poor_choices
+
+
+def final_score(initial_mood, turn, tension, trust, poor_choices):
+    game_state = GameState(turn=turn, tension=tension, trust=trust, messages=[], scenario=_Mood(initial_mood),
+                           poor_choices=poor_choices, game_over=True)
+    return calculate_game_score(game_state)
+
+
+def _apply(state, response_type):
+    """Successor of ``state`` after ``response_type``: ('win'|'lose'|'end'|None, next_state)"""
+    turn, tension, trust, surrender_offered, appeals, poor_choices = state
+    if response_type == 'empathy':
+        appeals += 1
+        if appeals > 2:
+            response_type = 'overused_emotion'
+    transition = get_transition(response_type, tension, trust)
+    tension += transition.tension_delta
+    trust += transition.trust_delta
+    if 'poor_choices' in transition.counters:
+        poor_choices = min(poor_choices + 1, MAX_POOR_CHOICES)
+    surrender_offered = surrender_offered or transition.offer_surrender
+
+    turn += 1
+    next_state = (turn, tension, trust, surrender_offered, min(appeals, 2), poor_choices)
+    if tension >= 10:
+        return 'lose', next_state
+    if turn >= MAX_TURNS:
+        return ('win' if tension <= 2 and trust >= 7 else 'end'), next_state
+    return None, next_state
+
+
+def all_states():
+    levels = range(MIN_LEVEL, MAX_LEVEL + 1)
+    for turn in range(1, MAX_TURNS):
+        for tension in levels:
+            for trust in levels:
+                for surrender_offered in (False, True):
+                    for appeals in range(3):
+                        for poor_choices in range(MAX_POOR_CHOICES + 1):
+                            yield (turn, tension, trust, surrender_offered, appeals, poor_choices)
+
+
+@lru_cache(maxsize=1)
+def successors():
+    """{state: [(move, [(probability, result, next_state)])]}; the same for every scenario"""
+    return {
+        state: [
+            (move, [(probability, *_apply(state, response_type)) for probability, response_type in branches])
+            for move, branches in MOVES.items()
+        ]
+        for state in all_states()
+    }
+
+
+def solve(initial_mood):
+    """Optimal policy for every state of a scenario with this ``initial_mood`` (cached per mood)"""
+    return _solve(initial_mood)
+
+
+@lru_cache(maxsize=16)
+def _solve(initial_mood):
+    graph = successors()
+    terminal_scores = {}
+
+    def terminal_score(turn, tension, trust, poor_choices):
+        key = (turn, tension, trust, poor_choices)
+        if key not in terminal_scores:
+            terminal_scores[key] = final_score(initial_mood, *key)
+        return terminal_scores[key]
+
+    # (win_probability, expected_score) per state; compared as tuples, so winning comes first
+    values = {}
+    policy = {}
+    # Later turns first, so every successor is already solved
+    for state in sorted(graph, reverse=True):
+        turn, tension, trust, surrender_offered, _, poor_choices = state
+        best_move, best_value = None, None
+        if surrender_offered:
+            # Accepting ends the game as a success without advancing the turn
+            best_move, best_value = 'accept_surrender', (1.0, terminal_score(turn, tension, trust, poor_choices))
+        for move, branches in graph[state]:
+            win_probability = expected_score = 0.0
+            for probability, result, next_state in branches:
+                if result is None:
+                    win, score = values[next_state]
+                else:
+                    win = 1.0 if result == 'win' else 0.0
+                    score = terminal_score(next_state[0], next_state[1], next_state[2], next_state[5])
+                win_probability += probability * win
+                expected_score += probability * score
+            if best_value is None or (win_probability, expected_score) > best_value:
+                best_move, best_value = move, (win_probability, expected_score)
+        values[state] = best_value
+        policy[state] = best_move
+
+    start = (1, START_TENSION, START_TRUST, False, 0, 0)
+    return Solution(initial_mood, policy, Outcome(*values[start], policy[start]))
+
+
+def encode_policy(solution):
+    """A solution's policy as one ``POLICY_MOVES`` digit per state, in ``all_states()`` order"""
+    return ''.join(str(POLICY_MOVES.index(solution.policy[state])) for state in all_states())
+
+
+def policy_file():
+    return Path(getattr(settings, 'SOLVER_POLICY_FILE', POLICY_FILE))
+
+
+def write_policies(moods, path=None):
+    """Solve every mood in ``moods`` and write the policy file ``best_move`` reads"""
+    path = Path(path or policy_file())
+    data = {
+        'moves': list(POLICY_MOVES),
+        'policies': {str(mood): encode_policy(solve(mood)) for mood in sorted(set(moods))},
+    }
+    path.write_text(json.dumps(data, indent=1) + '\n')
+    policy_table.cache_clear()
+    return path
+
+
+@lru_cache(maxsize=1)
+def policy_table():
+    """{initial_mood: encoded policy} from the policy file; empty when it is missing or stale"""
+    path = policy_file()
+    try:
+        data = json.loads(path.read_text())
+    except FileNotFoundError:
+        logger.warning("No solver policy file at %s; run manage.py solve_scenarios --write", path)
+        return {}
+    if data['moves'] != list(POLICY_MOVES):
+        logger.warning("Solver policy file %s was written for other moves; run manage.py solve_scenarios --write",
+                       path)
+        return {}
+    return {int(mood): policy for mood, policy in data['policies'].items()}
+
+
+def best_move(game_state):
+    """Optimal next move for a live game, or None if the state is outside the solved space"""
+    if game_state.scenario is None or game_state.game_over:
+        return None
+    policy = policy_table().get(game_state.scenario.initial_mood)
+    if policy is None:
+        metrics.increment('solver_policy_misses')
+        return None
+    index = state_index(state_key(game_state))
+    return None if index is None else POLICY_MOVES[int(policy[index])]
+
+
+def get_hint(game_state):
+    """Hint text for the optimal next move; an index into the precomputed policy"""
+    return HINTS.get(best_move(game_state), FALLBACK_HINT)
@@ -1,3 +1,1439 @@
-from django.test import TestCase
+import asyncio
+import base64
+import importlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.apps import apps as django_apps
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import attempt_history, batch_engine, benchmarks, context_window, grok_client, guest_store, metrics
+from .circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, grok_breaker
+from .classifier import classify, mirrors
+from .flow_control import AsyncSingleFlight, GrokBusyError, RateLimiter, SingleFlight
+from .game_logic import GameState, calculate_game_score
+from .logs import QueueingStreamHandler, log_payload
+from .grok_stub import STUB_REPLY, start_stub_server
+from . import leaderboard
+from .models import (GameProgress, GameTurn, GuestGame, LeaderboardEntry, Scenario, ScenarioAttempt, Score,
+                     ScoreStats, User)
+from .rules import RULES
+from .scenario_manager import ScenarioManager
+from .session_codec import SessionCodecError, decode_game_state, encode_game_state
+from . import dates, flow_control, session_codec
+from .simulation import simulate
+from . import player_stats, prompts, score_stats, solver
+from .response_cache import LocalResponseCache, make_cache_key, response_cache
+
+
+def make_scenario(**kwargs):
+    fields = {
+        'id': 1,
+        'name': 'Bank Standoff',
+        'setting': 'Downtown bank',
+        'suspect': 'Desperate robber',
+        'initial_mood': 7,
+        'hostages': 4,
+        'opening_dialogue': 'Nobody move!',
+        'demand': 'A getaway car',
+        'goal': 'Peaceful surrender',
+        'suspect_type': 'emotional',
+    }
+    fields.update(kwargs)
+    return Scenario(**fields)
+
+
+def make_attempt(user, scenario, **kwargs):
+    fields = {
+        'scenario_name': scenario.name,
+        'initial_tension': 5, 'current_tension': 5,
+        'initial_trust': 3, 'current_trust': 3,
+        'initial_hostages': scenario.hostages, 'current_hostages': scenario.hostages,
+    }
+    fields.update(kwargs)
+    return ScenarioAttempt.objects.create(user=user, scenario=scenario, **fields)
+
+
+class GrokClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server, url = start_stub_server()
+        self._api_url = grok_client.API_URL
+        grok_client.API_URL = url
+
+    def tearDown(self):
+        grok_client.close_http_clients()
+        grok_client.API_URL = self._api_url
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sync_client_is_shared(self):
+        self.assertIs(grok_client.get_http_client(), grok_client.get_http_client())
+        response = grok_client.make_api_call("system", "user")
+        self.assertEqual(response['choices'][0]['message']['content'], STUB_REPLY)
+
+    def test_async_calls_share_pool(self):
+        async def run():
+            try:
+                client = grok_client.get_async_http_client()
+                results = await asyncio.gather(
+                    *(grok_client.make_api_call_async("system", f"user {index}") for index in range(5))
+                )
+                self.assertIs(client, grok_client.get_async_http_client())
+                return results
+            finally:
+                await grok_client.aclose_http_clients()
+
+        results = asyncio.run(run())
+        self.assertEqual(len(results), 5)
+        self.assertEqual(self.server.request_count, 5)
+        for result in results:
+            self.assertEqual(result['choices'][0]['message']['content'], STUB_REPLY)
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        response_cache.reset()
+        self.server, url = start_stub_server()
+        patcher = mock.patch.multiple(grok_client, API_URL=url, API_KEY='test-key')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        response_cache.reset()
+        grok_client.close_http_clients()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_key_ignores_case_punctuation_and_small_moves(self):
+        game_state = GameState(tension=8, trust=2, scenario=make_scenario())
+        key = make_cache_key(game_state, "What do you need?")
+        game_state.tension, game_state.trust = 9, 3
+        self.assertEqual(key, make_cache_key(game_state, "  what do you NEED "))
+        game_state.tension = 5
+        self.assertNotEqual(key, make_cache_key(game_state, "what do you need"))
+
+    def test_key_depends_on_the_conversation_history(self):
+        scenario = make_scenario()
+        calm = GameState(scenario=scenario, messages=[('player', 'Hello'), ('suspect', 'Stay back')])
+        angry = GameState(scenario=scenario, messages=[('player', 'Come out now'), ('suspect', 'Never')])
+        self.assertNotEqual(make_cache_key(calm, "What do you need?"), make_cache_key(angry, "What do you need?"))
+        with self.settings(GROK_CONTEXT_WINDOW={'ENABLED': False}):
+            # No history in the prompt, so the reply doesn't depend on it
+            self.assertEqual(make_cache_key(calm, "What do you need?"), make_cache_key(angry, "What do you need?"))
+
+    def test_local_backend_evicts_lru_and_expires(self):
+        cache = LocalResponseCache(ttl=60, max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+        expired = LocalResponseCache(ttl=0, max_entries=2)
+        expired.set('a', 1)
+        self.assertIsNone(expired.get('a'))
+
+    def test_repeated_turn_is_served_from_cache(self):
+        for _ in range(2):
+            game_state = GameState(scenario=make_scenario())
+            response = json.loads(grok_client.get_ai_response(game_state, "What do you need?"))
+            self.assertEqual(response['suspect_response'], STUB_REPLY)
+            self.assertEqual(game_state.messages[-1], ("suspect", STUB_REPLY))
+
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(response_cache.stats()['hits'], 1)
+        self.assertEqual(response_cache.stats()['misses'], 1)
+
+    @override_settings(GROK_RESPONSE_CACHE={'EXCLUDED_SCENARIOS': ['Bank Standoff']})
+    def test_excluded_scenario_is_not_cached(self):
+        response_cache.reset()
+        for _ in range(2):
+            grok_client.get_ai_response(GameState(scenario=make_scenario()), "What do you need?")
+        self.assertEqual(self.server.request_count, 2)
+
+
+class StreamingTests(TestCase):
+    def test_stream_api_reply_word_by_word(self):
+        server, url = start_stub_server()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(grok_client.close_http_clients)
+        self.addCleanup(response_cache.reset)
+        with mock.patch.multiple(grok_client, API_URL=url, API_KEY='test-key'):
+            chunks = list(grok_client.stream_ai_response(GameState(scenario=make_scenario()), "Talk to me"))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), STUB_REPLY)
+
+    def start_stub(self, **kwargs):
+        server, url = start_stub_server(**kwargs)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(grok_client.close_http_clients)
+        self.addCleanup(response_cache.reset)
+        patcher = mock.patch.multiple(grok_client, API_URL=url, API_KEY='test-key')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return url
+
+    def test_slow_reader_does_not_hold_the_host_slot(self):
+        url = self.start_stub()
+        with mock.patch.multiple(grok_client, MAX_REQUESTS_PER_HOST=1, QUEUE_TIMEOUT=2):
+            stream = grok_client.stream_api_call("system", "user")
+            first = next(stream)
+            # The reader frees the slot once Grok is done, while this stream is still unread
+            with grok_client._host_limit(url):
+                pass
+            self.assertEqual(first + ''.join(stream), STUB_REPLY)
+
+    def test_async_slow_reader_does_not_hold_the_host_slot(self):
+        url = self.start_stub()
+
+        async def run():
+            stream = grok_client.stream_api_call_async("system", "user")
+            first = await stream.__anext__()
+            async with grok_client._async_host_limit(url):
+                pass
+            rest = [chunk async for chunk in stream]
+            await grok_client.aclose_http_clients()
+            return first + ''.join(rest)
+
+        with mock.patch.multiple(grok_client, MAX_REQUESTS_PER_HOST=1, QUEUE_TIMEOUT=2):
+            self.assertEqual(asyncio.run(run()), STUB_REPLY)
+
+    def test_disconnected_stream_still_saves_the_turn(self):
+        self.start_stub(token_delay=0.01)
+        user = User.objects.create_user(username='leaver', email='leaver@example.com', password='pw')
+        self.client.force_login(user)
+        self.client.get(reverse('start_game', args=[Scenario.objects.first().id]))
+        response = self.client.post(reverse('play_stream'), {'choice': 'Tell me what you need'})
+        next(iter(response.streaming_content))
+        response.close()
+        turn = GameTurn.objects.get(attempt__user=user)
+        self.assertEqual(turn.game_response, STUB_REPLY)
+
+    def test_guest_stream_commits_reply(self):
+        scenario = Scenario.objects.first()
+        self.client.get(reverse('start_game', args=[scenario.id]))
+
+        with mock.patch.object(grok_client, 'API_KEY', None):
+            response = self.client.post(reverse('play_stream'), {'choice': 'Tell me what you need'})
+            body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = [event for event in body.split('\n\n') if event]
+        tokens = [json.loads(event.split('data: ', 1)[1])['text'] for event in events if event.startswith('event: token')]
+        self.assertTrue(events[-1].startswith('event: done'))
+
+        game_state = decode_game_state(guest_store.get_store().load(self.client.session)['game_state'])
+        self.assertEqual(game_state.turn, 2)
+        self.assertEqual(game_state.messages[-1], ('suspect', ''.join(tokens)))
+        self.assertEqual(game_state.messages[-2], ('player', 'Tell me what you need'))
+
+
+class TurnPersistenceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='negotiator', email='n@example.com', password='secret123')
+        self.client.force_login(self.user)
+        self.scenario = Scenario.objects.first()
+        self.client.get(reverse('start_game', args=[self.scenario.id]))
+        self.attempt = ScenarioAttempt.objects.get(user=self.user)
+
+    def test_turns_are_appended_not_rewritten(self):
+        opening = list(self.attempt.messages)
+        with mock.patch.object(grok_client, 'API_KEY', None):
+            self.client.post(reverse('play'), {'choice': 'What do you need?'})
+            self.client.post(reverse('play'), {'choice': 'Tell me more about that'})
+
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.messages, opening)
+        self.assertEqual(self.attempt.current_turn, 3)
+        turns = list(self.attempt.turns.all())
+        self.assertEqual([turn.turn_number for turn in turns], [1, 2])
+        self.assertEqual(turns[0].player_input, 'What do you need?')
+        self.assertEqual(self.attempt.get_transcript(), opening + turns[0].messages + turns[1].messages)
+
+    def test_update_writes_only_changed_columns(self):
+        game_state = self.attempt.get_game_state()
+        game_state.messages.append(("player", "I hear you"))
+        game_state.turn += 1
+        with self.assertNumQueries(2) as context:
+            self.attempt.update_from_game_state(game_state)
+        update_sql = context.captured_queries[1]['sql']
+        self.assertIn('"current_turn"', update_sql)
+        self.assertNotIn('"messages"', update_sql)
+        self.assertEqual(GameTurn.objects.filter(attempt=self.attempt).count(), 1)
+
+
+class ClassifierTests(SimpleTestCase):
+    def test_all_categories_in_one_pass(self):
+        self.assertEqual(classify("okay, what's the deal? please let them go"),
+                         {'accept', 'action', 'empathy', 'release_request'})
+        self.assertEqual(classify("what do you need?"), {'calibrated', 'empathy'})
+
+    def test_keywords_match_whole_words_only(self):
+        self.assertEqual(classify("i know you took the car"), set())
+        self.assertEqual(classify("how?"), set())
+
+    def test_mirroring_ignores_punctuation(self):
+        self.assertTrue(mirrors("so you want a helicopter, now?", "I want a helicopter to fly me out"))
+        self.assertFalse(mirrors("you want helicopters", "I want a helicopter to fly me out"))
+
+    def test_detect_response_type_precedence(self):
+        game_state = GameState()
+        game_state.messages.append(("suspect", "Bring me the car right now"))
+        self.assertEqual(game_state.detect_response_type("I can arrange a deal, no problem"), 'action')
+        self.assertEqual(game_state.detect_response_type("You said the car right now"), 'mirror')
+        self.assertEqual(game_state.detect_response_type("Release them or else"), 'release_request')
+        self.assertEqual(game_state.detect_response_type("No way"), 'mistake')
+
+
+def legacy_adjust_state(self, response_type):
+    """adjust_state as it was before the transition table, kept as the reference behaviour"""
+    changes = {
+        'empathy': {'tension': -2, 'trust': 2, 'tactical_empathy_success': 1},
+        'mirror': {'tension': -1, 'trust': 2, 'mirroring_count': 1},
+        'emotional_label': {'tension': -2, 'trust': 2, 'emotional_labeling_success': 1},
+        'action': {'tension': -2 if self.trust > 5 else 2, 'trust': 2 if self.tension <= 7 else -1},
+        'calibrated': {'tension': -2, 'trust': 3},
+        'release_request': {'tension': 3 if self.trust < 5 else -1, 'trust': -2 if self.tension >= 8 else 1},
+        'accept_surrender': {'tension': 0, 'trust': 0},
+        'neutral': {'tension': 1, 'trust': -1, 'poor_choices': 1},
+        'mistake': {'tension': 3, 'trust': -3, 'poor_choices': 1},
+        'overused_emotion': {'tension': 2, 'trust': -2, 'emotional_appeals_count': 1},
+    }
+    change = changes.get(response_type, {'tension': 0, 'trust': 0})
+    self.tension = max(1, min(10, self.tension + change.get('tension', 0)))
+    self.trust = max(1, min(10, self.trust + change.get('trust', 0)))
+    for counter in ('tactical_empathy_success', 'mirroring_count', 'emotional_labeling_success',
+                    'poor_choices', 'emotional_appeals_count'):
+        if change.get(counter):
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    emotional_state = self.get_emotional_state()
+    if not self.game_over:
+        if emotional_state == 'resigned' and self.trust >= 2:
+            self.consider_hostage_release(all_hostages=True)
+        elif emotional_state == 'strategic' and self.trust >= 4:
+            self.consider_hostage_release()
+        elif emotional_state == 'agitated' and self.trust >= 6:
+            self.consider_hostage_release()
+        elif emotional_state == 'volatile' and self.trust >= 8:
+            self.consider_hostage_release()
+
+    if self.tension <= 2 and self.trust >= 8 and not self.surrender_offered:
+        self.surrender_offered = True
+        self.messages.append(("system", "The suspect is ready to surrender. Do you accept?"))
+
+
+class TransitionTableTests(SimpleTestCase):
+    def test_matches_legacy_adjust_state(self):
+        response_types = [*RULES, 'unpredictable']
+        for response_type in response_types:
+            for tension in range(0, 11):
+                for trust in range(0, 11):
+                    for surrender_offered in (False, True):
+                        states = [
+                            GameState(tension=tension, trust=trust, hostages=3, surrender_offered=surrender_offered)
+                            for _ in range(2)
+                        ]
+                        legacy_adjust_state(states[0], response_type)
+                        states[1].adjust_state(response_type)
+                        self.assertEqual(states[0], states[1], (response_type, tension, trust, surrender_offered))
+
+
+class SessionCodecTests(SimpleTestCase):
+    def make_state(self, turns):
+        game_state = GameState(tension=4, trust=6, mirroring_count=2, promises_kept=['car'])
+        for turn in range(turns):
+            game_state.messages.append(("player", f"Turn {turn}: tell me what you need to end this"))
+            game_state.messages.append(("suspect", f"Turn {turn}: I need a car and a clear road out"))
+        return game_state
+
+    def test_round_trip_keeps_tuples_and_counters(self):
+        game_state = self.make_state(3)
+        decoded = decode_game_state(encode_game_state(game_state))
+        self.assertEqual(decoded, game_state)
+        self.assertEqual(decoded.messages[-1], ("suspect", "Turn 2: I need a car and a clear road out"))
+
+    def test_legacy_dict_sessions_still_load(self):
+        game_state = self.make_state(1)
+        legacy = json.loads(json.dumps(game_state.to_dict()))
+        self.assertEqual(decode_game_state(legacy), game_state)
+
+    def test_dict_round_trip_does_not_share_lists(self):
+        game_state = self.make_state(1)
+        data = game_state.to_dict()
+        restored = GameState.from_dict(data)
+        restored.promises_kept.append('phone')
+        game_state.promises_kept.append('food')
+        game_state.messages.append(("player", "One more thing"))
+        self.assertEqual(data['promises_kept'], ['car'])
+        self.assertEqual(len(data['messages']), len(restored.messages))
+
+    def test_corrupt_payloads_raise_codec_error(self):
+        encoded = encode_game_state(self.make_state(20))
+        blob = base64.b64decode(encoded)
+        corrupt = [
+            base64.b64encode(blob[:len(blob) // 2]).decode(),          # truncated zlib stream
+            base64.b64encode(blob[:2] + b'\x00' * 40).decode(),        # garbage payload
+            base64.b64encode(bytes([session_codec.VERSION, 0]) + b'[1, 2]').decode(),  # wrong shape
+            {'turn': 1},                                                # legacy dict missing fields
+        ]
+        for value in corrupt:
+            with self.subTest(value=str(value)[:20]), self.assertRaises(SessionCodecError):
+                decode_game_state(value)
+
+    def test_json_fallback_and_compression(self):
+        game_state = self.make_state(20)
+        with mock.patch.object(session_codec, 'msgpack', None):
+            encoded = encode_game_state(game_state)
+            self.assertEqual(decode_game_state(encoded), game_state)
+        self.assertLess(len(encoded), len(json.dumps(game_state.to_dict())) / 2)
+
+    @override_settings(GUEST_SESSION_CODEC={'MAX_BYTES': 400, 'COMPRESS_MIN_BYTES': 10 ** 6})
+    def test_size_cap_trims_oldest_messages(self):
+        game_state = self.make_state(20)
+        encoded = encode_game_state(game_state)
+        decoded = decode_game_state(encoded)
+        self.assertLessEqual(len(encoded), 400)
+        self.assertEqual(decoded.messages[:3], game_state.messages[:3])
+        self.assertEqual(decoded.messages[-1], game_state.messages[-1])
+
+
+class ScenarioRegistryTests(TestCase):
+    def setUp(self):
+        ScenarioManager.invalidate()
+        self.addCleanup(ScenarioManager.invalidate)
+        self.scenario = Scenario.objects.first()
+
+    def assertNoScenarioQueries(self, path, data):
+        with mock.patch.object(grok_client, 'API_KEY', None), CaptureQueriesContext(connection) as context:
+            self.client.post(path, data)
+        self.assertFalse([query['sql'] for query in context.captured_queries if '"game_scenario"' in query['sql']])
+
+    def test_guest_play_reads_scenario_from_registry(self):
+        self.client.get(reverse('start_game', args=[self.scenario.id]))
+        self.assertNoScenarioQueries(reverse('play'), {'choice': 'What do you need?'})
+
+    def test_authenticated_play_reads_scenario_from_registry(self):
+        user = User.objects.create_user(username='negotiator', email='n@example.com', password='secret123')
+        self.client.force_login(user)
+        self.client.get(reverse('start_game', args=[self.scenario.id]))
+        self.assertNoScenarioQueries(reverse('play'), {'choice': 'What do you need?'})
+
+    def test_saving_a_scenario_refreshes_registry(self):
+        self.assertEqual(ScenarioManager.get(self.scenario.id).name, self.scenario.name)
+        self.scenario.name = 'Renamed'
+        self.scenario.save()
+        self.assertEqual(ScenarioManager.get(self.scenario.id).name, 'Renamed')
+        with self.assertRaises(Scenario.DoesNotExist):
+            ScenarioManager.get(10 ** 6)
+
+    def test_unknown_ids_fetch_one_row_without_reloading(self):
+        ScenarioManager.registry()
+        with self.assertNumQueries(1), mock.patch.object(ScenarioManager, 'invalidate') as invalidate:
+            with self.assertRaises(Scenario.DoesNotExist):
+                ScenarioManager.get(10 ** 6)
+        invalidate.assert_not_called()
+        with self.assertNumQueries(0), self.assertRaises(Scenario.DoesNotExist):
+            ScenarioManager.get('not-a-number')
+
+        # A row created without signals (as if by another process) is fetched once, then served from memory
+        added, = Scenario.objects.bulk_create([Scenario(
+            name='Elsewhere', setting='Harbour', suspect='Smuggler', initial_mood=5, hostages=2,
+            opening_dialogue='Back off', demand='A boat', goal='Surrender')])
+        with self.assertNumQueries(1):
+            self.assertEqual(ScenarioManager.get(added.id).name, 'Elsewhere')
+        with self.assertNumQueries(0):
+            ScenarioManager.get(added.id)
+
+    @override_settings(SCENARIO_REGISTRY_TTL=60)
+    def test_registry_reloads_after_its_ttl(self):
+        ScenarioManager.registry()
+        Scenario.objects.filter(pk=self.scenario.pk).update(name='Edited elsewhere')
+        self.assertEqual(ScenarioManager.get(self.scenario.id).name, self.scenario.name)
+        with mock.patch('game.scenario_manager.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(ScenarioManager.get(self.scenario.id).name, 'Edited elsewhere')
+
+    def test_start_game_with_unknown_scenario_is_404(self):
+        self.assertEqual(self.client.get(reverse('start_game', args=[10 ** 6])).status_code, 404)
+
+
+class ScenarioListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='negotiator', email='n@example.com', password='secret123')
+        self.client.force_login(self.user)
+        self.scenarios = list(Scenario.objects.all()[:2])
+        for score in (4, 9):
+            make_attempt(self.user, self.scenarios[0], end_time='2026-01-01T00:00:00Z', final_score=score)
+        progress = GameProgress.objects.create(user=self.user)
+        progress.completed_scenarios.add(self.scenarios[1])
+
+    def scenario_data(self):
+        response = self.client.get(reverse('scenario_list'))
+        return {data['scenario'].id: data for data in response.context['scenario_data']}
+
+    def test_query_count_does_not_grow_with_scenarios(self):
+        self.client.get(reverse('scenario_list'))  # warm the scenario registry
+        cache.clear()
+        # session + user, then progress, completed ids and the grouped attempt query
+        with self.assertNumQueries(5):
+            data = self.scenario_data()
+        self.assertEqual(len(data), Scenario.objects.count())
+        self.assertEqual((data[self.scenarios[0].id]['attempts_count'], data[self.scenarios[0].id]['best_score']), (2, 9))
+        self.assertTrue(data[self.scenarios[1].id]['completed'])
+        self.assertFalse(data[self.scenarios[0].id]['completed'])
+        with self.assertNumQueries(2):
+            self.scenario_data()
+
+    def test_finishing_an_attempt_refreshes_summary(self):
+        self.scenario_data()
+        make_attempt(self.user, self.scenarios[0], end_time='2026-01-02T00:00:00Z', final_score=10)
+        self.assertEqual(self.scenario_data()[self.scenarios[0].id]['best_score'], 10)
+        self.user.progress.get().completed_scenarios.add(self.scenarios[0])
+        self.assertTrue(self.scenario_data()[self.scenarios[0].id]['completed'])
+
+
+@override_settings(LEADERBOARD={'SIZE': 3, 'CACHE_TIMEOUT': 300})
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='negotiator', email='n@example.com', password='secret123')
+        self.scenario = Scenario.objects.first()
+
+    def add_score(self, value, **kwargs):
+        score = Score.objects.create(user=self.user, scenario=self.scenario, scenario_name=self.scenario.name,
+                                     score=value, **kwargs)
+        leaderboard.record_score(score)
+        return score
+
+    def test_boards_stay_bounded_and_sorted(self):
+        for value in (5, 9, 2, 7, 8):
+            self.add_score(value)
+        self.assertEqual([row['score'] for row in leaderboard.daily_top_scores()], [9, 8, 7])
+        self.assertEqual([row['score'] for row in leaderboard.all_time_top_scores()], [9, 8, 7])
+        self.assertEqual(LeaderboardEntry.objects.count(), 6)
+        self.assertEqual(leaderboard.daily_top_scores()[0]['username'], 'negotiator')
+
+    def test_cached_board_is_refreshed_by_new_scores(self):
+        self.add_score(5)
+        leaderboard.daily_top_scores()
+        with self.assertNumQueries(0):
+            leaderboard.daily_top_scores()
+        self.add_score(6)
+        self.assertEqual([row['score'] for row in leaderboard.daily_top_scores()], [6, 5])
+
+    def test_rebuild_matches_incremental_boards(self):
+        for value in (4, 1, 6, 3, 6):
+            self.add_score(value)
+        incremental = (leaderboard.daily_top_scores(), leaderboard.all_time_top_scores())
+        Score.objects.create(user=self.user, scenario=self.scenario, scenario_name='copy', score=10, is_daily=False)
+        self.assertEqual(leaderboard.rebuild(), 6)
+        self.assertEqual((leaderboard.daily_top_scores(), leaderboard.all_time_top_scores()), incremental)
+
+    def test_migration_backfills_boards_and_all_time_rows_are_unique(self):
+        migration = importlib.import_module('game.migrations.0015_leaderboard_backfill_all_time_unique')
+        score = Score.objects.create(user=self.user, scenario=self.scenario, scenario_name='old', score=7)
+        self.assertFalse(LeaderboardEntry.objects.exists())
+        migration.backfill_leaderboards(django_apps, None)
+        self.assertEqual([row['score'] for row in leaderboard.all_time_top_scores()], [7])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LeaderboardEntry.objects.create(board=leaderboard.ALL_TIME, day=None, score=score, value=7,
+                                            created_at=score.created_at)
+
+
+class SimulationTests(TestCase):
+    def test_seeded_runs_are_reproducible_across_workers(self):
+        scenarios = list(Scenario.objects.all()[:2])
+        in_process = simulate(scenarios, games=300, policy='random', seed=7, workers=1)
+        pooled = simulate(scenarios, games=300, policy='random', seed=7, workers=2)
+        self.assertEqual(in_process['scenarios'], pooled['scenarios'])
+
+        report = in_process['scenarios'][0]
+        self.assertEqual(report['games'], 300)
+        self.assertEqual(sum(report['turns_histogram'].values()), 300)
+        self.assertTrue(0 < report['win_rate'] < 1)
+        self.assertNotEqual(simulate(scenarios, games=300, seed=8, workers=1)['scenarios'], in_process['scenarios'])
+
+
+    def test_command_reports_runs_too_fast_to_time(self):
+        report = {'policy': 'random', 'seed': 0, 'workers': 1, 'seconds': 0.0, 'games_per_second': None,
+                  'scenarios': []}
+        stdout = io.StringIO()
+        with mock.patch('game.management.commands.simulate.simulate', return_value=report):
+            call_command('simulate', '--games', '1', stdout=stdout)
+        self.assertIn("n/a games/s", stdout.getvalue())
+
+def scalar_turn(game_state, response_type):
+    """One turn of the GameState path for an already-detected response type"""
+    if response_type == 'accept_surrender' and game_state.surrender_offered:
+        # What detect_response_type does before returning accept_surrender
+        game_state.game_over = True
+        game_state.success = True
+        game_state.release_hostages(surrender=True)
+    elif response_type == 'empathy':
+        # ...and what it does with an emotional appeal
+        game_state.emotional_appeals_count += 1
+        if game_state.emotional_appeals_count > 2:
+            response_type = 'overused_emotion'
+    game_state.adjust_state(response_type)
+    if not game_state.game_over:
+        game_state.process_ai_response("...")
+
+
+@unittest.skipIf(batch_engine.np is None, "NumPy is not installed")
+class BatchEngineTests(SimpleTestCase):
+    def assertMatchesScalar(self, codes, tension, trust):
+        batch = batch_engine.BatchGameState(codes.shape[1], tension=tension, trust=trust, hostages=4).run(codes)
+        for index in range(batch.size):
+            game_state = GameState(tension=tension, trust=trust, hostages=4)
+            for code in codes[:, index]:
+                if game_state.game_over:
+                    break
+                scalar_turn(game_state, batch_engine.RESPONSE_TYPES[code])
+            expected = {name: getattr(game_state, name) for name in batch.snapshot(index)}
+            self.assertEqual(batch.snapshot(index), expected, (tension, trust, index))
+
+    def test_matches_scalar_game_state(self):
+        np = batch_engine.np
+        rng = np.random.default_rng(1234)
+        for tension, trust in ((5, 3), (9, 1), (2, 8)):
+            codes = rng.integers(0, len(batch_engine.RESPONSE_TYPES), size=(12, 400))
+            self.assertMatchesScalar(codes, tension, trust)
+
+    def test_repeated_empathy_matches_scalar_game_state(self):
+        np = batch_engine.np
+        rng = np.random.default_rng(4321)
+        moves = batch_engine.encode_response_types(['empathy', 'empathy', 'calibrated', 'accept_surrender'])
+        codes = rng.choice(moves, size=(12, 200))
+        self.assertMatchesScalar(codes, 5, 3)
+        batch = batch_engine.BatchGameState(1).run(batch_engine.encode_response_types(['empathy'] * 4)[:, None])
+        self.assertEqual(batch.snapshot(0)['tactical_empathy_success'], 2)
+        self.assertEqual(batch.snapshot(0)['emotional_appeals_count'], 6)
+
+    def test_win_rule_is_configurable(self):
+        codes = batch_engine.encode_response_types(['calibrated'] * 10)[:, None].repeat(3, axis=1)
+        strict = batch_engine.BatchGameState(3).run(codes)
+        lenient = batch_engine.BatchGameState(3, win_rule={'max_tension': 10, 'min_trust': 1}).run(codes)
+        self.assertTrue(lenient.success.all())
+        self.assertTrue(strict.game_over.all())
+
+
+class SolverTests(SimpleTestCase):
+    def test_optimal_line_reaches_the_solved_outcome(self):
+        scenario = make_scenario(initial_mood=7)
+        solution = solver.solve(scenario.initial_mood)
+        game_state = GameState(tension=solver.START_TENSION, trust=solver.START_TRUST, scenario=scenario)
+        while not game_state.game_over:
+            move = solver.best_move(game_state)
+            self.assertIn(move, solver.HINTS)
+            self.assertEqual(grok_client.get_contextual_hint(game_state), solver.HINTS[move])
+            scalar_turn(game_state, move)
+        self.assertEqual(float(game_state.success), solution.start.win_probability)
+        self.assertAlmostEqual(calculate_game_score(game_state), solution.start.expected_score)
+
+    def test_small_talk_averages_the_unpredictable_branch(self):
+        state = (9, 5, 5, False, 0, 0)
+        graph = dict(solver.successors()[state])
+        self.assertEqual([probability for probability, _, _ in graph['small_talk']], [0.2, 0.8])
+        self.assertEqual(solver.best_move(GameState(scenario=make_scenario(), game_over=True)), None)
+
+    def test_state_index_follows_all_states_order(self):
+        states = list(solver.all_states())
+        self.assertEqual([solver.state_index(state) for state in states], list(range(len(states))))
+        self.assertIsNone(solver.state_index((solver.MAX_TURNS, 5, 5, False, 0, 0)))
+
+    def test_policy_file_matches_the_solver(self):
+        # Fails after a rules change until manage.py solve_scenarios --write is rerun
+        self.assertEqual(solver.policy_table()[7], solver.encode_policy(solver.solve(7)))
+
+    def test_hints_are_served_from_the_policy_file_without_solving(self):
+        with mock.patch.object(solver, '_solve', side_effect=AssertionError("solved on the request path")):
+            self.assertIn(solver.get_hint(GameState(scenario=make_scenario(initial_mood=3))), solver.HINTS.values())
+            self.assertEqual(solver.get_hint(GameState(scenario=make_scenario(initial_mood=42))),
+                             solver.FALLBACK_HINT)
+
+    def test_write_policies_round_trips(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'policies.json'
+            with self.settings(SOLVER_POLICY_FILE=path):
+                solver.write_policies([7])
+                self.assertEqual(solver.policy_table(), {7: solver.encode_policy(solver.solve(7))})
+            solver.policy_table.cache_clear()
+
+
+class BenchmarkTests(TestCase):
+    def test_engine_cases_report_latency_percentiles(self):
+        results = benchmarks.engine_cases(iterations=20)
+        self.assertIn('detect_response_type/long', results)
+        for result in results.values():
+            self.assertLessEqual(result['p50_us'], result['p99_us'])
+            self.assertEqual(result['queries'], 0)
+
+    def test_compare_flags_slowdowns_and_extra_queries(self):
+        baseline = {'stats/10000': {'p50_us': 100.0, 'p99_us': 150.0, 'queries': 5}}
+        self.assertEqual(benchmarks.compare({'stats/10000': {'p50_us': 120.0, 'p99_us': 900.0, 'queries': 5}},
+                                            baseline), [])
+        regressions = benchmarks.compare({'stats/10000': {'p50_us': 130.0, 'p99_us': 150.0, 'queries': 6}},
+                                         baseline)
+        self.assertEqual(len(regressions), 2)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.addCleanup(response_cache.reset)
+        self.scenario = Scenario.objects.first()
+
+    def test_disabled_metrics_are_no_ops(self):
+        self.assertIs(metrics.span('anything'), metrics.span('else'))
+        metrics.increment('grok_fallbacks')
+        self.assertEqual(metrics.registry.counters, {})
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    @override_settings(GAME_METRICS={'ENABLED': True})
+    def test_turn_spans_are_exported_and_logged(self):
+        self.client.get(reverse('start_game', args=[self.scenario.id]))
+        with mock.patch.object(grok_client, 'API_KEY', None), self.assertLogs('game.metrics', 'INFO') as logs:
+            self.client.post(reverse('play'), {'choice': 'What do you need?'})
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line['path'], line['status']), (reverse('play'), 302))
+        self.assertIn('grok.get_ai_response', line['spans_ms'])
+        self.assertIn('session.encode', line['spans_ms'])
+        self.assertEqual(line['counters'], {'grok_cache_misses': 1})
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('hostage_grok_cache_misses_total 1', body)
+        self.assertIn('hostage_span_seconds_count{span="grok.get_ai_response"} 1', body)
+        self.assertIn('hostage_span_seconds_bucket{span="session.encode",le="+Inf"}', body)
+
+
+class LoggingTests(SimpleTestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('game.tests.payload')
+        self.logger.setLevel(logging.DEBUG)
+        self.addCleanup(self.logger.setLevel, logging.NOTSET)
+
+    def test_payload_logs_are_sampled(self):
+        with self.assertLogs(self.logger, 'DEBUG') as logs:
+            log_payload(self.logger, "Payload", {'model': 'grok'}, rate=1)
+            log_payload(self.logger, "Payload", {'model': 'grok'}, rate=0)
+        self.assertEqual(logs.output, ["DEBUG:game.tests.payload:Payload (sampled at 1): {'model': 'grok'}"])
+
+    def test_payload_is_not_formatted_above_debug(self):
+        payload = mock.MagicMock()
+        self.logger.setLevel(logging.INFO)
+        log_payload(self.logger, "Payload", payload, rate=1)
+        payload.__str__.assert_not_called()
+
+    def test_queueing_handler_writes_in_the_background(self):
+        stream = io.StringIO()
+        handler = QueueingStreamHandler(stream)
+        self.addCleanup(handler.close)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        formatted_in = []
+
+        class Turn:
+            def __str__(self):
+                formatted_in.append(threading.current_thread())
+                return "3"
+
+        self.assertFalse(handler.started)
+        handler.handle(logging.makeLogRecord({'msg': "turn %s", 'args': (Turn(),), 'levelno': logging.INFO,
+                                              'levelname': 'INFO'}))
+        self.assertTrue(handler.started)
+        handler.flush()
+        self.assertEqual(stream.getvalue(), "INFO turn 3\n")
+        self.assertNotIn(threading.current_thread(), formatted_in)
+
+    def test_queueing_handler_restarts_its_listener_after_fork(self):
+        stream = io.StringIO()
+        handler = QueueingStreamHandler(stream)
+        handler.handle(logging.makeLogRecord({'msg': "parent"}))
+        handler.flush()
+        parent_queue, parent_listener = handler.queue, handler.listener
+        self.addCleanup(parent_listener.stop)
+        with mock.patch('game.logs.os.getpid', return_value=os.getpid() + 1):
+            self.assertFalse(handler.started)
+            handler.handle(logging.makeLogRecord({'msg': "child"}))
+            self.assertTrue(handler.started)
+            self.assertIsNot(handler.queue, parent_queue)
+            handler.close()
+        self.assertEqual(stream.getvalue(), "parent\nchild\n")
+
+    def test_queueing_handler_drops_records_when_full(self):
+        stream = io.StringIO()
+        handler = QueueingStreamHandler(stream, queue_size=1)
+        # Enqueued straight away, so there is no listener draining the queue
+        for index in range(3):
+            handler.enqueue(logging.makeLogRecord({'msg': f"record {index}"}))
+        self.assertEqual(handler.dropped, 2)
+        handler.close()
+        self.assertEqual(stream.getvalue(), "Log queue was full; dropped 2 records\n")
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@override_settings(GROK_CIRCUIT_BREAKER={'MIN_CALLS': 4, 'ERROR_THRESHOLD': 0.5, 'OPEN_SECONDS': 30,
+                                         'MIN_TIMEOUT': 0.1, 'REFRESH_SECONDS': 0})
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker('test', clock=self.clock)
+
+    def test_opens_on_error_rate_and_recovers_through_one_probe(self):
+        for success in (True, False, True, False):
+            self.breaker.record(0.2, success)
+        self.assertEqual(self.breaker.state(), OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+        self.clock.now += 30
+        self.assertEqual(self.breaker.state(), HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+        self.breaker.record(0.2, True)
+        self.assertEqual(self.breaker.state(), CLOSED)
+        # The window restarted on close, so one more failure doesn't reopen it
+        self.breaker.record(0.2, False)
+        self.assertEqual(self.breaker.state(), CLOSED)
+
+    def test_failed_probe_reopens(self):
+        for _ in range(4):
+            self.breaker.record(None, False)
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record(None, False)
+        self.assertEqual(self.breaker.state(), OPEN)
+
+    def test_successful_streams_keep_the_circuit_closed(self):
+        # Streams report no latency; a success must not count as an error
+        for _ in range(10):
+            self.breaker.record(None, True)
+        for _ in range(2):
+            self.breaker.record(None, False)
+        self.assertEqual(self.breaker.state(), CLOSED)
+        window = self.breaker.window()
+        self.assertEqual((window['calls'], window['errors'], sum(window['latency'])), (12, 2, 0))
+
+    def test_old_failures_leave_the_window(self):
+        for _ in range(3):
+            self.breaker.record(0.2, False)
+        self.clock.now += 120
+        self.breaker.record(0.2, False)
+        self.assertEqual(self.breaker.state(), CLOSED)
+        self.assertEqual(self.breaker.window()['calls'], 1)
+
+    def test_timeout_follows_p95_latency(self):
+        self.assertEqual(self.breaker.timeout(15), 15)
+        for _ in range(19):
+            self.breaker.record(0.3, True)
+        self.breaker.record(12, True)
+        # p95 falls in the 0.5s bucket; doubled and capped by the client's own timeout
+        self.assertEqual(self.breaker.timeout(15), 1.0)
+        self.assertEqual(self.breaker.timeout(0.8), 0.8)
+
+    @override_settings(GROK_CIRCUIT_BREAKER={'ENABLED': False})
+    def test_disabled_breaker_lets_everything_through(self):
+        for _ in range(20):
+            self.breaker.record(None, False)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.timeout(15), 15)
+
+
+@override_settings(GROK_CIRCUIT_BREAKER={'MIN_CALLS': 2, 'ERROR_THRESHOLD': 0.5})
+class GrokCircuitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        response_cache.reset()
+        self.addCleanup(response_cache.reset)
+        self.addCleanup(grok_breaker.reset)
+        self.server, url = start_stub_server(status=503)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(grok_client.close_http_clients)
+        patcher = mock.patch.multiple(grok_client, API_URL=url, API_KEY='test-key')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.game_state = GameState(tension=5, trust=5, scenario=Scenario.objects.first())
+
+    def test_open_circuit_answers_with_mock_without_calling_the_api(self):
+        for _ in range(2):
+            grok_client.get_ai_response(self.game_state, "What do you need?")
+        self.assertEqual(self.server.request_count, 2)
+        self.assertEqual(grok_breaker.state(), OPEN)
+
+        response = json.loads(grok_client.get_ai_response(self.game_state, "What do you need?"))
+        self.assertEqual(self.server.request_count, 2)
+        self.assertNotEqual(response['daily_hint'], "System recovering, try again.")
+        self.assertTrue("".join(grok_client.stream_ai_response(self.game_state, "Talk to me")).strip())
+        self.assertEqual(self.server.request_count, 2)
+
+    @override_settings(GAME_METRICS={'ENABLED': True}, GROK_CIRCUIT_BREAKER={'MIN_CALLS': 1})
+    def test_breaker_state_is_exported(self):
+        grok_client.make_api_call("system", "user")
+        body = metrics.registry.render()
+        self.assertIn('hostage_grok_circuit_state 2', body)
+        self.assertIn('hostage_grok_circuit_opened_total 1', body)
+
+
+class FlowControlTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_single_flight_shares_one_call(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'reply': 'shared'}
+
+        leader = threading.Thread(target=lambda: results.append(flight.do('key', work)))
+        leader.start()
+        started.wait(5)
+        with mock.patch('game.flow_control.metrics.increment') as increment:
+            followers = [threading.Thread(target=lambda: results.append(flight.do('key', work))) for _ in range(4)]
+            for thread in followers:
+                thread.start()
+            # Followers count themselves as coalesced just before they start waiting
+            while increment.call_count < 4:
+                threading.Event().wait(0.01)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'reply': 'shared'}] * 5)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_single_flight_shares_errors(self):
+        flight = SingleFlight()
+        with self.assertRaises(ZeroDivisionError):
+            flight.do('key', lambda: 1 / 0)
+        self.assertEqual(flight.do('key', lambda: 'retried'), 'retried')
+
+    def test_cancelled_async_leader_leaves_waiters_a_fallback_error(self):
+        flight = AsyncSingleFlight()
+
+        async def scenario():
+            started = asyncio.Event()
+
+            async def work():
+                started.set()
+                await asyncio.sleep(5)
+                return 'never'
+
+            leader = asyncio.create_task(flight.do('key', work))
+            await started.wait()
+            waiter = asyncio.create_task(flight.do('key', work))
+            await asyncio.sleep(0)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            with self.assertRaises(GrokBusyError):
+                await waiter
+            self.assertEqual(await flight.do('key', lambda: asyncio.sleep(0, 'retried')), 'retried')
+
+        asyncio.run(scenario())
+
+    def test_rate_limit_refuses_a_per_process_cache(self):
+        flow_control.check_config()
+        with self.settings(GROK_RATE_LIMIT={'REQUESTS_PER_SECOND': 5}):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'shared by all workers'):
+                flow_control.check_config()
+            with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+                flow_control.check_config()
+
+    @override_settings(GROK_RATE_LIMIT={'REQUESTS_PER_SECOND': 2})
+    def test_rate_limiter_queues_until_the_next_second_or_deadline(self):
+        clock = FakeClock(1000.25)
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock.now += seconds
+
+        limiter = RateLimiter('test', clock=clock, sleep=sleep)
+        limiter.acquire(deadline=clock.now + 5)
+        limiter.acquire(deadline=clock.now + 5)
+        limiter.acquire(deadline=clock.now + 5)
+        self.assertEqual(sleeps, [0.75])
+        limiter.acquire(deadline=clock.now + 5)
+        with self.assertRaises(GrokBusyError):
+            limiter.acquire(deadline=clock.now + 0.5)
+
+    @override_settings(GROK_RATE_LIMIT={'REQUESTS_PER_SECOND': 1})
+    def test_async_rate_limiter_uses_the_async_cache_api(self):
+        clock = FakeClock(2000.5)
+        limiter = RateLimiter('async-test', clock=clock)
+        with mock.patch.object(RateLimiter, '_take', side_effect=AssertionError('sync cache call')):
+            asyncio.run(limiter.aacquire(deadline=clock.now + 5))
+            with self.assertRaises(GrokBusyError):
+                asyncio.run(limiter.aacquire(deadline=clock.now + 0.1))
+
+    def test_async_prompt_building_runs_off_the_event_loop(self):
+        threads = []
+
+        def history_section(messages):
+            threads.append(threading.current_thread())
+            return ''
+
+        with mock.patch.object(context_window, 'history_section', side_effect=history_section):
+            asyncio.run(grok_client.abuild_user_prompt(GameState(scenario=make_scenario()), "Talk", None, 'agitated'))
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_requests_queue_with_a_deadline(self):
+        with mock.patch.multiple(grok_client, MAX_REQUESTS_PER_HOST=1, QUEUE_TIMEOUT=0.05):
+            self.addCleanup(grok_client.close_http_clients)
+            with grok_client._host_limit('http://grok.test/v1'):
+                with self.assertRaises(GrokBusyError):
+                    with grok_client._host_limit('http://grok.test/v1'):
+                        pass
+            with grok_client._host_limit('http://grok.test/v1'):
+                pass
+
+
+class CoalescingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.server, url = start_stub_server(delay=0.2)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(grok_client.close_http_clients)
+        patcher = mock.patch.multiple(grok_client, API_URL=url, API_KEY='test-key')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_identical_prompts_share_one_upstream_call(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(grok_client.make_api_call("system", "user")))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(self.server.request_count, 1)
+        grok_client.make_api_call("system", "a different line")
+        self.assertEqual(self.server.request_count, 2)
+
+    def test_identical_async_prompts_share_one_upstream_call(self):
+        async def run():
+            try:
+                return await asyncio.gather(
+                    *(grok_client.make_api_call_async("system", "user") for _ in range(5)),
+                    grok_client.make_api_call_async("system", "other"),
+                )
+            finally:
+                await grok_client.aclose_http_clients()
+
+        results = asyncio.run(run())
+        self.assertEqual(self.server.request_count, 2)
+        self.assertEqual({result['choices'][0]['message']['content'] for result in results}, {STUB_REPLY})
+
+
+class PromptTests(SimpleTestCase):
+    def setUp(self):
+        prompts.clear()
+        self.addCleanup(prompts.clear)
+        self.scenario = make_scenario()
+
+    def test_system_message_is_stable_across_turns(self):
+        first = GameState(tension=8, trust=2, hostages=4, scenario=self.scenario)
+        later = GameState(tension=3, trust=7, hostages=4, hostages_released=2, turn=6, scenario=self.scenario)
+        system = grok_client.build_system_message(first, 'volatile')
+        self.assertIs(grok_client.build_system_message(later, 'strategic'), system)
+        self.assertIn('Demand: A getaway car', system)
+        self.assertNotIn('Tension', system)
+
+        prompt = grok_client.build_user_prompt(later, "What do you need?", "Pizza", 'strategic')
+        for line in ('Turn: 6/10', 'Tension: 3/10', 'Trust: 7/10', 'Hostages: 2', 'Emotional State: strategic',
+                     'Negotiator Says: "What do you need?"', 'Offer: Pizza'):
+            self.assertIn(line, prompt)
+
+    def test_prebuild_renders_every_scenario(self):
+        scenarios = [self.scenario, make_scenario(id=2, demand='A plane')]
+        prompts.prebuild(scenarios)
+        self.assertEqual(len(prompts._system_messages), 2)
+        self.assertIn('Demand: A plane', prompts.system_message(scenarios[1]))
+
+    def test_token_estimates(self):
+        self.assertEqual(prompts.estimate_tokens(''), 0)
+        self.assertEqual(prompts.estimate_tokens('abcde'), 2)
+        payload = grok_client.build_payload('a' * 400, 'b' * 40)
+        self.assertEqual(prompts.estimate_payload_tokens(payload), {'prompt': 110, 'completion_max': 150, 'total': 260})
+
+
+@override_settings(GROK_CONTEXT_WINDOW={'RECENT_EXCHANGES': 2, 'TOKEN_BUDGET': 300, 'SUMMARY_MAX_TOKENS': 100})
+class ContextWindowTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_history_excludes_system_lines_and_the_current_line(self):
+        messages = [("system", "Contact established."), ("suspect", "Stay back!"),
+                    ("player", "What do you need?"), ("suspect", "A car."), ("system", "Tension rising."),
+                    ("player", "How can I help?")]
+        self.assertEqual(context_window.exchanges(messages), [(None, "Stay back!"), ("What do you need?", "A car.")])
+        section = context_window.history_section(messages)
+        self.assertIn("Negotiator: What do you need?\nYou: A car.", section)
+        self.assertNotIn("How can I help?", section)
+        self.assertNotIn("Tension rising", section)
+
+    def test_long_games_stay_within_budget(self):
+        messages = benchmarks._transcript(30)
+        context = context_window.build_context(messages)
+        self.assertLessEqual(context.tokens, 300)
+        self.assertEqual(len(context.recent), 2)
+        self.assertIn("turn 29?", context.recent[-1])
+        self.assertGreater(context.omitted, 0)
+        self.assertLess(context.tokens, prompts.estimate_tokens(context_window.full_history(messages)) / 3)
+
+    def test_summary_is_extended_incrementally(self):
+        with mock.patch('game.context_window.metrics.increment') as increment:
+            for turn in range(1, 8):
+                incremental = context_window.history_section(benchmarks._transcript(turn))
+            increment.assert_not_called()
+            cache.clear()
+            self.assertEqual(context_window.history_section(benchmarks._transcript(7)), incremental)
+            increment.assert_called_once_with('context_summary_rebuilds')
+
+    def test_user_prompt_carries_history(self):
+        game_state = GameState(scenario=make_scenario(), messages=benchmarks._transcript(3))
+        prompt = grok_client.build_user_prompt(game_state, benchmarks.SHORT_INPUT, None, 'agitated')
+        self.assertTrue(prompt.startswith("Earlier in the negotiation:\n- Opening"))
+        self.assertIn("Most recent exchanges:", prompt)
+        with self.settings(GROK_CONTEXT_WINDOW={'ENABLED': False}):
+            self.assertTrue(grok_client.build_user_prompt(game_state, "Hi", None, 'agitated')
+                            .startswith("Current Situation:"))
+
+
+class ScoreStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='stats', email='stats@example.com', password='pw')
+        self.scenario = Scenario.objects.first()
+
+    def add_score(self, value, **kwargs):
+        return Score.objects.create(user=self.user, scenario=self.scenario, scenario_name=self.scenario.name,
+                                    score=value, **kwargs)
+
+    def test_averages_are_single_row_reads(self):
+        for value in (4.0, 6.0, 8.0):
+            self.add_score(value)
+        self.add_score(1.0, is_daily=False)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.user.get_lifetime_average(), 6.0)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.user.get_daily_average(), 6.0)
+        lifetime = ScoreStats.objects.get(user=self.user, day=None)
+        self.assertEqual((lifetime.count, lifetime.minimum, lifetime.maximum), (3, 4.0, 8.0))
+
+    def test_deleting_a_score_recomputes_its_rows(self):
+        self.add_score(2.0)
+        highest = self.add_score(9.0)
+        highest.delete()
+        lifetime = ScoreStats.objects.get(user=self.user, day=None)
+        self.assertEqual((lifetime.count, lifetime.total, lifetime.maximum), (1, 2.0, 2.0))
+        Score.objects.filter(user=self.user).delete()
+        self.assertFalse(ScoreStats.objects.filter(user=self.user).exists())
+        self.assertIsNone(self.user.get_lifetime_average())
+
+    def test_backfill_matches_incremental_stats(self):
+        self.add_score(3.0)
+        self.add_score(7.0)
+        yesterday = timezone.now() - timedelta(days=1)
+        Score.objects.bulk_create([Score(user=self.user, scenario=self.scenario, scenario_name='old', score=10.0)])
+        # auto_now_add overrides created_at on insert
+        Score.objects.filter(scenario_name='old').update(created_at=yesterday)
+        # History that bypassed the signals is still counted through the Avg() fallback...
+        self.assertEqual(score_stats.daily_average(self.user, dates.utc_day(yesterday)), 10.0)
+        # ...but not by the lifetime row until it is backfilled
+        self.assertEqual(self.user.get_lifetime_average(), 5.0)
+        call_command('backfill_score_stats', stdout=io.StringIO())
+        self.assertEqual(self.user.get_lifetime_average(), 20.0 / 3)
+        self.assertEqual(ScoreStats.objects.filter(user=self.user).count(), 3)
+        with self.settings(SCORE_STATS={'ENABLED': False}):
+            self.assertEqual(self.user.get_daily_average(), 5.0)
+
+
+    def test_migration_backfills_existing_history(self):
+        migration = importlib.import_module('game.migrations.0016_backfill_score_stats')
+        Score.objects.bulk_create([Score(user=self.user, scenario=self.scenario, scenario_name='old', score=value)
+                                   for value in (4.0, 8.0)])
+        self.assertFalse(ScoreStats.objects.exists())
+        migration.backfill_score_stats(django_apps, None)
+        lifetime = ScoreStats.objects.get(user=self.user, day=None)
+        self.assertEqual((lifetime.count, lifetime.total, lifetime.minimum, lifetime.maximum), (2, 12.0, 4.0, 8.0))
+        self.assertEqual(ScoreStats.objects.filter(user=self.user).count(), 2)
+
+class PlayerStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='dash', email='dash@example.com', password='pw')
+        self.scenarios = list(Scenario.objects.order_by('id')[:2])
+        now = timezone.now()
+        make_attempt(self.user, self.scenarios[0], end_time=now, success=True, final_score=8, mirroring_count=2,
+                     tactical_empathy_success=1)
+        make_attempt(self.user, self.scenarios[0], end_time=now, success=False, final_score=4, mirroring_count=1)
+        make_attempt(self.user, self.scenarios[1], end_time=now, success=True, final_score=9)
+        make_attempt(self.user, self.scenarios[1])
+
+    def test_totals_are_one_query(self):
+        with self.assertNumQueries(1):
+            totals = player_stats.totals(self.user)
+        self.assertEqual((totals['total_attempts'], totals['finished_attempts'], totals['successful_attempts']),
+                         (4, 3, 2))
+        self.assertEqual(totals['average_score'], 7.0)
+        self.assertEqual(totals['success_rate'], 66.7)
+        self.assertEqual(totals['tactics']['mirroring'], 3)
+        self.assertEqual(totals['tactics']['tactical_empathy_success'], 1)
+
+    def test_breakdown_and_trend(self):
+        stats = player_stats.get_player_stats(self.user)
+        rows = {row['scenario_id']: row for row in stats['by_scenario']}
+        self.assertEqual((rows[self.scenarios[0].id]['attempts'], rows[self.scenarios[0].id]['success_rate']), (2, 50.0))
+        self.assertEqual(rows[self.scenarios[1].id]['best_score'], 9)
+        self.assertEqual(sum(week['attempts'] for week in stats['trend']), 3)
+
+    def test_stats_page_query_budget(self):
+        self.client.force_login(self.user)
+        # Session, user, three dashboard queries and the two leaderboards
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('stats'))
+        self.assertContains(response, 'By Scenario')
+        with self.assertNumQueries(2):
+            self.client.get(reverse('stats'))
+
+        attempt = ScenarioAttempt.objects.filter(user=self.user, end_time__isnull=True).get()
+        attempt.end_time = timezone.now()
+        attempt.success = True
+        attempt.save()
+        self.assertEqual(player_stats.get_player_stats(self.user)['successful_attempts'], 3)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'query plans are checked against SQLite')
+class AttemptIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='plans', email='plans@example.com', password='pw')
+        self.scenario = Scenario.objects.first()
+        self.today = dates.utc_day_range(timezone.now().date())
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_hot_lookups_use_their_index(self):
+        attempts = ScenarioAttempt.objects.filter(user=self.user)
+        start, end = self.today
+        self.assertUsesIndex(attempts.filter(end_time__isnull=True), 'game_attempt_active_idx')
+        finished_today = attempts.filter(start_time__gte=start, start_time__lt=end, end_time__isnull=False)
+        self.assertUsesIndex(finished_today, 'game_attempt_finished_idx')
+        self.assertUsesIndex(finished_today.filter(scenario=self.scenario), 'game_attempt_finished_idx')
+        history_index = ScenarioAttempt._meta.indexes[0].name
+        self.assertUsesIndex(attempts.order_by('-start_time', '-id'), history_index)
+
+    def test_played_today_uses_utc_day_range(self):
+        self.client.force_login(self.user)
+        yesterday = make_attempt(self.user, self.scenario, end_time=timezone.now())
+        ScenarioAttempt.objects.filter(pk=yesterday.pk).update(start_time=self.today[0] - timedelta(seconds=1))
+        response = self.client.get(reverse('start_game', args=[self.scenario.id]))
+        self.assertRedirects(response, reverse('game'), fetch_redirect_response=False)
+
+        ScenarioAttempt.objects.filter(user=self.user, end_time__isnull=True).update(end_time=timezone.now())
+        response = self.client.get(reverse('start_game', args=[self.scenario.id]))
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+
+
+class GameHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='history', email='history@example.com', password='pw')
+        self.scenario = Scenario.objects.first()
+        self.attempts = [make_attempt(self.user, self.scenario, messages=[['suspect', f'Opening {n}']])
+                         for n in range(5)]
+        # Ties on start_time are broken by id
+        moment = timezone.now()
+        ScenarioAttempt.objects.filter(user=self.user).update(start_time=moment)
+        ScenarioAttempt.objects.filter(pk=self.attempts[0].pk).update(start_time=moment - timedelta(days=1))
+
+    def test_pages_cover_every_attempt_once_without_transcripts(self):
+        seen, cursor = [], None
+        with CaptureQueriesContext(connection) as queries:
+            while True:
+                attempts, cursor = attempt_history.page(self.user, cursor, size=2)
+                seen += [attempt.id for attempt in attempts]
+                if cursor is None:
+                    break
+        self.assertEqual(seen, [attempt.id for attempt in reversed(self.attempts)])
+        self.assertEqual(len(queries), 3)
+        self.assertTrue(all('"messages"' not in query['sql'] for query in queries.captured_queries))
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'query plans are checked against SQLite')
+    def test_next_page_is_an_index_range_scan(self):
+        cursor = attempt_history.encode_cursor(self.attempts[3])
+        start_time, attempt_id = attempt_history.decode_cursor(cursor)
+        self.assertEqual(attempt_id, self.attempts[3].id)
+        queryset = ScenarioAttempt.objects.filter(user=self.user).filter(
+            Q(start_time__lt=start_time) | Q(start_time=start_time, id__lt=attempt_id)
+        ).order_by('-start_time', '-id')
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {ScenarioAttempt._meta.indexes[0].name}', plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    @override_settings(GAME_HISTORY={'PAGE_SIZE': 3})
+    def test_history_view_pages_and_transcript_endpoint(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('game_history'))
+        self.assertEqual(len(response.context['attempts']), 3)
+        response = self.client.get(reverse('game_history'), {'before': response.context['next_cursor']})
+        self.assertEqual([attempt.id for attempt in response.context['attempts']],
+                         [self.attempts[1].id, self.attempts[0].id])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertEqual(self.client.get(reverse('game_history'), {'before': 'nonsense'}).status_code, 400)
+
+        GameTurn.objects.create(attempt=self.attempts[0], turn_number=1, player_input='Talk to me',
+                                game_response='No', tension_change=0, trust_change=0,
+                                messages=[['player', 'Talk to me'], ['suspect', 'No']])
+        response = self.client.get(reverse('attempt_transcript', args=[self.attempts[0].id]))
+        self.assertEqual([message['text'] for message in response.json()['messages']],
+                         ['Opening 0', 'Talk to me', 'No'])
+
+        other = User.objects.create_user(username='other', email='other@example.com', password='pw')
+        self.client.force_login(other)
+        response = self.client.get(reverse('attempt_transcript', args=[self.attempts[0].id]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(GUEST_GAME_STORE={'BACKEND': 'cached_db', 'ALLOW_LOCAL_CACHE': True})
+class GuestStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.scenario = Scenario.objects.first()
+
+    def play(self, choice='What do you need?'):
+        with mock.patch.object(grok_client, 'API_KEY', None), CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('play'), {'choice': choice})
+        return [query['sql'] for query in context.captured_queries]
+
+    def test_guest_turns_skip_session_and_database_writes(self):
+        self.client.get(reverse('start_game', args=[self.scenario.id]))
+        self.assertNotIn('guest_current_attempt', self.client.session)
+        key = self.client.session['guest_game']
+        self.assertTrue(GuestGame.objects.filter(key=key).exists())
+
+        queries = self.play()
+        self.assertFalse([sql for sql in queries if sql.startswith('UPDATE') or 'game_guestgame' in sql])
+        state = decode_game_state(guest_store.get_store().load(self.client.session)['game_state'])
+        self.assertIn(('player', 'What do you need?'), state.messages)
+
+        with self.settings(GUEST_GAME_STORE={**guest_store.get_config(), 'FLUSH_SECONDS': 0}):
+            self.play('Talk to me')
+        flushed = decode_game_state(GuestGame.objects.get(key=key).data['game_state'])
+        self.assertIn(('player', 'Talk to me'), flushed.messages)
+
+    def test_cache_miss_falls_back_to_row_until_it_expires(self):
+        clock = FakeClock()
+        store = guest_store.CachedDbGuestStore(guest_store.get_config(), clock=clock)
+        session = {}
+        store.save(session, {'game_state': 'first', 'scenario_name': 'Bank'})
+        clock.now += 5
+        store.save(session, {'game_state': 'second', 'scenario_name': 'Bank'})
+        self.assertEqual(store.load(session)['game_state'], 'second')
+
+        cache.clear()
+        with self.assertLogs('game.guest_store', 'WARNING') as logs:
+            self.assertEqual(store.load(session)['game_state'], 'first')
+        self.assertIn("later turns are lost", logs.output[0])
+        GuestGame.objects.update(updated_at=timezone.now() - timedelta(hours=3))
+        cache.clear()
+        self.assertIsNone(store.load(session))
+        call_command('cleanup_guest_games', stdout=io.StringIO())
+        self.assertFalse(GuestGame.objects.exists())
+
+    def test_finished_games_are_written_through(self):
+        clock = FakeClock()
+        store = guest_store.CachedDbGuestStore(guest_store.get_config(), clock=clock)
+        session = {}
+        store.save(session, {'game_state': 'first'})
+        clock.now += 5
+        store.save(session, {'game_state': 'last'}, finished=True)
+        self.assertEqual(GuestGame.objects.get().data['game_state'], 'last')
+
+    def test_cached_db_refuses_a_per_process_cache(self):
+        with self.settings(GUEST_GAME_STORE={'BACKEND': 'cached_db'}):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'shared by all workers'):
+                guest_store.check_config()
+        with self.settings(GUEST_GAME_STORE={'BACKEND': 'cached_db'},
+                           CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            guest_store.check_config()
+        with self.settings(GUEST_GAME_STORE={'BACKEND': 'file'}), self.assertRaises(ImproperlyConfigured):
+            guest_store.check_config()
+        guest_store.check_config()
+
+    def test_finishing_clears_the_game(self):
+        self.client.get(reverse('start_game', args=[self.scenario.id]))
+        GuestGame.objects.update(data={**GuestGame.objects.get().data, 'game_state': encode_game_state(
+            GameState(scenario=make_scenario(id=self.scenario.id), turn=10, messages=[('suspect', 'Hi')]))})
+        cache.clear()
+        self.play()
+        self.assertNotIn('guest_game', self.client.session)
+        self.assertFalse(GuestGame.objects.exists())
+
+    @override_settings(GUEST_GAME_STORE={'BACKEND': 'session'})
+    def test_session_backend_keeps_the_game_in_the_session(self):
+        self.client.get(reverse('start_game', args=[self.scenario.id]))
+        self.play()
+        state = decode_game_state(self.client.session['guest_current_attempt']['game_state'])
+        self.assertEqual(state.turn, 2)
+        self.assertFalse(GuestGame.objects.exists())
+
+    def test_session_game_moves_to_the_store(self):
+        with self.settings(GUEST_GAME_STORE={'BACKEND': 'session'}):
+            self.client.get(reverse('start_game', args=[self.scenario.id]))
+        self.play()
+        self.assertNotIn('guest_current_attempt', self.client.session)
+        self.assertEqual(decode_game_state(GuestGame.objects.get().data['game_state']).turn, 2)
+
+    def test_corrupt_guest_session_is_discarded(self):
+        session = self.client.session
+        session['guest_current_attempt'] = {'game_state': base64.b64encode(bytes([1, 1]) + b'nope').decode()}
+        session.save()
+        with self.settings(GUEST_GAME_STORE={'BACKEND': 'session'}):
+            response = self.client.get(reverse('game'))
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+        self.assertNotIn('guest_current_attempt', self.client.session)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -7,13 +8,16 @@ urlpatterns = [
     path('start/<int:scenario_id>/', views.start_game, name='start_game'),
     path('start/', views.start_game, name='start_daily_game'),
     path('game/', views.game, name='game'),
-    path('play/', views.play, name='play'),
+    path('play/', views.play_async if settings.GROK_ASYNC_CLIENT else views.play, name='play'),
+    path('play/stream/', views.play_stream, name='play_stream'),
     path('history/', views.game_history, name='game_history'),
+    path('history/<int:attempt_id>/transcript/', views.attempt_transcript, name='attempt_transcript'),
     path('resume/<int:attempt_id>/', views.resume_game, name='resume_game'),
     path('login/', views.login_view, name='login'),
     path('register/', views.register, name='register'),
     path('logout/', views.logout_view, name='logout'),
     path('stats/', views.stats, name='stats'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('reset_password_request/', views.reset_password_request, name='reset_password_request'),
     path('reset_password/<str:token>/', views.reset_password, name='reset_password'),
 ]
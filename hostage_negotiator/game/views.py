@@ -1,19 +1,28 @@
 # game/views.py
+import asyncio
 import json
 import logging
 from datetime import datetime
 
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.conf import settings
 from .models import User, GameProgress, Score, Scenario, ScenarioAttempt, GameTurn
+from . import attempt_history, dates, guest_store, leaderboard, metrics, player_stats
 from .forms import LoginForm, RegistrationForm, ResetPasswordRequestForm, ResetPasswordForm, GameResponseForm
 from .game_logic import GameState, process_turn, calculate_game_score
-from .grok_client import get_ai_response
+from .grok_client import (
+    build_ai_response, get_ai_response, get_ai_response_async, stream_ai_response, stream_ai_response_async
+)
 from .scenario_manager import ScenarioManager
-from django.db.models import Avg
+from .scenario_summary import get_scenario_summary
+from .session_codec import SessionCodecError, decode_game_state, encode_game_state
 
 logger = logging.getLogger(__name__)
 
@@ -31,16 +40,18 @@ def index(request):
         ).select_related('scenario').first()
         
         # Check if user has played today
+        day_start, day_end = dates.utc_day_range(datetime.utcnow().date())
         played_today = ScenarioAttempt.objects.filter(
             user=request.user,
-            start_time__date=today,
+            start_time__gte=day_start,
+            start_time__lt=day_end,
             end_time__isnull=False
         ).exists()
     else:
         # For guests, check session
         guest_last_played = request.session.get('guest_last_played')
         can_play = guest_last_played != today
-        current_attempt = request.session.get('guest_current_attempt')
+        current_attempt = guest_store.get_store().load(request.session)
     
     return render(request, 'game/index.html', {
         'current_attempt': current_attempt,
@@ -102,7 +113,7 @@ def reset_password_request(request):
                 # Placeholder for email sending (implement with Django's send_mail or SendGrid)
                 messages.info(request, 'Check your email for instructions to reset your password')
             except Exception as e:
-                logger.error(f"Error sending reset email: {str(e)}")
+                logger.error("Error sending reset email: %s", e)
                 messages.error(request, 'Error sending reset email. Please try again later.')
         else:
             messages.info(request, 'Check your email for instructions to reset your password')
@@ -125,26 +136,12 @@ def reset_password(request, token):
 
 @login_required
 def scenario_list(request):
-    scenarios = Scenario.objects.all()
-    completed_attempts = ScenarioAttempt.objects.filter(
-        user=request.user,
-        end_time__isnull=False
-    ).select_related('scenario')
-    
-    # Get user's current progress
-    progress, _ = GameProgress.objects.get_or_create(user=request.user)
-    
-    scenario_data = []
-    for scenario in scenarios:
-        scenario_attempts = completed_attempts.filter(scenario=scenario)
-        best_score = scenario_attempts.order_by('-final_score').first()
-        
-        scenario_data.append({
-            'scenario': scenario,
-            'attempts_count': scenario_attempts.count(),
-            'best_score': best_score.final_score if best_score else None,
-            'completed': scenario in progress.completed_scenarios.all()
-        })
+    summary = get_scenario_summary(request.user)
+    empty = {'attempts_count': 0, 'best_score': None, 'completed': False}
+    scenario_data = [
+        {'scenario': scenario, **summary.get(scenario.id, empty)}
+        for scenario in ScenarioManager.all()
+    ]
     
     return render(request, 'game/scenario_list.html', {
         'scenario_data': scenario_data
@@ -153,17 +150,21 @@ def scenario_list(request):
 def start_game(request, scenario_id=None):
     today = datetime.utcnow().date().isoformat()
     
-    if scenario_id:
-        scenario = get_object_or_404(Scenario, id=scenario_id)
-    else:
-        scenario = Scenario.objects.latest('created_at')
+    try:
+        scenario = ScenarioManager.get(scenario_id) if scenario_id else ScenarioManager.latest()
+    except Scenario.DoesNotExist:
+        scenario = None
+    if scenario is None:
+        raise Http404('No scenario found')
     
     # Check if already played today
     if request.user.is_authenticated:
+        day_start, day_end = dates.utc_day_range(datetime.utcnow().date())
         existing_attempt = ScenarioAttempt.objects.filter(
             user=request.user,
             scenario=scenario,
-            start_time__date=today,
+            start_time__gte=day_start,
+            start_time__lt=day_end,
             end_time__isnull=False
         ).exists()
         
@@ -203,11 +204,11 @@ def start_game(request, scenario_id=None):
     else:
         # Store attempt in session for guests
         guest_attempt = {
-            'game_state': game_state.to_dict(),
+            'game_state': encode_game_state(game_state),
             'scenario_name': scenario.name,
             'start_time': datetime.utcnow().isoformat()
         }
-        request.session['guest_current_attempt'] = guest_attempt
+        guest_store.get_store().save(request.session, guest_attempt)
     
     return redirect('game')
 
@@ -220,11 +221,11 @@ def game(request):
         attempt = get_object_or_404(ScenarioAttempt, id=attempt_id)
         game_state = attempt.get_game_state()
     else:
-        guest_attempt = request.session.get('guest_current_attempt')
-        if not guest_attempt:
+        active_game = _load_active_game(request)
+        if active_game is None:
             return redirect('index')
         
-        game_state = GameState.from_dict(guest_attempt['game_state'])
+        game_state = active_game[0]
     
     form = GameResponseForm()
     
@@ -235,48 +236,55 @@ def game(request):
         'hostages_released': game_state.hostages_released
     }
     
-    return render(request, 'game/game.html', context)
+    with metrics.span('render.game'):
+        return render(request, 'game/game.html', context)
 
-def play(request):
+def _load_active_game(request):
+    """Return (game_state, attempt, guest_attempt) for the current game, or None"""
     if request.user.is_authenticated:
         attempt_id = request.session.get('current_attempt_id')
         if not attempt_id:
-            messages.error(request, 'No active game found.')
-            return redirect('index')
+            return None
             
         attempt = get_object_or_404(ScenarioAttempt, id=attempt_id)
-        game_state = attempt.get_game_state()
-    else:
-        guest_attempt = request.session.get('guest_current_attempt')
-        if not guest_attempt:
-            messages.error(request, 'No active game found.')
-            return redirect('index')
-            
-        game_state = GameState.from_dict(guest_attempt['game_state'])
+        return attempt.get_game_state(), attempt, None
+
+    store = guest_store.get_store()
+    guest_attempt = store.load(request.session)
+    if not guest_attempt:
+        return None
     
-    # Check if game should be ended
-    if game_state.turn >= 10 or game_state.game_over:
-        game_state.game_over = True
-        if game_state.tension <= 2 and game_state.trust >= 7:
-            game_state.success = True
-            game_state.messages.append(("system", "The suspect's resolve has completely broken. Negotiation successful!"))
-        else:
-            game_state.success = False
-            game_state.messages.append(("system", "Time has run out. Negotiation failed."))
-        
-        if request.user.is_authenticated:
-            attempt.update_from_game_state(game_state)
-            attempt.end_time = datetime.utcnow()
-            attempt.save()
-            save_game_score(request, request.user.id, game_state)
-            request.session.pop('current_attempt_id', None)
-            return redirect('stats')
-        else:
-            # For guests, mark the day as played and clear current attempt
-            request.session['guest_last_played'] = datetime.utcnow().date().isoformat()
-            request.session.pop('guest_current_attempt', None)
-            return redirect('index')
+    try:
+        game_state = decode_game_state(guest_attempt['game_state'])
+    except SessionCodecError as e:
+        logger.error("Discarding unreadable guest game: %s", e)
+        store.discard(request.session)
+        return None
+    return game_state, None, guest_attempt
+
+def _finish_game(request, game_state, attempt):
+    """Close out a game that has run out of turns and redirect to the next page"""
+    game_state.game_over = True
+    if game_state.tension <= 2 and game_state.trust >= 7:
+        game_state.success = True
+        game_state.messages.append(("system", "The suspect's resolve has completely broken. Negotiation successful!"))
+    else:
+        game_state.success = False
+        game_state.messages.append(("system", "Time has run out. Negotiation failed."))
     
+    if request.user.is_authenticated:
+        attempt.update_from_game_state(game_state)
+        save_game_score(request, request.user.id, game_state)
+        request.session.pop('current_attempt_id', None)
+        return redirect('stats')
+    else:
+        # For guests, mark the day as played and clear current attempt
+        request.session['guest_last_played'] = datetime.utcnow().date().isoformat()
+        guest_store.get_store().discard(request.session)
+        return redirect('index')
+
+def _pending_choice(request, game_state):
+    """Validate the posted response and record it; None if there is nothing new to send"""
     form = GameResponseForm(request.POST or None)
     
     if request.method == 'POST' and form.is_valid():
@@ -285,49 +293,163 @@ def play(request):
         if not game_state.messages or game_state.messages[-1] != ("player", choice):
             # Add player's message
             game_state.messages.append(("player", choice))
-            
-            # Get AI response
-            ai_response_data = get_ai_response(game_state, choice)
-            
-            try:
-                ai_response = json.loads(ai_response_data)
-                
-                # Update game state based on AI response
-                game_state.tension = ai_response.get('tension_level', game_state.tension)
-                game_state.trust = ai_response.get('trust_level', game_state.trust)
-                
-                # Update turn counter
-                game_state.turn += 1
-                
-                # Save the updated state
-                if request.user.is_authenticated:
-                    attempt.update_from_game_state(game_state)
-                    attempt.save()
-                else:
-                    guest_attempt['game_state'] = game_state.to_dict()
-                    request.session['guest_current_attempt'] = guest_attempt
-                    
-            except json.JSONDecodeError:
-                logger.error(f"Failed to parse AI response: {ai_response_data}")
-                messages.error(request, "An error occurred while processing your response.")
+            return choice
+    return None
+
+def _apply_ai_response(request, game_state, attempt, guest_attempt, ai_response_data):
+    """Update and persist the game state from the suspect's reply"""
+    try:
+        ai_response = json.loads(ai_response_data)
+    except json.JSONDecodeError:
+        logger.error("Failed to parse AI response: %.500s", ai_response_data)
+        messages.error(request, "An error occurred while processing your response.")
+        return
+    _update_game_state(request, game_state, attempt, guest_attempt, ai_response)
+
+def _update_game_state(request, game_state, attempt, guest_attempt, ai_response):
+    # Update game state based on AI response
+    game_state.tension = ai_response.get('tension_level', game_state.tension)
+    game_state.trust = ai_response.get('trust_level', game_state.trust)
+    
+    # Update turn counter
+    game_state.turn += 1
+    
+    # Save the updated state
+    if request.user.is_authenticated:
+        attempt.update_from_game_state(game_state)
+    else:
+        guest_attempt['game_state'] = encode_game_state(game_state)
+        finished = game_state.game_over or game_state.turn >= 10
+        guest_store.get_store().save(request.session, guest_attempt, finished=finished)
+
+def play(request):
+    active_game = _load_active_game(request)
+    if active_game is None:
+        messages.error(request, 'No active game found.')
+        return redirect('index')
+    game_state, attempt, guest_attempt = active_game
+    
+    # Check if game should be ended
+    if game_state.turn >= 10 or game_state.game_over:
+        return _finish_game(request, game_state, attempt)
+    
+    choice = _pending_choice(request, game_state)
+    if choice is not None:
+        ai_response_data = get_ai_response(game_state, choice)
+        _apply_ai_response(request, game_state, attempt, guest_attempt, ai_response_data)
+    
+    return redirect('game')
+
+async def play_async(request):
+    """``play`` for ASGI deployments: the Grok call is awaited instead of holding a worker thread"""
+    active_game = await sync_to_async(_load_active_game)(request)
+    if active_game is None:
+        messages.error(request, 'No active game found.')
+        return redirect('index')
+    game_state, attempt, guest_attempt = active_game
+    
+    if game_state.turn >= 10 or game_state.game_over:
+        return await sync_to_async(_finish_game)(request, game_state, attempt)
+    
+    choice = _pending_choice(request, game_state)
+    if choice is not None:
+        ai_response_data = await get_ai_response_async(game_state, choice)
+        await sync_to_async(_apply_ai_response)(request, game_state, attempt, guest_attempt, ai_response_data)
     
     return redirect('game')
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+def _commit_streamed_reply(request, game_state, attempt, guest_attempt, reply):
+    """Persist a fully streamed reply and return the state the page needs to refresh"""
+    _update_game_state(request, game_state, attempt, guest_attempt, build_ai_response(reply, game_state))
+    if guest_attempt is not None and request.session.modified:
+        # The session middleware has already saved by the time the stream ends
+        request.session.save()
+    return {
+        'tension': game_state.tension,
+        'trust': game_state.trust,
+        'turn': game_state.turn,
+        'hostages_remaining': game_state.hostages - game_state.hostages_released,
+        'hostages_released': game_state.hostages_released,
+        'game_over': game_state.game_over or game_state.turn >= 10,
+    }
+
+def _stream_reply(request, game_state, attempt, guest_attempt, choice):
+    chunks = []
+    reply = stream_ai_response(game_state, choice)
+    try:
+        for chunk in reply:
+            chunks.append(chunk)
+            yield _sse('token', {'text': chunk})
+    except GeneratorExit:
+        # The client went away mid-reply; read the rest so the turn is still saved
+        chunks.extend(reply)
+        _commit_streamed_reply(request, game_state, attempt, guest_attempt, ''.join(chunks))
+        raise
+    state = _commit_streamed_reply(request, game_state, attempt, guest_attempt, ''.join(chunks))
+    yield _sse('done', state)
+
+async def _finish_streamed_reply(request, game_state, attempt, guest_attempt, reply, chunks):
+    async for chunk in reply:
+        chunks.append(chunk)
+    return await sync_to_async(_commit_streamed_reply)(
+        request, game_state, attempt, guest_attempt, ''.join(chunks)
+    )
+
+async def _stream_reply_async(request, game_state, attempt, guest_attempt, choice):
+    chunks = []
+    reply = stream_ai_response_async(game_state, choice)
+    try:
+        async for chunk in reply:
+            chunks.append(chunk)
+            yield _sse('token', {'text': chunk})
+    except (GeneratorExit, asyncio.CancelledError):
+        # Closed or cancelled on disconnect; shielded so the turn is saved even if cancelled again
+        await asyncio.shield(_finish_streamed_reply(request, game_state, attempt, guest_attempt, reply, chunks))
+        raise
+    state = await _finish_streamed_reply(request, game_state, attempt, guest_attempt, reply, chunks)
+    yield _sse('done', state)
+
+@require_POST
+def play_stream(request):
+    """Streaming ``play``: the suspect's reply is sent token by token as server-sent events"""
+    active_game = _load_active_game(request)
+    if active_game is None:
+        return _sse_response([_sse('redirect', {'url': reverse('index')})])
+    game_state, attempt, guest_attempt = active_game
+    
+    if game_state.turn >= 10 or game_state.game_over:
+        finished = _finish_game(request, game_state, attempt)
+        return _sse_response([_sse('redirect', {'url': finished.url})])
+    
+    choice = _pending_choice(request, game_state)
+    if choice is None:
+        return _sse_response([_sse('redirect', {'url': reverse('game')})])
+    
+    # Under ASGI an async generator keeps the stream off the worker threads
+    stream = _stream_reply_async if settings.GROK_ASYNC_CLIENT else _stream_reply
+    return _sse_response(stream(request, game_state, attempt, guest_attempt, choice))
+
 def stats(request):
     user_stats = None
     if request.user.is_authenticated:
-        attempts = ScenarioAttempt.objects.filter(user=request.user)
         user_stats = {
-            'total_attempts': attempts.count(),
-            'successful_attempts': attempts.filter(success=True).count(),
-            'average_score': attempts.filter(final_score__isnull=False).aggregate(Avg('final_score'))['final_score__avg'],
+            **player_stats.get_player_stats(request.user),
             'current_streak': request.user.current_streak,
             'highest_streak': request.user.highest_streak
         }
     
     latest_score = request.session.get('latest_score')
-    daily_top_scores = Score.get_daily_top_scores()
-    all_time_top_scores = Score.get_all_time_top_scores()
+    daily_top_scores = leaderboard.daily_top_scores()
+    all_time_top_scores = leaderboard.all_time_top_scores()
     
     return render(request, 'game/stats.html', {
         'user_stats': user_stats,
@@ -347,6 +469,7 @@ def save_game_score(request, user_id, game_state):
             scenario_name=game_state.scenario.name,
             is_daily=True
         )
+        leaderboard.record_score(new_score)
         # Store latest score in session
         request.session['latest_score'] = {'score': score, 'scenario_name': game_state.scenario.name}
         return new_score
@@ -354,12 +477,27 @@ def save_game_score(request, user_id, game_state):
 
 @login_required
 def game_history(request):
-    attempts = ScenarioAttempt.objects.filter(
-        user=request.user
-    ).select_related('scenario').order_by('-start_time')
+    cursor = request.GET.get('before')
+    try:
+        attempts, next_cursor = attempt_history.page(request.user, cursor)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid history cursor')
     
     return render(request, 'game/history.html', {
-        'attempts': attempts
+        'attempts': attempts,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+    })
+
+@login_required
+def attempt_transcript(request, attempt_id):
+    """JSON transcript of one of the player's attempts, loaded on demand by the history page"""
+    transcript = attempt_history.transcript(request.user, attempt_id)
+    if transcript is None:
+        raise Http404('No such attempt')
+    return JsonResponse({
+        'id': attempt_id,
+        'messages': [{'sender': sender, 'text': text} for sender, text in transcript],
     })
 
 @login_required
@@ -367,3 +505,9 @@ def resume_game(request, attempt_id):
     attempt = get_object_or_404(ScenarioAttempt, id=attempt_id, user=request.user, end_time__isnull=True)
     request.session['current_attempt_id'] = attempt.id
     return redirect('game')
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; 404 while GAME_METRICS is disabled"""
+    if not metrics.enabled():
+        raise Http404('Metrics are disabled')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hostage_negotiator.settings')
+# Under ASGI the play view awaits the pooled async Grok client
+os.environ.setdefault('GROK_ASYNC_CLIENT', '1')
 
 application = get_asgi_application()
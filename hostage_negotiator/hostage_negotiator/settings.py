@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'game.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -128,3 +130,124 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 SESSION_COOKIE_AGE = 31 * 24 * 60 * 60  # 31 days
+
+# Seconds a process keeps its scenario registry before reloading it, so edits made in other
+# processes show up (see ScenarioManager.registry); None keeps it until a local save/delete
+SCENARIO_REGISTRY_TTL = 300
+
+# Precomputed solver policies that hints are served from; regenerate with
+# manage.py solve_scenarios --write whenever rules.py changes
+SOLVER_POLICY_FILE = BASE_DIR / 'game' / 'solver_policies.json'
+
+# Serve the play endpoint with the async Grok client; enabled by asgi.py
+GROK_ASYNC_CLIENT = os.getenv('GROK_ASYNC_CLIENT') == '1'
+
+# Suspect reply cache in front of the Grok API (see game/response_cache.py)
+GROK_RESPONSE_CACHE = {
+    'BACKEND': os.getenv('GROK_RESPONSE_CACHE_BACKEND', 'local'),
+    'TTL': 600,
+    'MAX_ENTRIES': 1000,
+    'CACHE_ALIAS': 'default',
+    'EXCLUDED_SCENARIOS': [],
+}
+
+# Circuit breaker and adaptive timeout around the Grok API. State lives in CACHE_ALIAS: shared by all
+# workers on Redis or Memcached, per process on the default local-memory cache (see game/circuit_breaker.py)
+GROK_CIRCUIT_BREAKER = {
+    'ENABLED': os.getenv('GROK_CIRCUIT_BREAKER', '1') == '1',
+    'CACHE_ALIAS': 'default',
+    'WINDOW_SECONDS': 60,
+    'MIN_CALLS': 10,
+    'ERROR_THRESHOLD': 0.5,
+    'OPEN_SECONDS': 30,
+    'MIN_TIMEOUT': 2.0,
+}
+
+# Deployment-wide cap on Grok requests per second, shared through the cache; enabling it requires a
+# CACHE_ALIAS shared by all workers (Redis or Memcached), not the local-memory default (see game/flow_control.py)
+GROK_RATE_LIMIT = {
+    'REQUESTS_PER_SECOND': int(os.getenv('GROK_MAX_REQUESTS_PER_SECOND', '0')) or None,
+    'CACHE_ALIAS': 'default',
+}
+
+# Bounded conversation history sent to Grok each turn (see game/context_window.py)
+GROK_CONTEXT_WINDOW = {
+    'ENABLED': True,
+    'RECENT_EXCHANGES': 3,
+    'TOKEN_BUDGET': 400,
+    'SUMMARY_MAX_TOKENS': 160,
+}
+
+# Encoding of guest games stored in the session (see game/session_codec.py)
+GUEST_SESSION_CODEC = {
+    'COMPRESS_MIN_BYTES': 512,
+    'COMPRESS_LEVEL': 6,
+    'MAX_BYTES': 32768,
+}
+
+# Where guest games live between turns: 'session', or 'cached_db' to keep them in the cache, written
+# behind to the database. cached_db is refused at startup unless CACHE_ALIAS is shared by all workers
+# (Redis or Memcached); the default local-memory cache isn't (see game/guest_store.py)
+GUEST_GAME_STORE = {
+    'BACKEND': os.getenv('GUEST_GAME_STORE', 'session'),
+    'CACHE_ALIAS': 'default',
+    'TTL': 2 * 60 * 60,
+    'FLUSH_SECONDS': 30,
+}
+
+# Materialized top-score boards (see game/leaderboard.py)
+LEADERBOARD = {
+    'SIZE': 10,
+    'CACHE_TIMEOUT': 300,
+}
+
+# Per-user rolling score statistics (see game/score_stats.py); averages fall back to Avg() when disabled
+SCORE_STATS = {
+    'ENABLED': True,
+}
+
+# Cached per-user dashboard on the stats page (see game/player_stats.py)
+PLAYER_STATS = {
+    'CACHE_TIMEOUT': 300,
+    'TREND_WEEKS': 8,
+}
+
+# Keyset-paginated history page (see game/attempt_history.py)
+GAME_HISTORY = {
+    'PAGE_SIZE': 20,
+}
+
+# Timing spans, counters and the /metrics endpoint (see game/metrics.py)
+GAME_METRICS = {
+    'ENABLED': os.getenv('GAME_METRICS') == '1',
+    'LOG_REQUESTS': True,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'verbose': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        # Formats and writes on a background thread so log I/O never blocks a worker
+        'queue': {
+            'class': 'game.logs.QueueingStreamHandler',
+            'formatter': 'verbose',
+        },
+    },
+    'loggers': {
+        'game': {
+            'handlers': ['queue'],
+            'level': os.getenv('GAME_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Payload dumps in the Grok client are logged at DEBUG for this fraction of calls (see game/logs.py)
+GAME_LOGGING = {
+    'PAYLOAD_SAMPLE_RATE': float(os.getenv('GAME_LOG_PAYLOAD_SAMPLE_RATE', '0.01')),
+}